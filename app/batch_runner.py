@@ -0,0 +1,500 @@
+""" A module to crawl several sites in one run, sharing connections, politeness, image cache and worker threads. """
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+from concurrent.futures import Future
+from crawl_executor import CrawlExecutor
+from crawl_state import CrawlStateStore
+from checkpoint_journal import CheckpointJournal
+from dom_extractor import DEFAULT_BACKEND
+from duplicate_analyzer import REPORT_FIELDNAMES
+from extracted_information_assembler import ExtractedInformationAssembler, FIELDNAMES
+from http_transport import HTTPTransport
+from image_cache import ImageMetadataCache
+from image_probe import ImageProber
+from metrics import Metrics
+from output_sinks import create_sink
+from request_scheduler import RequestScheduler
+import argparse
+import toml
+
+
+class FairWorkerPool:
+    """
+    A pool of threads shared by several sites. The tasks of every site wait in their own queue and a free thread
+    takes the next task of the next site in turn (round robin), so every site with work gets its share of the
+    threads and a huge site cannot starve a small one. A site never runs more than its own limit of tasks at once.
+    Tasks are submitted with the host they request. A task whose host is saturated stays queued and the thread
+    takes a task of another host or site instead of blocking on the host: a host is saturated when it runs the
+    per-host limit of its site, the per-host limit of the pool, or the concurrency the scheduler currently allows.
+
+    Attributes:
+        max_workers (int): Number of threads.
+        max_workers_per_host (int): Maximum number of concurrent tasks per host over all sites, None for no limit.
+        host_capacity (callable): Returns the current concurrency limit of a host or None, e.g. RequestScheduler.capacity.
+
+    Methods:
+        add_site(site, max_workers=None, max_workers_per_host=None): Registers a site with its limits of concurrent tasks.
+        submit(site, function, *args, host=None): Queues a task of a site and returns its Future.
+        stats(): Returns the queued, running and completed tasks per site.
+        shutdown(): Stops the threads once all queued tasks are done.
+    """
+
+    # seconds between two looks at queued tasks of saturated hosts, e.g. while a host is paused after a 429
+    poll_interval = 0.05
+
+    def __init__(self, max_workers, max_workers_per_host=None, host_capacity=None):
+        """
+        Initializes the FairWorkerPool and starts its threads.
+
+        Args:
+            max_workers (int): Number of threads.
+            max_workers_per_host (int, optional): Maximum number of concurrent tasks per host over all sites.
+                                                  Defaults to None (no limit).
+            host_capacity (callable, optional): Returns the current concurrency limit of a host, None for no limit.
+                                                Defaults to None.
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_workers_per_host = max_workers_per_host
+        self.host_capacity = host_capacity
+        self._queues = {}
+        self._limits = {}
+        self._host_limits = {}
+        self._running = {}
+        self._running_by_host = {}
+        self._running_by_site_host = {}
+        self._completed = {}
+        self._order = deque()
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.max_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def add_site(self, site, max_workers=None, max_workers_per_host=None):
+        """
+        Registers a site.
+
+        Args:
+            site (str): The name of the site.
+            max_workers (int, optional): Maximum number of concurrent tasks of the site. Defaults to all threads.
+            max_workers_per_host (int, optional): Maximum number of concurrent tasks of the site per host.
+                                                  Defaults to None (no limit).
+        """
+        with self._condition:
+            if site not in self._queues:
+                self._queues[site] = deque()
+                self._running[site] = 0
+                self._completed[site] = 0
+                self._order.append(site)
+            self._limits[site] = max_workers or self.max_workers
+            self._host_limits[site] = max_workers_per_host
+
+    def submit(self, site, function, *args, host=None):
+        """
+        Queues a task of a site.
+
+        Args:
+            site (str): The name of the site, registered with add_site.
+            function (callable): The task.
+            *args: The arguments of the task.
+            host (str, optional): The host the task requests, for the per-host limits. Defaults to None (no limit).
+
+        Returns:
+            Future: The result of the task.
+        """
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot submit after shutdown")
+            self._queues[site].append((host, future, function, args))
+            self._condition.notify()
+        return future
+
+    def _host_is_free(self, site, host):
+        """
+        Whether a task of the site may start on the host. Must be called with the condition held.
+        """
+        if host is None:
+            return True
+        limits = [self._host_limits[site], self.max_workers_per_host,
+                  self.host_capacity(host) if self.host_capacity is not None else None]
+        if limits[0] is not None and self._running_by_site_host.get((site, host), 0) >= limits[0]:
+            return False
+        running = self._running_by_host.get(host, 0)
+        return all(running < limit for limit in limits[1:] if limit is not None)
+
+    def _next_task(self):
+        """
+        Returns the next task in round robin order over the sites below their limit whose host is not saturated,
+        None if there is none. Must be called with the condition held.
+        """
+        for _ in range(len(self._order)):
+            site = self._order[0]
+            self._order.rotate(-1)
+            queue = self._queues[site]
+            if not queue or self._running[site] >= self._limits[site]:
+                continue
+            # the hosts of a site are checked once, the oldest task of a free host is taken
+            checked = set()
+            for index, (host, future, function, args) in enumerate(queue):
+                if host in checked:
+                    continue
+                if self._host_is_free(site, host):
+                    del queue[index]
+                    self._running[site] += 1
+                    if host is not None:
+                        self._running_by_host[host] = self._running_by_host.get(host, 0) + 1
+                        self._running_by_site_host[site, host] = self._running_by_site_host.get((site, host), 0) + 1
+                    return site, host, future, function, args
+                checked.add(host)
+        return None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                task = self._next_task()
+                while task is None:
+                    if self._shutdown and not any(self._queues.values()):
+                        return
+                    # queued tasks of saturated hosts are looked at again, the scheduler may allow more by now
+                    self._condition.wait(self.poll_interval if any(self._queues.values()) else None)
+                    task = self._next_task()
+            site, host, future, function, args = task
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+            with self._condition:
+                self._running[site] -= 1
+                self._completed[site] += 1
+                if host is not None:
+                    self._running_by_host[host] -= 1
+                    self._running_by_site_host[site, host] -= 1
+                # a task of this site or host may have waited for its limit
+                self._condition.notify_all()
+
+    def stats(self):
+        """
+        Returns the tasks per site.
+
+        Returns:
+            dict: Per site the number of queued, running and completed tasks.
+        """
+        with self._condition:
+            return {site: {"queued": len(self._queues[site]), "running": self._running[site], "completed": self._completed[site]}
+                    for site in self._order}
+
+    def shutdown(self):
+        """
+        Stops the threads once all queued tasks are done.
+        """
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+
+class SiteExecutor(CrawlExecutor):
+    """
+    The CrawlExecutor of one site of a batch: the URLs of the site are extracted by the threads of a shared
+    FairWorkerPool, at most max_workers at once and max_workers_per_host per host. The pool keeps the tasks of a
+    saturated host queued, so no shared thread waits for a host slot. Results are returned in input order like
+    with CrawlExecutor.
+
+    Attributes:
+        pool (FairWorkerPool): The threads shared by all sites.
+        site (str): The name of the site.
+    """
+
+    def __init__(self, pool, site, max_workers=1, max_workers_per_host=None):
+        """
+        Initializes the SiteExecutor and registers the site in the pool.
+
+        Args:
+            pool (FairWorkerPool): The threads shared by all sites.
+            site (str): The name of the site.
+            max_workers (int): Maximum number of concurrent tasks of the site. Defaults to 1.
+            max_workers_per_host (int, optional): Maximum number of concurrent tasks per host. Defaults to None (no limit).
+        """
+        super().__init__(max_workers, max_workers_per_host)
+        self.pool = pool
+        self.site = site
+        pool.add_site(site, self.max_workers, max_workers_per_host)
+
+    def map(self, function, urls):
+        """
+        Applies the function to every URL on the shared threads and yields the results in input order.
+        At most 2 * max_workers URLs of the site are queued or running.
+
+        Args:
+            function (callable): The function to apply to each URL.
+            urls (iterable of str): The URLs to process.
+
+        Yields:
+            tuple: (url, result, error) for every URL, error is None if the function succeeded.
+        """
+        window = 2 * self.max_workers
+        pending = deque()
+        for url in urls:
+            pending.append(self.pool.submit(self.site, self._run, function, url, host=urlsplit(url).netloc))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        for future in pending:
+            yield future.result()
+
+
+# the files every site writes, as (section, key, enabled); a file of a disabled section is not opened
+SITE_FILES = (
+    ("Output", "path", None),
+    ("Output", "duplicates_path", None),
+    ("Incremental", "state_path", "enabled"),
+    ("Checkpoint", "path", "enabled"),
+)
+
+def check_site_files(sites):
+    """
+    Checks that no two sites of a batch write the same file, the sites run at the same time
+    and would overwrite each other's output, state and checkpoint.
+
+    Args:
+        sites (dict): The configuration of every site by name.
+
+    Raises:
+        ValueError: If a file is written by two sites or twice by one site.
+    """
+    owners = {}
+    for name, config in sites.items():
+        for section, key, enabled in SITE_FILES:
+            if enabled is not None and not config[section][enabled]:
+                continue
+            path = os.path.abspath(config[section][key])
+            if path in owners:
+                raise ValueError(f"{name} [{section}] {key} and {owners[path]} both write {path}, "
+                                 f"give every site its own files.")
+            owners[path] = f"{name} [{section}] {key}"
+
+
+class BatchRunner:
+    """
+    A class to crawl several sites at the same time, each described by a configuration like config_eak.toml
+    with its sitemap, [Rules], crawl limits, output, incremental state and checkpoint.
+    All sites share one HTTP transport with its connection pools and request scheduler, one image prober with
+    its metadata cache and one FairWorkerPool, so the connections, the robots.txt and the image metadata of a
+    host are reused across sites and the politeness limits of a host hold for all sites together. Equal rule sets
+    are compiled once. Every site writes its own output and duplicates report.
+    The AI analysis, the embeddings, the HTML archive and the distributed crawl are not run for the sites of a
+    batch, they need main.py.
+
+    Attributes:
+        sites (dict): The configuration of every site by name.
+        pool (FairWorkerPool): The threads shared by all sites.
+        transport (HTTPTransport): The HTTP transport shared by all sites.
+        image_prober (ImageProber): The image prober shared by all sites.
+        metrics (Metrics): Measures the requests of all sites.
+        assemblers (dict): The ExtractedInformationAssembler of every site by name, after run().
+        results (dict): Pages, failed pages, seconds and error of every site by name, after run().
+
+    Methods:
+        run(resume=False): Crawls all sites at the same time and returns the results per site.
+        close(): Closes the shared transport and image cache.
+    """
+
+    def __init__(self, sites, max_workers=16, transport=None, image_prober=None, metrics=None, max_workers_per_host=None):
+        """
+        Initializes the BatchRunner.
+
+        Args:
+            sites (dict): The configuration of every site by name, as loaded from its TOML file.
+            max_workers (int): Number of threads shared by all sites. Defaults to 16.
+            transport (HTTPTransport, optional): The shared HTTP transport. Defaults to a new HTTPTransport.
+            image_prober (ImageProber, optional): The shared image prober. Defaults to an ImageProber on the transport.
+            metrics (Metrics, optional): Measures the requests of all sites. Defaults to the Metrics of the transport.
+            max_workers_per_host (int, optional): Maximum number of concurrent pages per host over all sites.
+                                                  Defaults to None (no limit).
+        """
+        check_site_files(sites)
+        self.sites = sites
+        self.metrics = metrics or (transport.metrics if transport is not None else Metrics())
+        self.transport = transport or HTTPTransport(pool_maxsize=max_workers, metrics=self.metrics)
+        self.image_prober = image_prober or ImageProber(self.transport)
+        scheduler = getattr(self.transport, 'scheduler', None)
+        # the threads skip the hosts the scheduler holds back instead of waiting for them
+        self.pool = FairWorkerPool(max_workers, max_workers_per_host,
+                                   host_capacity=scheduler.capacity if scheduler is not None else None)
+        self.assemblers = {}
+        self.results = {}
+        self._closeables = {}
+
+    def _build_site(self, name, config):
+        """
+        Builds the ExtractedInformationAssembler of a site on the shared components.
+
+        Args:
+            name (str): The name of the site.
+            config (dict): The configuration of the site.
+
+        Returns:
+            ExtractedInformationAssembler: The assembler of the site.
+        """
+        if config.get("AI", {}).get("enabled") or config.get("Embeddings", {}).get("enabled"):
+            print(f"{name}: the AI analysis and the embeddings are not run in a batch, use main.py for them.")
+        crawl = config["Crawl"]
+        sink = create_sink(config["Output"]["path"], FIELDNAMES, batch_size=config["Output"]["batch_size"] or None)
+        state_store = CrawlStateStore(config["Incremental"]["state_path"]) if config["Incremental"]["enabled"] else None
+        journal = CheckpointJournal(config["Checkpoint"]["path"]) if config["Checkpoint"]["enabled"] else None
+        self._closeables[name] = [closeable for closeable in (sink, state_store, journal) if closeable is not None]
+        return ExtractedInformationAssembler(
+            sitemap_url=config["Sitemap"]["url"],
+            rules_for_url=config["Rules"]["url"],
+            rules_for_thema_by_url=config["Rules"]["thema_by_url"],
+            rules_for_content=config["Rules"]["content"],
+            filter_urls_by=config["Rules"]["filter"],
+            content_class=config["Rules"]["content_class"],
+            prompts_to_process={},
+            sitemap_url_k=config["Sitemap"]["k"],
+            transport=self.transport,
+            image_prober=self.image_prober,
+            crawl_executor=SiteExecutor(self.pool, name, crawl["max_workers"], crawl["max_workers_per_host"]),
+            parser_backend=crawl.get("parser", DEFAULT_BACKEND),
+            state_store=state_store,
+            sink=sink,
+            # rows are only written to the sink, the duplicate checks do not need them in memory
+            keep_rows=False,
+            journal=journal,
+        )
+
+    def _run_site(self, name, started, resume):
+        """
+        Crawls one site and writes its output and its duplicates report.
+        """
+        config = self.sites[name]
+        assembler = self.assemblers[name]
+        try:
+            assembler.extract_information(resume=resume)
+            with create_sink(config["Output"]["duplicates_path"], REPORT_FIELDNAMES) as duplicates_sink:
+                assembler.duplicate_analyzer.write_report(duplicates_sink)
+            error = None
+        except Exception as e:
+            print(f"{name}: an error occurred during data extraction: {e}")
+            error = str(e)
+        finally:
+            for closeable in self._closeables[name]:
+                closeable.close()
+        counters = assembler.metrics.to_dict()["counters"]
+        self.results[name] = {
+            "pages": counters.get("pages", 0),
+            "failed": counters.get("failed_pages", 0),
+            "seconds": round(time.perf_counter() - started, 3),
+            "error": error,
+        }
+
+    def run(self, resume=False):
+        """
+        Crawls all sites at the same time, one thread per site feeding the shared worker pool.
+
+        Args:
+            resume (bool): Whether to resume the checkpointed run of every site. Defaults to False.
+
+        Returns:
+            dict: Per site the extracted and failed pages, the seconds until the site was done and the error, if any.
+        """
+        for name, config in self.sites.items():
+            self.assemblers[name] = self._build_site(name, config)
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._run_site, args=(name, started, resume)) for name in self.sites]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.pool.shutdown()
+        for name, result in self.results.items():
+            print(f"Site {name}: {result['pages']} pages, {result['failed']} failed, done after {result['seconds']}s"
+                  + (f", error: {result['error']}" if result['error'] else "."))
+        return self.results
+
+    def close(self):
+        """
+        Closes the shared transport and the metadata cache of the shared image prober.
+        """
+        self.transport.close()
+        if self.image_prober.cache is not None:
+            self.image_prober.cache.close()
+
+
+def load_batch(path):
+    """
+    Creates a BatchRunner from a batch configuration like config_batch.toml: the site configurations,
+    the shared threads, and the HTTP, politeness and image settings shared by all sites.
+
+    Args:
+        path (str): Path of the batch configuration. Site configurations, the files they write and the
+                    image cache are relative to its folder.
+
+    Returns:
+        BatchRunner: The runner of the batch.
+
+    Raises:
+        ValueError: If two sites write the same file.
+    """
+    config = toml.load(path)
+    batch = config["Batch"]
+    folder = os.path.dirname(os.path.abspath(path))
+    sites = {}
+    for site_path in batch["sites"]:
+        site = toml.load(os.path.join(folder, site_path))
+        for section, key, _ in SITE_FILES:
+            site[section][key] = os.path.join(folder, site[section][key])
+        sites[os.path.splitext(os.path.basename(site_path))[0]] = site
+    metrics = Metrics()
+    scheduler = None
+    if config["Politeness"]["enabled"]:
+        scheduler = RequestScheduler(
+            user_agent=config["Politeness"]["user_agent"],
+            respect_robots=config["Politeness"]["respect_robots"],
+            requests_per_second=config["Politeness"]["requests_per_second"] or None,
+            initial_concurrency=config["Politeness"]["initial_concurrency_per_host"],
+            max_concurrency=batch["max_workers_per_host"] or batch["max_workers"],
+            latency_factor=config["Politeness"]["latency_factor"],
+        )
+    transport = HTTPTransport(
+        timeout=(config["HTTP"]["connect_timeout"], config["HTTP"]["read_timeout"]),
+        retries=config["HTTP"]["retries"],
+        backoff_factor=config["HTTP"]["backoff_factor"],
+        pool_maxsize=max(config["HTTP"]["pool_maxsize"], batch["max_workers"]),
+        user_agent=config["Politeness"]["user_agent"],
+        metrics=metrics,
+        scheduler=scheduler,
+    )
+    image_cache = ImageMetadataCache(
+        max_entries=config["ImageCache"]["max_entries"],
+        path=os.path.join(folder, config["ImageCache"]["path"]) if config["ImageCache"]["path"] else None,
+        revalidate_after=config["ImageCache"]["revalidate_after"] or None,
+    )
+    image_prober = ImageProber(
+        transport,
+        probe_bytes=config["Images"]["probe_bytes"],
+        probe_headers=config["Images"]["probe_headers"],
+        cache=image_cache,
+    )
+    return BatchRunner(sites, max_workers=batch["max_workers"], transport=transport, image_prober=image_prober, metrics=metrics,
+                       max_workers_per_host=batch["max_workers_per_host"] or None)
+
+
+# Example usage
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Crawls the sites of a batch configuration at the same time.")
+    argument_parser.add_argument("config", nargs="?", default="config_batch.toml", help="The batch configuration.")
+    argument_parser.add_argument("--resume", action="store_true", help="Resume the checkpointed run of every site.")
+    args = argument_parser.parse_args()
+
+    runner = load_batch(args.config)
+    try:
+        runner.run(resume=args.resume)
+    finally:
+        runner.metrics.print_summary()
+        runner.close()
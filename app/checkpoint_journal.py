@@ -0,0 +1,151 @@
+""" A module to checkpoint long extraction runs, so that they can be resumed after a crash. """
+import json
+import sqlite3
+import threading
+import time
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+class CheckpointJournal:
+    """
+    A SQLite journal of the status and the finished row of every URL of an extraction run.
+
+    Every finished row is committed right away, so after a crash or a restart the run can be
+    resumed: completed URLs replay their row from the journal, failed and pending URLs are
+    extracted again. Rows are read back one at a time, the memory does not grow with the run.
+
+    Attributes:
+        path (str): Path of the SQLite file.
+
+    Methods:
+        start(urls, resume=False): Starts a new run or resumes the journaled one.
+        get_row(url): Returns the finished row of a URL, or None.
+        mark_done(url, row): Records the finished row of a URL.
+        mark_failed(url, error): Records the failure of a URL.
+        counts(): Returns the number of URLs per status.
+        close(): Closes the SQLite file.
+    """
+
+    def __init__(self, path):
+        """
+        Initializes the CheckpointJournal and creates the SQLite file if needed.
+
+        Args:
+            path (str): Path of the SQLite file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL keeps committed rows safe on a crash without a full sync per row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoint ("
+            "url TEXT PRIMARY KEY, position INTEGER, status TEXT, row TEXT, error TEXT, updated_at REAL)"
+        )
+        self._db.commit()
+
+    def start(self, urls, resume=False):
+        """
+        Starts a new run, or resumes the journaled run.
+        A new run forgets the journal. A resumed run keeps the finished rows and adds URLs not journaled yet
+        as pending, URLs no longer in the sitemap are dropped.
+
+        Args:
+            urls (list of str): The URLs of the run, in output order.
+            resume (bool): Whether to keep the rows of the journaled run. Defaults to False.
+
+        Returns:
+            int: Number of URLs already done.
+        """
+        with self._lock:
+            if not resume:
+                self._db.execute("DELETE FROM checkpoint")
+            self._db.execute("CREATE TEMP TABLE IF NOT EXISTS run_urls (url TEXT PRIMARY KEY, position INTEGER)")
+            self._db.execute("DELETE FROM run_urls")
+            self._db.executemany("INSERT OR IGNORE INTO run_urls VALUES (?, ?)", ((url, position) for position, url in enumerate(urls)))
+            self._db.execute("DELETE FROM checkpoint WHERE url NOT IN (SELECT url FROM run_urls)")
+            self._db.execute(
+                "INSERT OR IGNORE INTO checkpoint (url, position, status, updated_at) "
+                "SELECT url, position, ?, ? FROM run_urls", (PENDING, time.time())
+            )
+            self._db.execute("UPDATE checkpoint SET position = (SELECT position FROM run_urls WHERE run_urls.url = checkpoint.url)")
+            self._db.execute("DROP TABLE run_urls")
+            self._db.commit()
+            return self._db.execute("SELECT COUNT(*) FROM checkpoint WHERE status = ?", (DONE,)).fetchone()[0]
+
+    def get_row(self, url):
+        """
+        Returns the finished row of a URL.
+
+        Args:
+            url (str): The URL.
+
+        Returns:
+            dict: The row, or None if the URL is not done.
+        """
+        with self._lock:
+            result = self._db.execute("SELECT row FROM checkpoint WHERE url = ? AND status = ?", (url, DONE)).fetchone()
+        return json.loads(result[0]) if result else None
+
+    def mark_done(self, url, row):
+        """
+        Records the finished row of a URL.
+
+        Args:
+            url (str): The URL.
+            row (dict): The extracted information of the page.
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE checkpoint SET status = ?, row = ?, error = NULL, updated_at = ? WHERE url = ?",
+                (DONE, json.dumps(row, ensure_ascii=False), time.time(), url),
+            )
+            self._db.commit()
+
+    def mark_failed(self, url, error):
+        """
+        Records the failure of a URL, it is extracted again on resume.
+
+        Args:
+            url (str): The URL.
+            error (str): The error message.
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE checkpoint SET status = ?, row = NULL, error = ?, updated_at = ? WHERE url = ?",
+                (FAILED, error, time.time(), url),
+            )
+            self._db.commit()
+
+    def counts(self):
+        """
+        Returns the number of URLs per status.
+
+        Returns:
+            dict: A dictionary mapping 'pending', 'done' and 'failed' to their number of URLs.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM checkpoint GROUP BY status").fetchall()
+        counts = {PENDING: 0, DONE: 0, FAILED: 0}
+        counts.update(rows)
+        return counts
+
+    def close(self):
+        """
+        Closes the SQLite file.
+        """
+        self._db.close()
+
+
+# Example usage
+if __name__ == "__main__":
+    journal = CheckpointJournal(':memory:')
+    urls = ['https://www.eak.admin.ch/eak/de/home.html', 'https://www.eak.admin.ch/eak/de/home/Firmen.html']
+    journal.start(urls)
+    journal.mark_done(urls[0], {"URL": urls[0], "Page Title": "Startseite"})
+    journal.mark_failed(urls[1], "Failed to retrieve HTML content")
+    print(journal.start(urls, resume=True), journal.counts())
+    print(journal.get_row(urls[0]), journal.get_row(urls[1]))
@@ -1,7 +1,7 @@
-import requests
-from bs4 import BeautifulSoup
-from PIL import Image
-from io import BytesIO
+from dom_extractor import DOMExtractor, ExtractedDOM
+from http_transport import HTTPTransport
+from image_probe import ImageProber
+from keyword_matcher import compiled_matcher
 
 class ContentAnalyzer:
     """
@@ -10,18 +10,42 @@ class ContentAnalyzer:
     Methods:
         analyze_content(content): Analyzes the content based on predefined rules or keywords.
         analyze_url(url): Analyzes the URL based on predefined rules or keywords.
+        analyze_content_counts(content): Counts the keyword occurrences per rule in the content.
+        analyze_content_positions(content): Returns the position of every keyword occurrence in the content.
+        analyze_contents(contents): Analyzes many contents at once, e.g. a whole column of a CSV file.
     """
 
-    def __init__(self, keywords_rules=None, default_keyword="Sonstiges"):
+    def __init__(self, keywords_rules=None, default_keyword="Sonstiges", transport=None, image_prober=None):
         """
         Initializes the ContentAnalyzer with specific keywords and rules.
 
         Args:
             keywords_rules (dict): A dictionary mapping keywords to their respective rules.
             default_keyword (str): Default keyword to return if no rules match.
+            transport (HTTPTransport, optional): The HTTP transport used to fetch images. Defaults to a new HTTPTransport.
+            image_prober (ImageProber, optional): Determines image dimensions. Defaults to an ImageProber on the transport.
         """
         self.keywords_rules = {k: [word.lower() for word in v] for k, v in keywords_rules.items()}
+        self.keyword_matcher = compiled_matcher(self.keywords_rules)
         self.default_keyword = default_keyword
+        self.dom_extractor = DOMExtractor()
+        self.transport = transport or HTTPTransport()
+        self.image_prober = image_prober or ImageProber(self.transport)
+
+    def _as_dom(self, html_content):
+        """
+        Returns the extracted document for the given html_content.
+        An already extracted document is returned as is, so one page is parsed only once.
+
+        Args:
+            html_content (str or ExtractedDOM): The raw HTML content or an already extracted document.
+
+        Returns:
+            ExtractedDOM: The extracted document.
+        """
+        if isinstance(html_content, ExtractedDOM):
+            return html_content
+        return self.dom_extractor.extract(html_content)
 
     def _analyze(self, text):
         """
@@ -33,8 +57,7 @@ class ContentAnalyzer:
         Returns:
             list of str: A list of matched predefined keywords, otherwise a list with default_keyword.
         """
-        text = text.lower()
-        matched_keywords = [keyword for keyword, contain_words in self.keywords_rules.items() if any(word in text for word in contain_words)]
+        matched_keywords = self.keyword_matcher.match_rules(text)
 
         return matched_keywords if matched_keywords else [self.default_keyword]
 
@@ -50,6 +73,44 @@ class ContentAnalyzer:
         """
         return self._analyze(content)
 
+    def analyze_contents(self, contents):
+        """
+        Analyzes many contents at once, with the same result as analyze_content for each of them.
+
+        Args:
+            contents (list of str): The contents to be analyzed.
+
+        Returns:
+            list of list of str: The matched predefined keywords of every content, otherwise a list with default_keyword.
+        """
+        rules = list(self.keywords_rules)
+        matches = self.keyword_matcher.match_matrix(contents)
+        return [[rules[j] for j in row.nonzero()[0]] or [self.default_keyword] for row in matches]
+
+    def analyze_content_counts(self, content):
+        """
+        Counts how often the keywords of every rule occur in the given content.
+
+        Args:
+            content (str): The content to be analyzed.
+
+        Returns:
+            dict: A dictionary mapping every rule to its number of keyword occurrences.
+        """
+        return self.keyword_matcher.count_rules(content)
+
+    def analyze_content_positions(self, content):
+        """
+        Returns every keyword occurrence in the given content.
+
+        Args:
+            content (str): The content to be analyzed.
+
+        Returns:
+            list of tuple: (position, keyword) of every occurrence, ordered by position.
+        """
+        return self.keyword_matcher.find_all(content)
+
     def analyze_url(self, url):
         """
         Analyzes the given URL based on predefined keywords and rules.
@@ -85,15 +146,14 @@ class ContentAnalyzer:
         # @TODO: Add URL's and domain to the toml file!
 
         Args:
-            html_content (str): The HTML content to be analyzed.
+            html_content (str or ExtractedDOM): The HTML content or the already extracted document to be analyzed.
             excluded_urls (list): A list of URLs to be excluded.
 
         Returns:
             list: A list of image URLs found in the HTML content, excluding the specified URLs.
         """
-        soup = BeautifulSoup(html_content, 'html.parser')
-        img_tags = soup.find_all("img")
-        img_urls = ['https://www.eak.admin.ch'+img['src'] for img in img_tags if 'src' in img.attrs and img['src'] not in excluded_image_urls]
+        dom = self._as_dom(html_content)
+        img_urls = ['https://www.eak.admin.ch'+src for src in dom.img_srcs if src not in excluded_image_urls]
         if len(img_urls) == 0:
             return None
         return img_urls
@@ -102,6 +162,8 @@ class ContentAnalyzer:
         """
         Returns true if at least one image has a width less than 1920 pixels, otherwise false.
         If no image is found, returns false.
+        The width is read from the first bytes of the image, see ImageProber.
+        Cached widths are checked first, so a cached image below 1920 pixels answers without network access.
 
         Args:
             list_of_image_urls (list): A list of URLs of images to be analyzed.
@@ -111,15 +173,20 @@ class ContentAnalyzer:
         """
         if list_of_image_urls == None:
                 return False
-        
+
+        # Bilder, deren Breite schon im Cache ist, brauchen keinen Netzwerkzugriff
+        cached_sizes = {url: self.image_prober.get_cached_size(url) for url in list_of_image_urls}
+        if any(size is not None and size[0] < 1920 for size in cached_sizes.values()):
+            return True
+
         for url in list_of_image_urls:
+            if cached_sizes[url] is not None:
+                continue
             
             try:
-                response = requests.get(url)
-                response.raise_for_status()  # Sicherstellen, dass die Anfrage erfolgreich war
-
-                image = Image.open(BytesIO(response.content))
-                if image.size[0] < 1920:  # image.size[0] gibt die Breite des Bildes an
+                # Breite aus den ersten Bytes des Bildes, nur falls nötig aus dem ganzen Bild
+                width, height, image_format = self.image_prober.get_image_size(url)
+                if width < 1920:
                     return True
             except Exception as e:
                 print(f"Ein Fehler ist aufgetreten beim Verarbeiten der URL {url}: {e}")
@@ -132,13 +199,12 @@ class ContentAnalyzer:
         Analyzes the given html_content to see if in it is an iframe.
 
         Args:
-            content (str): The html_content to be analyzed.
+            html_content (str or ExtractedDOM): The HTML content or the already extracted document to be analyzed.
 
         Returns:
-            bool: True if the soup object is an iframe, otherwise False.
+            bool: True if the html_content contains an iframe, otherwise False.
         """
-        soup = BeautifulSoup(html_content, 'html.parser')
-        return soup.find("iframe") is not None
+        return len(self._as_dom(html_content).iframe_srcs) > 0
 
     def analyze_html_content_if_video(self, html_content):
         """
@@ -147,15 +213,14 @@ class ContentAnalyzer:
         If it does, it checks if the iframe contains a url with the word "vimeo" or "youtube" in it.
 
         Args:
-            content (str): The html_content to be analyzed.
+            html_content (str or ExtractedDOM): The HTML content or the already extracted document to be analyzed.
 
         Returns:
-            bool: True if the soup object is a video, otherwise False.
+            bool: True if the first iframe is a video, otherwise False.
         """
-        soup = BeautifulSoup(html_content, 'html.parser')
-        iframe = soup.find("iframe")
-        if iframe is not None:
-            url = iframe['src']
+        iframe_srcs = self._as_dom(html_content).iframe_srcs
+        if iframe_srcs:
+            url = iframe_srcs[0]
             return "vimeo" in url or "youtube" in url
         return False
 
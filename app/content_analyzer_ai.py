@@ -1,89 +1,384 @@
 from dotenv import load_dotenv
 import os
-from haystack import Pipeline
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+from haystack import Pipeline, Document, component
 from haystack.components.fetchers import LinkContentFetcher
 from haystack.components.converters import HTMLToDocument
 from haystack.components.preprocessors import DocumentCleaner
-from haystack import Pipeline
 from haystack.components.generators import OpenAIGenerator
 from haystack.components.builders.answer_builder import AnswerBuilder
 from haystack.components.builders.prompt_builder import PromptBuilder
-from haystack.pipeline_utils import build_rag_pipeline, build_indexing_pipeline
-from haystack.pipeline_utils.indexing import download_files
+from llm_cache import cache_key
+from token_budget import TokenCounter, PromptBatcher, CONTEXT_WINDOWS, DEFAULT_CONTEXT_WINDOW, split_into_chunks, pack
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
+PROMPT_TEMPLATE = """
+    Given these documents, answer the question.\nDocuments:
+    {% for doc in documents %}
+    {{ doc.content }}
+    {% endfor %}
+
+    \nQuestion: {{query}}
+    \nAnswer:
+    """
+
+# combines the answers for the chunks of a page that does not fit into one request
+REDUCE_TEMPLATE = """
+    These are answers to the question for consecutive parts of one document.
+    Combine them into one answer to the question for the whole document.\nPartial answers:
+    {% for doc in documents %}
+    {{ doc.content }}
+    {% endfor %}
+
+    \nQuestion: {{query}}
+    \nAnswer:
+    """
+
+# answers the question for several short pages in one request
+PACKED_TEMPLATE = """
+    Given these numbered documents, answer the question separately for every document.
+    Start the answer for every document on a new line with its number in brackets, e.g. [1].\nDocuments:
+    {% for doc in documents %}
+    [{{ loop.index }}] {{ doc.content }}
+    {% endfor %}
+
+    \nQuestion: {{query}}
+    \nAnswer:
+    """
+
+PACKED_ANSWER_PATTERN = re.compile(r'^\s*\[(\d+)\]\s*(.*?)(?=^\s*\[\d+\]|\Z)', re.M | re.S)
+
+@component
+class EchoGenerator:
+    """
+    A local generator that answers without calling an LLM, for dry runs and tests.
+    The reply is the first line of the question followed by the number of characters of the prompt,
+    for numbered documents one such line per document.
+    """
+
+    @component.output_types(replies=List[str], meta=List[Dict[str, Any]])
+    def run(self, prompt: str):
+        question = prompt.split("Question:")[-1].strip().splitlines()[0]
+        numbers = re.findall(r'^\s*\[(\d+)\] ', prompt, re.M)
+        if numbers:
+            reply = "\n".join(f"[{number}] {question}" for number in numbers)
+        else:
+            reply = f"{question} ({len(prompt)} characters)"
+        return {"replies": [reply], "meta": [{"model": "echo"}]}
+
+
 class AIContentAnalyzer:
     """
     A class for analyzing web content with AI, using predefined prompts.
 
+    The pipelines (prompt builder, generator, answer builder) are built once per worker thread
+    and reused for every page. Pages are passed as text, e.g. the main content the assembler already
+    extracted, so nothing is downloaded again. At most max_concurrent_requests prompts run at the same time.
+    With a cache, answers are looked up by generator, model, template, task and cleaned content before the generator is called.
+
+    Requests are fitted into the context window of the model: a page with more tokens than fit
+    is split into chunks, answered per chunk and the answers are combined (map-reduce), and
+    short pages are packed into one request with one numbered answer per page.
+
+    Attributes:
+        prompts (dict): A dictionary mapping prompt names to their tasks.
+        generation_model (str): The OpenAI model used by the default generator.
+        model_id (str): The generator and the model that answer, e.g. "OpenAIGenerator/gpt-3.5-turbo-1106",
+                        so answers of a local generator are never taken for answers of the model.
+        max_concurrent_requests (int): Maximum number of prompts sent to the generator at the same time.
+        url (str): The url analyzed by index_and_answer_documents_from_website, optional.
+        cache (LLMResponseCache): Answers of earlier runs, None calls the generator for every prompt.
+        token_counter (TokenCounter): Counts the tokens of the prompts.
+        context_window (int): Number of tokens of a request, prompt and answer together.
+        max_answer_tokens (int): Number of tokens reserved for the answer of one page.
+        short_page_tokens (int): Pages up to this number of tokens are packed with other pages.
+        max_pages_per_request (int): Maximum number of pages packed into one request.
+        pack_wait (float): Seconds answer_prompt waits for pages of other threads to pack with, 0 disables packing there.
+        generator_calls (int): Number of prompts sent to the generator.
+
     Methods:
-        analyze_content_prompt: Analyzes the content based on predefined prompts.
+        answer_prompt(text, prompt_name): Answers one prompt for a page text.
+        answer_prompts(text): Answers all prompts for a page text.
+        answer_pages(pages): Answers all prompts for many pages, short pages packed into shared requests.
+        index_and_answer_documents_from_website(prompt_name): Fetches the url and answers one prompt.
+        stats(): Returns the generator calls, packed and chunked pages and the cache hits and misses.
     """
 
-    def __init__(self, prompts, url):
+    def __init__(self, prompts, url=None, generator_factory=None, generation_model="gpt-3.5-turbo-1106", max_concurrent_requests=4,
+                 cache=None, context_window=None, max_answer_tokens=512, short_page_tokens=1000, max_pages_per_request=8,
+                 pack_wait=0.0):
         """
-        Initializes the AIContentAnalyzer with specific prompts and one url.
+        Initializes the AIContentAnalyzer with specific prompts.
 
         Args:
-            prompt (str): The prompt to be used.
-            url (str): The url to be analyzed.
+            prompts (dict): A dictionary mapping prompt names to their tasks.
+            url (str, optional): The url analyzed by index_and_answer_documents_from_website. Defaults to None.
+            generator_factory (callable, optional): Returns a new generator component, called once per pipeline.
+                                                    Defaults to an OpenAIGenerator for generation_model.
+            generation_model (str): The OpenAI model. Defaults to "gpt-3.5-turbo-1106".
+            max_concurrent_requests (int): Maximum number of prompts sent at the same time. Defaults to 4.
+            cache (LLMResponseCache, optional): Cache of the answers. Defaults to None (no cache).
+            context_window (int, optional): Tokens of a request. Defaults to the context window of the model.
+            max_answer_tokens (int): Tokens reserved for the answer of one page. Defaults to 512.
+            short_page_tokens (int): Pages up to this number of tokens are packed. Defaults to 1000.
+            max_pages_per_request (int): Maximum number of pages per packed request. Defaults to 8.
+            pack_wait (float): Seconds answer_prompt waits for pages of concurrent threads. Defaults to 0 (no packing).
         """
 
         self.prompts = {k: [word for word in v] for k, v in prompts.items()}
-        self.generation_model = "gpt-3.5-turbo-1106" # The latest GPT-3.5 Turbo model with a context window of 16385 tokens and improved instruction following, JSON mode, reproducible outputs, parallel function calling, and more. Returns a maximum of 4,096 output tokens.
+        self.generation_model = generation_model # The latest GPT-3.5 Turbo model with a context window of 16385 tokens and improved instruction following, JSON mode, reproducible outputs, parallel function calling, and more. Returns a maximum of 4,096 output tokens.
         self.embedding_model = "intfloat/e5-base-v2"
         self.llm_api_key=OPENAI_API_KEY
         self.url = url
+        self.max_concurrent_requests = max_concurrent_requests
+        self.generator_factory = generator_factory or (lambda: OpenAIGenerator(api_key=self.llm_api_key, model_name=self.generation_model))
+        generator_name = getattr(generator_factory, '__name__', type(generator_factory).__name__) if generator_factory else 'OpenAIGenerator'
+        self.model_id = f"{generator_name}/{generation_model}"
+        self._request_slots = threading.BoundedSemaphore(max_concurrent_requests)
+        self.cache = cache
+        self.token_counter = TokenCounter(generation_model)
+        self.context_window = context_window or CONTEXT_WINDOWS.get(generation_model, DEFAULT_CONTEXT_WINDOW)
+        self.max_answer_tokens = max_answer_tokens
+        self.short_page_tokens = short_page_tokens
+        self.max_pages_per_request = max_pages_per_request
+        self.pack_wait = pack_wait
+        self.generator_calls = 0
+        self.packed_pages = 0
+        self.chunked_pages = 0
+        self._counts_lock = threading.Lock()
+        self._batchers = {}
+        if pack_wait > 0:
+            for prompt_name in self.prompts:
+                query = self._query(prompt_name)
+                self._batchers[prompt_name] = PromptBatcher(
+                    lambda contents, query=query: self._answer_packed(contents, query),
+                    self._budget(PACKED_TEMPLATE, query, 0), max_pages_per_request, pack_wait,
+                )
+        # a haystack component belongs to exactly one pipeline, every thread builds its own pipelines once
+        self._local = threading.local()
 
+    def _answer_pipeline(self, template=PROMPT_TEMPLATE):
+        """
+        Returns the answer pipeline of the current thread for the template, it is built on first use.
+        """
+        if not hasattr(self._local, 'answer_pipelines'):
+            self._local.answer_pipelines = {}
+        if template not in self._local.answer_pipelines:
+            p = Pipeline()
+            p.add_component(instance=PromptBuilder(template=template), name="prompt_builder")
+            p.add_component(instance=self.generator_factory(), name="llm")
+            p.add_component(instance=AnswerBuilder(), name="answer_builder")
 
+            p.connect("prompt_builder", "llm")
+            p.connect("llm.replies", "answer_builder.replies")
+            self._local.answer_pipelines[template] = p
+        return self._local.answer_pipelines[template]
 
-    def index_and_answer_documents_from_website(self, prompt_name):
-        """ 
-        Indexes the given url in the document store.
+    def _clean(self, documents):
+        """
+        Cleans the documents with the DocumentCleaner of the current thread, before the cache lookup.
+        """
+        if not hasattr(self._local, 'cleaner'):
+            self._local.cleaner = DocumentCleaner()
+        return self._local.cleaner.run(documents=documents)['documents']
+
+    def _fetch_pipeline(self):
+        """
+        Returns the fetch pipeline of the current thread, it is built on first use.
+        """
+        if not hasattr(self._local, 'fetch_pipeline'):
+            p = Pipeline()
+            p.add_component(instance=LinkContentFetcher(), name="fetcher")
+            p.add_component(instance=HTMLToDocument(), name="converter")
+            p.connect("fetcher.streams", "converter.sources")
+            self._local.fetch_pipeline = p
+        return self._local.fetch_pipeline
+
+    def _query(self, prompt_name):
+        return "\n".join(self.prompts[prompt_name])
+
+    def _budget(self, template, query, reserve):
+        """
+        Returns the number of tokens left for the documents of a request.
+        """
+        return self.context_window - reserve - self.token_counter.count(template) - self.token_counter.count(query)
+
+    def _count(self, name, n=1):
+        with self._counts_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _generate(self, template, contents, query):
+        """
+        Sends one request to the generator and returns its answer.
+        """
+        with self._request_slots:
+            self._count('generator_calls')
+            result = self._answer_pipeline(template).run(
+                {
+                    "prompt_builder": {"documents": [Document(content=content) for content in contents], "query": query},
+                    "answer_builder": {"query": query},
+                })
+        answers = result['answer_builder']['answers']
+        return answers[0].data.strip() if answers else None
+
+    def _answer_content(self, content, query):
+        """
+        Answers the query for the content of one page, in chunks if it does not fit into one request.
+        """
+        budget = self._budget(PROMPT_TEMPLATE, query, self.max_answer_tokens)
+        if self.token_counter.count(content) <= budget:
+            return self._generate(PROMPT_TEMPLATE, [content], query)
+        self._count('chunked_pages')
+        partial_answers = [self._generate(PROMPT_TEMPLATE, [chunk], query) for chunk in split_into_chunks(content, budget, self.token_counter)]
+        return self._reduce([answer for answer in partial_answers if answer], query)
+
+    def _reduce(self, partial_answers, query):
+        """
+        Combines the answers for the chunks of a page, in several rounds if they do not fit into one request.
+        """
+        if not partial_answers:
+            return None
+        budget = self._budget(REDUCE_TEMPLATE, query, self.max_answer_tokens)
+        groups = pack([(answer, self.token_counter.count(answer) + 1) for answer in partial_answers], budget, len(partial_answers))
+        if len(groups) == 1:
+            return self._generate(REDUCE_TEMPLATE, groups[0], query)
+        return self._reduce([answer for answer in (self._generate(REDUCE_TEMPLATE, group, query) for group in groups) if answer], query)
+
+    def _answer_packed(self, contents, query):
+        """
+        Answers the query for several short pages in one request and splits the answer by page number.
+        Pages without a numbered answer are answered alone.
+        """
+        if len(contents) == 1:
+            return [self._answer_content(contents[0], query)]
+        self._count('packed_pages', len(contents))
+        reply = self._generate(PACKED_TEMPLATE, contents, query) or ""
+        answers = {int(number): answer.strip() for number, answer in PACKED_ANSWER_PATTERN.findall(reply)}
+        return [answers.get(i + 1) or self._answer_content(content, query) for i, content in enumerate(contents)]
+
+    def _lookup(self, query, content):
+        """
+        Returns the cache key and the cached answer of a page, (None, None) without a cache.
+        """
+        if self.cache is None:
+            return None, None
+        key = cache_key(self.model_id, PROMPT_TEMPLATE, query, content)
+        return key, self.cache.get(key)
+
+    def _answer_documents(self, documents, prompt_name):
+        """
+        Answers one prompt for the given documents, from the cache if possible.
+        """
+        query = self._query(prompt_name)
+        content = "\n".join(doc.content or "" for doc in self._clean(documents))
+        key, answer = self._lookup(query, content)
+        if answer is not None:
+            return answer
+
+        tokens = self.token_counter.count(content)
+        if prompt_name in self._batchers and tokens <= self.short_page_tokens:
+            answer = self._batchers[prompt_name].submit(content, tokens + self.max_answer_tokens)
+        else:
+            answer = self._answer_content(content, query)
+        if key is not None and answer is not None:
+            self.cache.put(key, answer)
+        return answer
+
+    def answer_prompt(self, text, prompt_name):
         """
-        fetcher = LinkContentFetcher()
-        converter = HTMLToDocument()
-        cleaner = DocumentCleaner()
+        Answers one prompt for a page text.
+        With pack_wait, a short page waits for pages of concurrent threads and is answered together with them.
 
-        prompt_template = """
-            Given these documents, answer the question.\nDocuments:
-            {% for doc in documents %}
-            {{ doc.content }}
-            {% endfor %}
+        Args:
+            text (str): The text of the page, e.g. its main content.
+            prompt_name (str): The name of the prompt.
 
-            \nQuestion: {{query}}
-            \nAnswer:
-            """
+        Returns:
+            str: The answer, or None if the generator gave no answer.
+        """
+        return self._answer_documents([Document(content=text)], prompt_name)
 
-        p = Pipeline()
-        p.add_component(instance=fetcher, name="fetcher")
-        p.add_component(instance=converter, name="converter")
-        p.add_component(instance=cleaner, name="cleaner")
+    def answer_prompts(self, text):
+        """
+        Answers all prompts for a page text.
 
-        p.add_component(instance=PromptBuilder(template=prompt_template), name="prompt_builder")
-        p.add_component(instance=OpenAIGenerator(api_key=os.environ.get("OPENAI_API_KEY")), name="llm")
-        p.add_component(instance=AnswerBuilder(), name="answer_builder")
+        Args:
+            text (str): The text of the page, e.g. its main content.
 
-        p.connect("fetcher.streams", "converter.sources")
-        p.connect("converter.documents", "cleaner.documents")
-        p.connect("cleaner.documents", "prompt_builder")
-        p.connect("prompt_builder", "llm")
-        p.connect("llm.replies", "answer_builder.replies")
-        
-        query = self.prompts[prompt_name][0]
+        Returns:
+            dict: A dictionary mapping every prompt name to its answer.
+        """
+        return {prompt_name: self.answer_prompt(text, prompt_name) for prompt_name in self.prompts}
 
-        result = p.run(
-            {
-                "fetcher": {"urls": [self.url]},
-                "prompt_builder": {"query": query},
-                "answer_builder": {"query": query},
-            })
-        print(result['answer_builder']['answers'])
+    def answer_pages(self, pages):
+        """
+        Answers all prompts for many pages, with at most max_concurrent_requests prompts at the same time.
+        Cached answers are reused, short pages are packed into shared requests and long pages are chunked.
 
+        Args:
+            pages (iterable of tuple): (url, text) of every page.
 
+        Yields:
+            tuple: (url, answers) of every page in input order, answers maps every prompt name to its answer.
+        """
+        pages = [(url, "\n".join(doc.content or "" for doc in self._clean([Document(content=text)]))) for url, text in pages]
+        answers = {url: {} for url, _ in pages}
+        pending = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as pool:
+            for prompt_name in self.prompts:
+                query = self._query(prompt_name)
+                short_pages = []
+                for url, content in pages:
+                    key, answer = self._lookup(query, content)
+                    if answer is not None:
+                        answers[url][prompt_name] = answer
+                        continue
+                    tokens = self.token_counter.count(content)
+                    if tokens <= self.short_page_tokens:
+                        short_pages.append(((url, content, key), tokens + self.max_answer_tokens))
+                    else:
+                        pending.append((url, prompt_name, key, pool.submit(self._answer_packed, [content], query), 0))
+                for batch in pack(short_pages, self._budget(PACKED_TEMPLATE, query, 0), self.max_pages_per_request):
+                    future = pool.submit(self._answer_packed, [content for _, content, _ in batch], query)
+                    pending.extend((url, prompt_name, key, future, index) for index, (url, _, key) in enumerate(batch))
 
+            for url, prompt_name, key, future, index in pending:
+                answer = future.result()[index]
+                if key is not None and answer is not None:
+                    self.cache.put(key, answer)
+                answers[url][prompt_name] = answer
+        for url, _ in pages:
+            yield url, {prompt_name: answers[url].get(prompt_name) for prompt_name in self.prompts}
+
+    def stats(self):
+        """
+        Returns the number of generator calls, packed and chunked pages and the cache hits and misses.
+
+        Returns:
+            dict: generator_calls, packed_pages, chunked_pages, cache_hits and cache_misses.
+        """
+        cache_stats = self.cache.stats() if self.cache is not None else {"hits": 0, "misses": 0}
+        return {
+            "generator_calls": self.generator_calls,
+            "packed_pages": self.packed_pages,
+            "chunked_pages": self.chunked_pages,
+            "cache_hits": cache_stats["hits"],
+            "cache_misses": cache_stats["misses"],
+        }
+
+    def index_and_answer_documents_from_website(self, prompt_name):
+        """
+        Fetches the given url and answers one prompt for its content.
+        """
+        result = self._fetch_pipeline().run({"fetcher": {"urls": [self.url]}})
+        answer = self._answer_documents(result['converter']['documents'], prompt_name)
+        print(answer)
+        return answer
 
 
 # Beispielhafte Verwendung
@@ -93,7 +388,19 @@ if __name__ == "__main__":
         "Prompt2": ["Fasse ALLE wichtigen Aussagen im folgenden Text zusammen."],
         # Weitere Prompts
     }
+    # lokal ohne LLM testen, der zweite Durchlauf kommt aus dem Cache
+    from llm_cache import LLMResponseCache
+    analyzer = AIContentAnalyzer(prompts_to_process, generator_factory=EchoGenerator, cache=LLMResponseCache())
+    pages = [
+        ("https://www.eak.admin.ch/eak/de/home.html", "Die EAK ist die Ausgleichskasse des Bundes."),
+        ("https://www.eak.admin.ch/eak/de/home/Firmen.html", "Firmen rechnen die Beiträge mit der EAK ab."),
+    ]
+    for _ in range(2):
+        for url, answers in analyzer.answer_pages(pages):
+            print(url, answers)
+    print(analyzer.stats())
+
     url = "https://www.eak.admin.ch/eak/de/home/EAK/publikationen/mitteilungs-archiv/eak-mitteilung-52.html"
     analyzer = AIContentAnalyzer(prompts_to_process, url)
-    print(analyzer.index_and_answer_documents_from_website(prompt_name="Prompt1"))  # was kommt hier raus?    
-    print(analyzer.index_and_answer_documents_from_website(prompt_name="Prompt2"))  # was kommt hier raus?
\ No newline at end of file
+    print(analyzer.index_and_answer_documents_from_website(prompt_name="Prompt1"))  # was kommt hier raus?
+    print(analyzer.index_and_answer_documents_from_website(prompt_name="Prompt2"))  # was kommt hier raus?
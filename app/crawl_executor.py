@@ -0,0 +1,130 @@
+""" A module to run the per-URL work of a crawl concurrently with bounded worker pools. """
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+class HostLimiter:
+    """
+    A class limiting the number of concurrent tasks per host.
+
+    Attributes:
+        max_per_host (int): Maximum number of concurrent tasks per host, None means no limit.
+
+    Methods:
+        limit(url): Context manager that blocks until a slot for the host of the URL is free.
+    """
+
+    def __init__(self, max_per_host=None):
+        """
+        Initializes the HostLimiter.
+
+        Args:
+            max_per_host (int, optional): Maximum number of concurrent tasks per host. Defaults to None (no limit).
+        """
+        self.max_per_host = max_per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    @contextmanager
+    def limit(self, url):
+        """
+        Blocks until a slot for the host of the URL is free and holds it for the duration of the block.
+
+        Args:
+            url (str): The URL whose host is limited.
+        """
+        if not self.max_per_host:
+            yield
+            return
+        semaphore = self._semaphore(urlsplit(url).netloc)
+        with semaphore:
+            yield
+
+
+class CrawlExecutor:
+    """
+    A class to apply a function to many URLs with a bounded worker pool.
+    Results are returned in input order and a failure of one URL does not affect the others.
+
+    Attributes:
+        max_workers (int): Maximum number of concurrent tasks overall. 1 runs everything in the calling thread.
+        host_limiter (HostLimiter): Limits the number of concurrent tasks per host.
+
+    Methods:
+        map(function, urls): Applies the function to every URL and yields (url, result, error) in input order.
+    """
+
+    def __init__(self, max_workers=1, max_workers_per_host=None):
+        """
+        Initializes the CrawlExecutor with global and per-host concurrency limits.
+
+        Args:
+            max_workers (int): Maximum number of concurrent tasks overall. Defaults to 1.
+            max_workers_per_host (int, optional): Maximum number of concurrent tasks per host. Defaults to None (no limit).
+        """
+        self.max_workers = max(1, max_workers or 1)
+        self.host_limiter = HostLimiter(max_workers_per_host)
+
+    def _run(self, function, url):
+        """
+        Runs the function for one URL and isolates its failure.
+
+        Returns:
+            tuple: (url, result, error), where exactly one of result and error is set.
+        """
+        try:
+            with self.host_limiter.limit(url):
+                return url, function(url), None
+        except Exception as e:
+            return url, None, e
+
+    def map(self, function, urls):
+        """
+        Applies the function to every URL and yields the results in input order.
+        At most 2 * max_workers URLs are in flight, so the results waiting for an earlier
+        URL to finish stay bounded.
+
+        Args:
+            function (callable): The function to apply to each URL.
+            urls (iterable of str): The URLs to process.
+
+        Yields:
+            tuple: (url, result, error) for every URL, error is None if the function succeeded.
+        """
+        if self.max_workers == 1:
+            for url in urls:
+                yield self._run(function, url)
+            return
+
+        window = 2 * self.max_workers
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = []
+            for url in urls:
+                pending.append(pool.submit(self._run, function, url))
+                if len(pending) >= window:
+                    yield pending.pop(0).result()
+            for future in pending:
+                yield future.result()
+
+
+# Example usage
+if __name__ == "__main__":
+    import time
+
+    def slow_length(url):
+        time.sleep(0.1)
+        if url.endswith("broken.html"):
+            raise ValueError("broken page")
+        return len(url)
+
+    urls = [f"https://www.eak.admin.ch/eak/de/home/{i}.html" for i in range(8)] + ["https://www.eak.admin.ch/broken.html"]
+    executor = CrawlExecutor(max_workers=4, max_workers_per_host=2)
+    for url, result, error in executor.map(slow_length, urls):
+        print(url, result, error)
@@ -0,0 +1,118 @@
+""" A module to keep the state of earlier crawls for incremental recrawls. """
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+# extraction_hash covers what the content was extracted with (content class and parser), rules_hash everything the row depends on
+PageState = namedtuple('PageState', ['url', 'lastmod', 'etag', 'last_modified', 'content_hash', 'rules_hash', 'row', 'content',
+                                     'extraction_hash'], defaults=(None, None))
+
+def hash_content(content):
+    """
+    Returns a stable hash of the given content.
+
+    Args:
+        content (str or bytes or object): The content, anything else is hashed as sorted JSON.
+
+    Returns:
+        str: The SHA-256 hex digest of the content.
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    elif not isinstance(content, bytes):
+        content = json.dumps(content, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+class CrawlStateStore:
+    """
+    A SQLite store of the per-URL state of the last crawl: sitemap lastmod, ETag, Last-Modified,
+    content hash, hash of the analysis rules, the extracted row, the main content text and the hash of its extraction,
+    so that rows can be tagged again without fetching the pages.
+
+    Attributes:
+        path (str): Path of the SQLite file.
+
+    Methods:
+        get(url): Returns the PageState of the URL, or None.
+        put(state): Stores the PageState of a URL.
+        close(): Closes the SQLite file.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        """
+        Initializes the CrawlStateStore and creates the SQLite file if needed.
+        The file is opened in WAL mode, so the worker processes of a distributed crawl can share it.
+
+        Args:
+            path (str): Path of the SQLite file.
+            timeout (float): Seconds to wait for a lock held by another process. Defaults to 5.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS page_state ("
+            "url TEXT PRIMARY KEY, lastmod TEXT, etag TEXT, last_modified TEXT, "
+            "content_hash TEXT, rules_hash TEXT, row TEXT, updated_at REAL, content TEXT, extraction_hash TEXT)"
+        )
+        columns = [column[1] for column in self._db.execute("PRAGMA table_info(page_state)")]
+        # a state file of an earlier version
+        if 'content' not in columns:
+            self._db.execute("ALTER TABLE page_state ADD COLUMN content TEXT")
+        if 'extraction_hash' not in columns:
+            self._db.execute("ALTER TABLE page_state ADD COLUMN extraction_hash TEXT")
+        self._db.commit()
+
+    def get(self, url):
+        """
+        Returns the state of the URL from the last crawl.
+
+        Args:
+            url (str): The URL of the page.
+
+        Returns:
+            PageState: The state of the page, or None if the page was never crawled.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, lastmod, etag, last_modified, content_hash, rules_hash, row, content, extraction_hash "
+                "FROM page_state WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return PageState(*row[:6], json.loads(row[6]), row[7], row[8])
+
+    def put(self, state):
+        """
+        Stores the state of a URL.
+
+        Args:
+            state (PageState): The state of the page.
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO page_state "
+                "(url, lastmod, etag, last_modified, content_hash, rules_hash, row, updated_at, content, extraction_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*state[:6], json.dumps(state.row, ensure_ascii=False), time.time(), state.content, state.extraction_hash),
+            )
+            self._db.commit()
+
+    def close(self):
+        """
+        Closes the SQLite file.
+        """
+        self._db.close()
+
+
+# Example usage
+if __name__ == "__main__":
+    store = CrawlStateStore(':memory:')
+    url = 'https://www.eak.admin.ch/eak/de/home.html'
+    store.put(PageState(url, '2024-02-01', '"abc"', None, hash_content('<html></html>'), hash_content({}), {"URL": url}, "Startseite der EAK"))
+    print(store.get(url))
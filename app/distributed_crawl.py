@@ -0,0 +1,267 @@
+""" A module to distribute a crawl over several worker processes or machines that share a URL frontier. """
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from url_frontier import SQLiteFrontier, DONE
+
+
+class CrawlCoordinator:
+    """
+    A class that fills the URL frontier from the sitemap and merges the rows of all workers into one output.
+    The rows are recorded in sitemap order by the ExtractedInformationAssembler of the coordinator,
+    i.e. written to its sink and added to its duplicate analysis, as soon as all earlier URLs are finished.
+
+    Attributes:
+        assembler (ExtractedInformationAssembler): Parses the sitemap and records the merged rows.
+        frontier (URLFrontier): The frontier shared with the workers.
+        poll_interval (float): Seconds between two reads of new results.
+        progress_interval (float): Seconds between two progress reports.
+        worker_timeout (float): Seconds without new results and without a worker heartbeat after which
+                                the collection stops.
+
+    Methods:
+        seed(resume=False): Fills the frontier with the URLs of the sitemap.
+        collect(alive=None): Records the rows of the workers in sitemap order until all URLs are finished.
+        run(resume=False): Seeds the frontier and collects the rows.
+    """
+
+    def __init__(self, assembler, frontier, poll_interval=1.0, progress_interval=30.0, worker_timeout=600.0):
+        """
+        Initializes the CrawlCoordinator.
+
+        Args:
+            assembler (ExtractedInformationAssembler): Parses the sitemap and records the merged rows.
+            frontier (URLFrontier): The frontier shared with the workers.
+            poll_interval (float): Seconds between two reads of new results. Defaults to 1.
+            progress_interval (float): Seconds between two progress reports. Defaults to 30.
+            worker_timeout (float): Seconds without new results and without a worker heartbeat after which
+                                    the collection stops. Defaults to 600.
+        """
+        self.assembler = assembler
+        self.frontier = frontier
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self.worker_timeout = worker_timeout
+        self.url_count = 0
+
+    def seed(self, resume=False):
+        """
+        Fills the frontier with the URLs of the sitemap that match the filter of the assembler.
+
+        Args:
+            resume (bool): Whether to keep the rows of the crawl stored in the frontier. Defaults to False.
+
+        Returns:
+            int: Number of URLs of the crawl.
+        """
+        assembler = self.assembler
+        with assembler.metrics.stage("sitemap"):
+            entries = assembler.sitemap_parser.get_entries(filter_str=assembler.filter_str, k=assembler.k)
+        done = self.frontier.add(entries, resume=resume)
+        if resume:
+            print(f"Resuming: {done} URLs already done, {len(entries) - done} URLs to extract.")
+        print(f"Frontier filled with {len(entries)} URLs, the workers can start.")
+        self.url_count = len(entries)
+        return self.url_count
+
+    def collect(self, alive=None):
+        """
+        Records the rows of the workers in sitemap order until all URLs are finished.
+        The collection stops early if no worker sent a heartbeat and no result arrived for worker_timeout seconds,
+        e.g. if no worker was started or all workers died.
+
+        Args:
+            alive (callable, optional): Returns False once no worker is left, the collection then stops
+                                        with the URLs that are not finished. Defaults to None (wait for all URLs).
+
+        Returns:
+            int: Number of recorded URLs, done or failed.
+        """
+        assembler = self.assembler
+        position = 0
+        last_progress = time.monotonic()
+        last_sign_of_life = time.monotonic()
+        while position < self.url_count:
+            results = self.frontier.results(position)
+            for result in results:
+                if result.status == DONE:
+                    assembler.metrics.increment("pages")
+                    with assembler.metrics.stage("write"):
+                        assembler._record_row(result.row)
+                else:
+                    print(f"An error occurred while extracting ...{result.url[-50:]}: {result.error}")
+                    assembler.failed_urls.append((result.url, result.error))
+                    assembler.metrics.increment("failed_pages")
+            position += len(results)
+            if results:
+                last_sign_of_life = time.monotonic()
+                continue
+            if alive is not None and not alive():
+                print(f"No worker left, {self.url_count - position} URLs not extracted.")
+                break
+            if any(worker["seconds_since_heartbeat"] < self.worker_timeout for worker in self.frontier.workers().values()):
+                last_sign_of_life = time.monotonic()
+            elif time.monotonic() - last_sign_of_life >= self.worker_timeout:
+                print(f"No worker heartbeat for {self.worker_timeout:g}s, {self.url_count - position} URLs not extracted.")
+                break
+            if time.monotonic() - last_progress >= self.progress_interval:
+                last_progress = time.monotonic()
+                print(f"Progress: {self.frontier.counts()}, workers: {self.frontier.workers()}")
+            time.sleep(self.poll_interval)
+        assembler._finish_extraction(self.url_count)
+        print(f"Frontier: {self.frontier.counts()}, {self.frontier.reassigned()} URLs of expired leases reassigned.")
+        return position
+
+    def run(self, resume=False):
+        """
+        Seeds the frontier and collects the rows of the workers.
+
+        Args:
+            resume (bool): Whether to keep the rows of the crawl stored in the frontier. Defaults to False.
+
+        Returns:
+            int: Number of recorded URLs.
+        """
+        self.seed(resume=resume)
+        return self.collect()
+
+
+class CrawlWorker:
+    """
+    A class that leases URLs from the frontier, extracts them with its ExtractedInformationAssembler
+    and reports every row or error to the frontier right away.
+    A heartbeat thread extends the leases of the worker while it is alive; if the worker dies,
+    its leases expire and its URLs are leased to the other workers.
+    The worker stops once no URL of the frontier is pending or leased. A worker started before the coordinator
+    waits until the coordinator has filled the frontier, the finished crawl of an earlier run does not count.
+
+    Attributes:
+        assembler (ExtractedInformationAssembler): Extracts the leased URLs with its crawl limits and analyzers.
+        frontier (URLFrontier): The frontier shared with the coordinator and the other workers.
+        worker_id (str): The ID of the worker in the frontier.
+        batch_size (int): Number of URLs leased at once.
+        lease_seconds (float): Seconds a lease lasts without heartbeat.
+        heartbeat_interval (float): Seconds between two heartbeats.
+        extracted (int): Number of URLs extracted by the worker.
+
+    Methods:
+        run(): Extracts leased URLs until the frontier is finished.
+    """
+
+    def __init__(self, assembler, frontier, worker_id=None, batch_size=None, lease_seconds=60.0,
+                 heartbeat_interval=None, poll_interval=1.0):
+        """
+        Initializes the CrawlWorker.
+
+        Args:
+            assembler (ExtractedInformationAssembler): Extracts the leased URLs.
+            frontier (URLFrontier): The shared frontier.
+            worker_id (str, optional): The ID of the worker. Defaults to host name and process ID.
+            batch_size (int, optional): Number of URLs leased at once. Defaults to twice the workers of the assembler.
+            lease_seconds (float): Seconds a lease lasts without heartbeat. Defaults to 60.
+            heartbeat_interval (float, optional): Seconds between two heartbeats. Defaults to a third of lease_seconds.
+            poll_interval (float): Seconds to wait for the leases of other workers. Defaults to 1.
+        """
+        self.assembler = assembler
+        self.frontier = frontier
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size or 2 * assembler.crawl_executor.max_workers
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval or lease_seconds / 3
+        self.poll_interval = poll_interval
+        self.extracted = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        """
+        Extracts leased URLs until no URL of the frontier is pending or leased. Waits for the frontier to be filled
+        if it is empty or holds only the finished crawl of an earlier run.
+        When only URLs leased by other workers are left, the worker waits and takes over those whose lease expires.
+
+        Returns:
+            int: Number of URLs extracted by the worker.
+        """
+        # the coordinator may still be reading the sitemap, a finished frontier is left over from the last run
+        first_generation = self.frontier.generation()
+        while self.frontier.generation() == first_generation and (first_generation == 0 or self.frontier.is_finished()):
+            time.sleep(self.poll_interval)
+        heartbeat = threading.Thread(target=self._send_heartbeats, daemon=True)
+        heartbeat.start()
+        try:
+            while True:
+                for url, row, error in self.assembler._extract_urls(self._leased_urls()):
+                    if error is not None:
+                        print(f"An error occurred while extracting ...{url[-50:]}: {error}")
+                        self.frontier.fail(url, str(error))
+                        self.assembler.metrics.increment("failed_pages")
+                    else:
+                        self.frontier.complete(url, row)
+                        self.assembler.metrics.increment("pages")
+                    self.extracted += 1
+                if self.frontier.is_finished():
+                    break
+                time.sleep(self.poll_interval)
+        finally:
+            self._stopped.set()
+            heartbeat.join()
+        print(f"Worker {self.worker_id}: {self.extracted} URLs extracted.")
+        self.assembler._finish_extraction(self.extracted)
+        return self.extracted
+
+    def _leased_urls(self):
+        """
+        Leases batches of URLs as the assembler asks for them, until no URL is pending.
+        """
+        while not self._stopped.is_set():
+            entries = self.frontier.lease(self.worker_id, self.batch_size, self.lease_seconds)
+            if not entries:
+                return
+            for entry in entries:
+                self.assembler.sitemap_lastmods[entry.url] = entry.lastmod
+                yield entry.url
+
+    def _send_heartbeats(self):
+        while not self._stopped.wait(self.heartbeat_interval):
+            try:
+                self.frontier.heartbeat(self.worker_id, self.lease_seconds)
+            except Exception as e:
+                print(f"Heartbeat of worker {self.worker_id} failed: {e}")
+
+
+def _run_local_worker(create_assembler, frontier_path, worker_options):
+    """ A worker process of run_local_crawl. """
+    with SQLiteFrontier(frontier_path) as frontier:
+        CrawlWorker(create_assembler(), frontier, **worker_options).run()
+
+
+def run_local_crawl(create_assembler, frontier_path, workers=2, resume=False, **worker_options):
+    """
+    Runs a coordinator and several worker processes on this machine, with a SQLite frontier.
+
+    Args:
+        create_assembler (callable): Returns a new ExtractedInformationAssembler, called in the coordinator
+                                     and in every worker process.
+        frontier_path (str): Path of the SQLite file of the frontier.
+        workers (int): Number of worker processes. Defaults to 2.
+        resume (bool): Whether to keep the rows of the crawl stored in the frontier. Defaults to False.
+        **worker_options: Further arguments of every CrawlWorker, e.g. lease_seconds.
+
+    Returns:
+        ExtractedInformationAssembler: The assembler of the coordinator with the merged rows.
+    """
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    assembler = create_assembler()
+    with SQLiteFrontier(frontier_path) as frontier:
+        coordinator = CrawlCoordinator(assembler, frontier)
+        coordinator.seed(resume=resume)
+        processes = [(context or multiprocessing).Process(target=_run_local_worker,
+                                                         args=(create_assembler, frontier_path, worker_options))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        coordinator.collect(alive=lambda: any(process.is_alive() for process in processes))
+        for process in processes:
+            process.join()
+    return assembler
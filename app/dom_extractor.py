@@ -0,0 +1,155 @@
+""" A module to extract everything the assembler needs from an HTML document in a single parse. """
+from bs4 import BeautifulSoup
+
+# html.parser gives the rows of the former extraction for every page; lxml is faster and gives the same rows
+# for well-formed HTML, but repairs malformed HTML differently (e.g. a div inside a p), so it is opt-in
+DEFAULT_BACKEND = 'html.parser'
+BACKENDS = ('html.parser', 'lxml')
+
+DEFAULT_CSS_CLASSES = ('main-content', 'lead', 'text-dimmed')
+
+
+class ExtractedDOM:
+    """
+    The result of a single extraction pass over an HTML document.
+
+    Attributes:
+        title (str): The title of the document, or 'No title found'.
+        img_srcs (list of str): The src attributes of all img tags, in document order.
+        iframe_srcs (list of str): The src attributes of all iframe tags, in document order ('' if missing).
+        soup (BeautifulSoup): The parsed document, kept for classes that were not extracted up front.
+
+    Methods:
+        get_content_by_class(css_class): Concatenated text content of all elements with the specified CSS class.
+    """
+
+    def __init__(self, soup, title, content_by_class, img_srcs, iframe_srcs):
+        """
+        Initializes the ExtractedDOM with the values collected by the DOMExtractor.
+
+        Args:
+            soup (BeautifulSoup): The parsed document.
+            title (str): The title of the document.
+            content_by_class (dict): A dictionary mapping CSS classes to their concatenated text content.
+            img_srcs (list of str): The src attributes of all img tags.
+            iframe_srcs (list of str): The src attributes of all iframe tags.
+        """
+        self.soup = soup
+        self.title = title
+        self._content_by_class = content_by_class
+        self.img_srcs = img_srcs
+        self.iframe_srcs = iframe_srcs
+
+    def get_content_by_class(self, css_class):
+        """
+        Concatenates the text content of all elements with a specified CSS class.
+        Classes that were not extracted up front are looked up on the already parsed document.
+
+        Args:
+            css_class (str): The CSS class to filter the content.
+
+        Returns:
+            str: Concatenated text content of all elements with the specified CSS class.
+        """
+        if css_class not in self._content_by_class:
+            elements = self.soup.find_all(class_=css_class)
+            self._content_by_class[css_class] = _join_text(elements, css_class)
+        return self._content_by_class[css_class]
+
+
+class DOMExtractor:
+    """
+    A class to extract the title, class-based text, image sources and iframe sources
+    from an HTML document with one parse and one walk over the tree.
+
+    Attributes:
+        css_classes (tuple of str): The CSS classes whose text content is extracted up front.
+        backend (str): The BeautifulSoup tree builder, 'html.parser' or 'lxml'.
+
+    Methods:
+        extract(html_content): Parses the HTML content once and returns an ExtractedDOM.
+    """
+
+    def __init__(self, css_classes=DEFAULT_CSS_CLASSES, backend=None):
+        """
+        Initializes the DOMExtractor with the CSS classes to extract and the parser backend.
+
+        Args:
+            css_classes (iterable of str): The CSS classes whose text content is extracted up front.
+            backend (str, optional): The BeautifulSoup tree builder to use, one of BACKENDS. Defaults to DEFAULT_BACKEND.
+
+        Raises:
+            ValueError: If the backend is not supported.
+        """
+        self.css_classes = tuple(css_classes)
+        self.backend = backend or DEFAULT_BACKEND
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unsupported parser backend '{self.backend}', use one of {', '.join(BACKENDS)}.")
+
+    def extract(self, html_content):
+        """
+        Parses the HTML content once and collects all selectors in a single walk over the tree.
+
+        Args:
+            html_content (str): The HTML content to be parsed.
+
+        Returns:
+            ExtractedDOM: The extracted title, class-based text, image sources and iframe sources.
+        """
+        soup = BeautifulSoup(html_content, self.backend)
+        wanted_classes = set(self.css_classes)
+        elements_by_class = {css_class: [] for css_class in self.css_classes}
+        img_srcs = []
+        iframe_srcs = []
+        title_tag = None
+
+        for tag in soup.find_all(True):
+            if tag.name == 'img':
+                if 'src' in tag.attrs:
+                    img_srcs.append(tag['src'])
+            elif tag.name == 'iframe':
+                iframe_srcs.append(tag.get('src', ''))
+            elif tag.name == 'title' and title_tag is None:
+                title_tag = tag
+
+            tag_classes = tag.get('class')
+            if tag_classes:
+                for css_class in wanted_classes.intersection(tag_classes):
+                    elements_by_class[css_class].append(tag)
+
+        title = title_tag.string if title_tag else 'No title found'
+        if title is not None:
+            title = str(title)  # a NavigableString would keep the whole tree alive with the row
+        content_by_class = {css_class: _join_text(elements, css_class) for css_class, elements in elements_by_class.items()}
+        return ExtractedDOM(soup, title, content_by_class, img_srcs, iframe_srcs)
+
+
+def _join_text(elements, css_class):
+    """
+    Joins the text of the given elements the same way HTMLParser always did.
+
+    Args:
+        elements (list): The elements found for the CSS class.
+        css_class (str): The CSS class the elements were found for.
+
+    Returns:
+        str: The concatenated text, or '<css_class>-class not found' if there are no elements.
+    """
+    if not elements:
+        return f"{css_class}-class not found"
+    return ' '.join(element.get_text() for element in elements)
+
+
+# Example usage
+if __name__ == "__main__":
+    html = """
+        <html><head><title>Überblick | EAK</title></head><body>
+        <div class="main-content"><p class="lead">Reform AHV 21</p><img src="/eak/bild.png">
+        <iframe src="https://www.youtube.com/embed/abc"></iframe></div>
+        <p class="text-dimmed">Letzte Änderung 01.02.2024</p></body></html>
+    """
+    dom = DOMExtractor().extract(html)
+    print(dom.title)                                   # Überblick | EAK
+    print(dom.get_content_by_class('lead'))            # Reform AHV 21
+    print(dom.get_content_by_class('text-dimmed')[-10:])  # 01.02.2024
+    print(dom.img_srcs, dom.iframe_srcs)
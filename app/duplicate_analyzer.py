@@ -0,0 +1,236 @@
+""" A module to find duplicated and near-duplicated pages in one pass over the extracted rows. """
+import hashlib
+import re
+from collections import Counter, namedtuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+DuplicateGroup = namedtuple('DuplicateGroup', ['kind', 'key', 'urls'])
+
+# The columns of the duplicate report, see DuplicateAnalyzer.write_report
+REPORT_FIELDNAMES = ["Kind", "Key", "Count", "URLs"]
+
+# 64-bit SimHash, split into 4 bands of 16 bits for the near-duplicate lookup
+FINGERPRINT_BITS = 64
+BAND_BITS = 16
+
+WORD_PATTERN = re.compile(r'\w+')
+
+def normalize_url(url):
+    """
+    Normalizes a URL, so that spellings of the same page get the same key:
+    lowercased scheme and host, no default port, no fragment, sorted query and no trailing slash.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The normalized URL.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ''))
+
+def url_slug(url):
+    """
+    Returns the slug of a URL, the last path segment in lowercase.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The slug.
+    """
+    return url.split('/')[-1].lower()
+
+def simhash(text, shingle_size=3, min_words=20):
+    """
+    Computes the 64-bit SimHash of a text over its word shingles.
+    Texts that differ in a few words get fingerprints that differ in a few bits.
+
+    Args:
+        text (str): The text, e.g. the main content of a page.
+        shingle_size (int): Number of words per shingle. Defaults to 3.
+        min_words (int): Texts with fewer words get no fingerprint. Defaults to 20.
+
+    Returns:
+        str: The fingerprint as 16 hex digits, or None if the text is too short.
+    """
+    words = WORD_PATTERN.findall(text.lower()) if text else []
+    if len(words) < max(min_words, shingle_size):
+        return None
+    shingles = {' '.join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    digests = [hashlib.blake2b(shingle.encode('utf-8'), digest_size=FINGERPRINT_BITS // 8).digest() for shingle in shingles]
+
+    # counts the set bits per position byte by byte instead of bit by bit, 8 passes over the shingles
+    fingerprint = 0
+    half = len(digests) / 2
+    for position, byte_values in enumerate(zip(*digests)):
+        counts = Counter(byte_values)
+        for bit in range(8):
+            ones = sum(count for value, count in counts.items() if value >> bit & 1)
+            if ones > half:
+                fingerprint |= 1 << (position * 8 + bit)
+    return f"{fingerprint:016x}"
+
+
+class DuplicateAnalyzer:
+    """
+    A class that groups pages by title, slug, normalized URL and content fingerprint in one pass.
+
+    Every key is looked up in a hash map, so the analysis grows linearly with the number of pages.
+    Near-duplicated content is found with the SimHash of the main content: two fingerprints within
+    max_distance bits share at least one of the 16-bit bands (for max_distance < 4), so only pages
+    in the same band bucket are compared.
+
+    Attributes:
+        max_distance (int): Maximum number of differing fingerprint bits of near-duplicated content.
+        pages (int): Number of pages added.
+
+    Methods:
+        add(url, title, fingerprint=None): Adds a page.
+        add_row(row): Adds an extracted row.
+        groups(kind=None): Returns the duplicate groups, optionally of one kind only.
+        report(): Returns all duplicate groups.
+        write_report(sink): Writes all duplicate groups to an output sink.
+    """
+
+    KINDS = ('title', 'slug', 'url', 'content', 'near-content')
+
+    def __init__(self, max_distance=3):
+        """
+        Initializes the DuplicateAnalyzer.
+
+        Args:
+            max_distance (int): Maximum number of differing fingerprint bits of near-duplicated content. Defaults to 3.
+        """
+        if max_distance >= FINGERPRINT_BITS // BAND_BITS:
+            raise ValueError(f"max_distance must be below {FINGERPRINT_BITS // BAND_BITS}, the number of bands.")
+        self.max_distance = max_distance
+        self.pages = 0
+        self._urls_by_key = {kind: {} for kind in ('title', 'slug', 'url', 'content')}
+        self._fingerprints = []  # distinct fingerprints in the order they were first seen
+        self._band_buckets = {}
+
+    def add(self, url, title, fingerprint=None):
+        """
+        Adds a page.
+
+        Args:
+            url (str): The URL of the page.
+            title (str): The title of the page.
+            fingerprint (str, optional): The SimHash of the main content, see simhash(). Defaults to None.
+        """
+        self.pages += 1
+        keys = {'title': title, 'slug': url_slug(url), 'url': normalize_url(url), 'content': fingerprint}
+        for kind, key in keys.items():
+            if key:
+                self._urls_by_key[kind].setdefault(key, []).append(url)
+        if fingerprint and len(self._urls_by_key['content'][fingerprint]) == 1:
+            self._fingerprints.append(fingerprint)
+            value = int(fingerprint, 16)
+            for band in range(FINGERPRINT_BITS // BAND_BITS):
+                band_key = (band, value >> (band * BAND_BITS) & ((1 << BAND_BITS) - 1))
+                self._band_buckets.setdefault(band_key, []).append(fingerprint)
+
+    def add_row(self, row):
+        """
+        Adds an extracted row, using its URL, Page Title and Content Fingerprint.
+
+        Args:
+            row (dict): The extracted information of a page.
+        """
+        self.add(row["URL"], row["Page Title"], row.get("Content Fingerprint"))
+
+    def groups(self, kind=None):
+        """
+        Returns the duplicate groups, every group has at least two URLs.
+
+        Args:
+            kind (str, optional): 'title', 'slug', 'url', 'content' or 'near-content'. Defaults to None (all kinds).
+
+        Returns:
+            list of DuplicateGroup: (kind, key, urls) of every group, in the order the pages were added.
+        """
+        kinds = self.KINDS if kind is None else (kind,)
+        groups = []
+        for group_kind in kinds:
+            if group_kind == 'near-content':
+                groups.extend(self._near_duplicate_groups())
+                continue
+            groups.extend(
+                DuplicateGroup(group_kind, key, urls)
+                for key, urls in self._urls_by_key[group_kind].items() if len(urls) > 1
+            )
+        return groups
+
+    def report(self):
+        """
+        Returns all duplicate groups.
+
+        Returns:
+            list of DuplicateGroup: The groups of all kinds.
+        """
+        return self.groups()
+
+    def write_report(self, sink):
+        """
+        Writes all duplicate groups to an output sink created with REPORT_FIELDNAMES.
+
+        Args:
+            sink (OutputSink): The sink, it is flushed but not closed.
+
+        Returns:
+            int: Number of groups written.
+        """
+        groups = self.report()
+        for group in groups:
+            sink.write_row({"Kind": group.kind, "Key": group.key, "Count": len(group.urls), "URLs": " ".join(group.urls)})
+        sink.flush()
+        return len(groups)
+
+    def _near_duplicate_groups(self):
+        """
+        Groups the distinct fingerprints within max_distance bits of each other.
+        Only fingerprints sharing a band bucket are compared, the groups are joined transitively.
+        """
+        parents = {fingerprint: fingerprint for fingerprint in self._fingerprints}
+
+        def find(fingerprint):
+            while parents[fingerprint] != fingerprint:
+                parents[fingerprint] = parents[parents[fingerprint]]
+                fingerprint = parents[fingerprint]
+            return fingerprint
+
+        for bucket in self._band_buckets.values():
+            for i, first in enumerate(bucket):
+                first_value = int(first, 16)
+                for second in bucket[i + 1:]:
+                    if bin(first_value ^ int(second, 16)).count('1') <= self.max_distance:
+                        parents[find(second)] = find(first)
+
+        members = {}
+        for fingerprint in self._fingerprints:
+            members.setdefault(find(fingerprint), []).append(fingerprint)
+        groups = []
+        for root, fingerprints in members.items():
+            if len(fingerprints) < 2:
+                continue
+            urls = [url for fingerprint in fingerprints for url in self._urls_by_key['content'][fingerprint]]
+            groups.append(DuplicateGroup('near-content', root, urls))
+        return groups
+
+
+# Example usage
+if __name__ == "__main__":
+    text = " ".join(f"Die Familienausgleichskasse zahlt die Zulagen im Monat {i} aus." for i in range(10))
+    analyzer = DuplicateAnalyzer()
+    analyzer.add('https://www.eak.admin.ch/eak/de/home/a.html', 'Zulagen', simhash(text))
+    analyzer.add('https://www.eak.admin.ch/eak/de/home/b/a.html', 'Zulagen', simhash(text + " Neu."))
+    analyzer.add('https://WWW.eak.admin.ch/eak/de/home/a.html#top', 'Beiträge', simhash("zu kurz"))
+    for group in analyzer.report():
+        print(group)
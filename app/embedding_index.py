@@ -0,0 +1,320 @@
+""" A module to embed the content of the extracted pages and to find similar pages. """
+import json
+import os
+import sqlite3
+import threading
+import numpy as np
+from crawl_state import hash_content
+
+DEFAULT_EMBEDDING_MODEL = "intfloat/e5-base-v2"
+
+class SentenceTransformerEncoder:
+    """
+    Encodes texts with a sentence-transformers model on the CPU.
+    The model is loaded on first use, so that sentence-transformers is only imported when embeddings are needed.
+    e5 models expect the prefixes "passage: " for indexed texts and "query: " for queries.
+
+    Attributes:
+        model_name (str): The name of the model.
+        batch_size (int): Number of texts encoded at once.
+
+    Methods:
+        encode(texts, query=False): Returns the normalized embeddings of the texts.
+    """
+
+    def __init__(self, model_name=DEFAULT_EMBEDDING_MODEL, batch_size=32):
+        """
+        Initializes the encoder.
+
+        Args:
+            model_name (str): The name of the model. Defaults to "intfloat/e5-base-v2".
+            batch_size (int): Number of texts encoded at once. Defaults to 32.
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def encode(self, texts, query=False):
+        """
+        Returns the normalized embeddings of the texts.
+
+        Args:
+            texts (list of str): The texts.
+            query (bool): Whether the texts are queries. Defaults to False (indexed texts).
+
+        Returns:
+            numpy.ndarray: One float32 row of unit length per text.
+        """
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name, device="cpu")
+        if "e5" in self.model_name:
+            texts = [("query: " if query else "passage: ") + text for text in texts]
+        return self._model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+class EmbeddingIndex:
+    """
+    A persistent index of page embeddings: a memory-mapped NumPy matrix with one row per page
+    and a SQLite table mapping the URLs to their row and content hash.
+
+    Pages are embedded in batches, a page whose content hash is unchanged is not embedded again.
+    Similarity queries are a matrix product over the normalized embeddings (cosine similarity).
+    For large sites, build_approximate_index() adds random-hyperplane LSH tables, so that only
+    the pages in the same buckets are compared.
+
+    Attributes:
+        directory (str): Directory of embeddings.npy and embeddings.sqlite.
+        encoder (SentenceTransformerEncoder): Encodes the texts.
+        batch_size (int): Number of pages embedded at once.
+        dimension (int): Length of an embedding, known after the first batch.
+
+    Methods:
+        add(url, text): Queues a page for embedding, unchanged pages are skipped.
+        flush(): Embeds the queued pages.
+        similar_to(url, k=10, approximate=False): Returns the pages most similar to an indexed page.
+        search(text, k=10, approximate=False): Returns the pages most similar to a text.
+        near_duplicates(threshold=0.95): Returns the pairs of pages with nearly the same content.
+        build_approximate_index(bits=16, tables=4): Builds the LSH tables for approximate queries.
+        close(): Embeds the queued pages and closes the files.
+    """
+
+    def __init__(self, directory, encoder=None, batch_size=32):
+        """
+        Initializes the EmbeddingIndex and opens the files in the directory if they exist.
+
+        Args:
+            directory (str): Directory of the index files, created if needed.
+            encoder (object, optional): Has encode(texts, query=False). Defaults to a SentenceTransformerEncoder.
+            batch_size (int): Number of pages embedded at once. Defaults to 32.
+        """
+        self.directory = directory
+        self.encoder = encoder or SentenceTransformerEncoder(batch_size=batch_size)
+        self.batch_size = batch_size
+        self.embedded = 0
+        self.skipped = 0
+        os.makedirs(directory, exist_ok=True)
+        self._matrix_path = os.path.join(directory, "embeddings.npy")
+        self._lock = threading.Lock()
+        self._queue = {}
+        self._lsh = None
+        self._db = sqlite3.connect(os.path.join(directory, "embeddings.sqlite"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS page (url TEXT PRIMARY KEY, position INTEGER UNIQUE, content_hash TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value TEXT)")
+        model_name = getattr(self.encoder, 'model_name', None)
+        stored_model = self._db.execute("SELECT value FROM info WHERE name = 'model'").fetchone()
+        if stored_model is not None and json.loads(stored_model[0]) != model_name:
+            # embeddings of another model are not comparable, the index is built again
+            self._db.execute("DELETE FROM page")
+            if os.path.exists(self._matrix_path):
+                os.remove(self._matrix_path)
+        self._db.execute("INSERT OR REPLACE INTO info VALUES ('model', ?)", (json.dumps(model_name),))
+        self._db.commit()
+        self._urls = [url for url, in self._db.execute("SELECT url FROM page ORDER BY position")]
+        self._positions = {url: position for position, url in enumerate(self._urls)}
+        self._hashes = dict(self._db.execute("SELECT url, content_hash FROM page"))
+        self._matrix = np.load(self._matrix_path, mmap_mode="r+") if os.path.exists(self._matrix_path) else None
+        self.dimension = self._matrix.shape[1] if self._matrix is not None else None
+
+    def add(self, url, text):
+        """
+        Queues a page for embedding and embeds the queue once it holds batch_size pages.
+        Pages whose content hash is unchanged since they were embedded are skipped.
+
+        Args:
+            url (str): The URL of the page.
+            text (str): The text of the page, e.g. its lead and main content.
+        """
+        content_hash = hash_content(text)
+        with self._lock:
+            if self._hashes.get(url) == content_hash:
+                self.skipped += 1
+                return
+            self._queue[url] = (text, content_hash)
+            if len(self._queue) < self.batch_size:
+                return
+            batch, self._queue = self._queue, {}
+        self._embed(batch)
+
+    def flush(self):
+        """
+        Embeds the queued pages.
+        """
+        with self._lock:
+            batch, self._queue = self._queue, {}
+        if batch:
+            self._embed(batch)
+
+    def _embed(self, batch):
+        """
+        Encodes a batch of pages outside the lock and writes their rows.
+        """
+        urls = list(batch)
+        embeddings = self.encoder.encode([batch[url][0] for url in urls])
+        with self._lock:
+            for url, embedding in zip(urls, embeddings):
+                position = self._positions.get(url)
+                if position is None:
+                    position = len(self._urls)
+                    self._ensure_capacity(position + 1, len(embedding))
+                    self._urls.append(url)
+                    self._positions[url] = position
+                self._matrix[position] = embedding
+                self._hashes[url] = batch[url][1]
+                self._db.execute("INSERT OR REPLACE INTO page VALUES (?, ?, ?)", (url, position, batch[url][1]))
+            self._matrix.flush()
+            self._db.commit()
+            self.embedded += len(urls)
+            self._lsh = None  # the approximate index does not know the new rows
+
+    def _ensure_capacity(self, rows, dimension):
+        """
+        Grows the memory-mapped matrix, doubling its rows so that adding pages stays cheap.
+        """
+        if self._matrix is not None and self._matrix.shape[0] >= rows:
+            return
+        capacity = max(1024, rows, 2 * (self._matrix.shape[0] if self._matrix is not None else 0))
+        temporary_path = self._matrix_path + ".tmp.npy"
+        grown = np.lib.format.open_memmap(temporary_path, mode="w+", dtype=np.float32, shape=(capacity, dimension))
+        if self._matrix is not None:
+            grown[:len(self._urls)] = self._matrix[:len(self._urls)]
+            del self._matrix
+        grown.flush()
+        del grown
+        os.replace(temporary_path, self._matrix_path)
+        self._matrix = np.load(self._matrix_path, mmap_mode="r+")
+        self.dimension = dimension
+
+    def _embeddings(self):
+        return self._matrix[:len(self._urls)] if self._matrix is not None else np.zeros((0, self.dimension or 0), np.float32)
+
+    def _top_k(self, query, k, exclude=None, approximate=False):
+        """
+        Returns the k rows with the highest cosine similarity to the query embedding.
+        """
+        embeddings = self._embeddings()
+        if approximate:
+            candidates = self._candidates(query)
+            scores = embeddings[candidates] @ query
+        else:
+            candidates = np.arange(len(embeddings))
+            scores = embeddings @ query
+        if exclude is not None:
+            scores = np.where(candidates == exclude, -np.inf, scores)
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self._urls[candidates[i]], float(scores[i])) for i in best]
+
+    def similar_to(self, url, k=10, approximate=False):
+        """
+        Returns the pages most similar to an indexed page.
+
+        Args:
+            url (str): The URL of an indexed page.
+            k (int): Number of pages. Defaults to 10.
+            approximate (bool): Whether to compare only the pages in the same LSH buckets. Defaults to False.
+
+        Returns:
+            list of tuple: (url, cosine similarity) of the most similar pages, the page itself excluded.
+
+        Raises:
+            KeyError: If the URL is not indexed.
+        """
+        position = self._positions[url]
+        return self._top_k(np.array(self._matrix[position]), k, exclude=position, approximate=approximate)
+
+    def search(self, text, k=10, approximate=False):
+        """
+        Returns the pages most similar to a text.
+
+        Args:
+            text (str): The query text.
+            k (int): Number of pages. Defaults to 10.
+            approximate (bool): Whether to compare only the pages in the same LSH buckets. Defaults to False.
+
+        Returns:
+            list of tuple: (url, cosine similarity) of the most similar pages.
+        """
+        return self._top_k(self.encoder.encode([text], query=True)[0], k, approximate=approximate)
+
+    def near_duplicates(self, threshold=0.95, block_size=1024):
+        """
+        Returns the pairs of pages with nearly the same content.
+        The similarity matrix is computed in blocks of rows, so memory stays bounded for large sites.
+
+        Args:
+            threshold (float): Minimum cosine similarity of a pair. Defaults to 0.95.
+            block_size (int): Number of rows compared at once. Defaults to 1024.
+
+        Returns:
+            list of tuple: (url, url, cosine similarity) of every pair, most similar first.
+        """
+        embeddings = self._embeddings()
+        pairs = []
+        for start in range(0, len(embeddings), block_size):
+            scores = embeddings[start:start + block_size] @ embeddings.T
+            rows, columns = np.nonzero(scores >= threshold)
+            for row, column in zip(rows, columns):
+                if start + row < column:
+                    pairs.append((self._urls[start + row], self._urls[column], float(scores[row, column])))
+        return sorted(pairs, key=lambda pair: -pair[2])
+
+    def build_approximate_index(self, bits=16, tables=4, seed=0):
+        """
+        Builds random-hyperplane LSH tables: pages whose embeddings are on the same side of
+        `bits` random hyperplanes share a bucket. A query compares only the pages in its buckets.
+
+        Args:
+            bits (int): Hyperplanes per table. Defaults to 16.
+            tables (int): Number of tables, more tables find more neighbours. Defaults to 4.
+            seed (int): Seed of the hyperplanes. Defaults to 0.
+        """
+        embeddings = self._embeddings()
+        rng = np.random.default_rng(seed)
+        planes = rng.standard_normal((tables, embeddings.shape[1], bits)).astype(np.float32)
+        weights = 1 << np.arange(bits, dtype=np.int64)
+        buckets = []
+        for table in range(tables):
+            signatures = ((embeddings @ planes[table]) > 0) @ weights
+            order = np.argsort(signatures, kind="stable")
+            keys, starts = np.unique(signatures[order], return_index=True)
+            buckets.append({int(key): order[begin:end] for key, begin, end in zip(keys, starts, list(starts[1:]) + [len(order)])})
+        self._lsh = (planes, weights, buckets)
+
+    def _candidates(self, query):
+        """
+        Returns the rows sharing at least one LSH bucket with the query.
+        """
+        if self._lsh is None:
+            self.build_approximate_index()
+        planes, weights, buckets = self._lsh
+        found = [buckets[table].get(int(((query @ planes[table]) > 0) @ weights)) for table in range(len(buckets))]
+        found = [rows for rows in found if rows is not None]
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def close(self):
+        """
+        Embeds the queued pages and closes the files.
+        """
+        self.flush()
+        with self._lock:
+            self._db.close()
+            self._matrix = None
+
+
+# Example usage
+if __name__ == "__main__":
+    index = EmbeddingIndex("embeddings")
+    index.add("https://www.eak.admin.ch/eak/de/home/Firmen/Familienzulagen.html", "Familienzulagen für Angestellte des Bundes.")
+    index.add("https://www.eak.admin.ch/eak/de/home/Private/Familienzulagen.html", "Familienzulagen für Eltern.")
+    index.add("https://www.eak.admin.ch/eak/de/home/Firmen/Beitraege.html", "Beiträge und Löhne abrechnen.")
+    index.flush()
+    print(index.similar_to("https://www.eak.admin.ch/eak/de/home/Firmen/Familienzulagen.html", k=2))
+    print(index.search("Kinderzulage", k=2))
+    print(index.near_duplicates(threshold=0.9))
+    index.close()
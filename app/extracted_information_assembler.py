@@ -1,8 +1,35 @@
-import csv
+import threading
 from sitemap_parser import SitemapParser
 from html_parser import HTMLParser
+from dom_extractor import DOMExtractor, DEFAULT_BACKEND
 from content_analyzer import ContentAnalyzer
-from content_analyzer_ai import AIContentAnalyzer
+from crawl_executor import CrawlExecutor
+from http_transport import HTTPTransport
+from image_probe import ImageProber
+from crawl_state import PageState, hash_content
+from output_sinks import CSVSink, create_sink, read_rows
+from duplicate_analyzer import DuplicateAnalyzer
+from metrics import Metrics
+from page_analyzer import PageAnalyzer, FetchedPage, init_process_analyzer, analyze_in_process
+from staged_pipeline import StagedPipeline, Stage, Finished
+
+# The columns of the extracted data, fixed up front so that rows can be written while crawling
+FIELDNAMES = [
+    "URL",
+    "Page Title",
+    "URL Keywords",
+    "URL Thema",
+    "URL Depth",
+    "Content Keywords",
+    "Lead Keywords",
+    "Page Leadtext",
+    "Page Modified Date",
+    "Have iframe",
+    "Have image",
+    "Have image with bad resolution",
+    "Have video",
+    "Page number of words",
+]
 
 class ExtractedInformationAssembler:
     """
@@ -15,13 +42,35 @@ class ExtractedInformationAssembler:
         rules_for_content (dict): Rules for content keyword analysis.
         filter_str (str): String to filter URLs in the sitemap.
         content_class (str): CSS class name to identify the main content on a webpage.
+        transport (HTTPTransport): The pooled HTTP transport shared by all fetchers.
+        image_prober (ImageProber): Determines image dimensions from their first bytes.
+        crawl_executor (CrawlExecutor): Runs the extraction of the URLs with bounded concurrency.
+        failed_urls (list of tuple): (url, error message) for every URL whose extraction failed.
+        state_store (CrawlStateStore): State of the last crawl for incremental recrawls, None crawls everything.
+        sink (OutputSink): Receives every row as soon as it is extracted, None keeps the rows in memory only.
+        keep_rows (bool): If False, rows are not kept in extracted_data, so memory does not grow with the site.
+        duplicate_analyzer (DuplicateAnalyzer): Groups the extracted pages by title, slug, URL and content.
+        journal (CheckpointJournal): Records the status and the row of every URL, None runs without checkpoints.
+        ai_analyzer (AIContentAnalyzer): Answers the prompts for the main content of every page, None skips the AI analysis.
+        embedding_index (EmbeddingIndex): Embeds the lead and main content of every analyzed page, None skips the embeddings.
+        metrics (Metrics): Measures the time per stage, the pages and the requests of the extraction.
+        page_analyzer (PageAnalyzer): Parses and analyzes the fetched pages in the crawl threads.
+        analysis_processes (int): Number of processes analyzing the fetched pages, 0 analyzes them in the crawl threads.
+        pipeline (StagedPipeline): The pipeline of the last extraction with analysis processes, None without.
 
     Methods:
-        extract_information(): Extracts and stores information from filtered URLs.
+        extract_information(resume=False): Extracts and stores information from filtered URLs.
+        do_we_have_dublicates(): Reports the pages with the same title.
+        do_we_have_duplicated_slugs(): Reports the pages with the same slug.
         save_to_csv(filename): Saves the extracted information to a CSV file.
+        retag_output(input_path, output_path=None): Tags the rows of an extracted output file again with the current rules.
     """
 
-    def __init__(self, sitemap_url, rules_for_url, rules_for_thema_by_url, rules_for_content, filter_urls_by, content_class, prompts_to_process, sitemap_url_k):
+    def __init__(self, sitemap_url, rules_for_url, rules_for_thema_by_url, rules_for_content, filter_urls_by, content_class, prompts_to_process, sitemap_url_k,
+                 max_workers=1, max_workers_per_host=None, transport=None, image_prober=None, state_store=None,
+                 sink=None, keep_rows=True, duplicate_analyzer=None, journal=None,
+                 ai_analyzer=None, embedding_index=None, metrics=None, analysis_processes=0, crawl_executor=None,
+                 parser_backend=DEFAULT_BACKEND):
         """
         Initializes the ExtractedInformationAssembler with all necessary components.
 
@@ -31,103 +80,443 @@ class ExtractedInformationAssembler:
             rules_for_content (dict): Rules for content keyword analysis.
             filter_str (str): String to filter URLs in the sitemap.
             content_class (str): CSS class name to identify the main content on a webpage.
+            max_workers (int): Maximum number of pages extracted concurrently. Defaults to 1 (sequential).
+            max_workers_per_host (int, optional): Maximum number of pages extracted concurrently per host.
+            transport (HTTPTransport, optional): The HTTP transport shared by all fetchers.
+                                                 Defaults to a new HTTPTransport with one keep-alive connection per worker.
+            image_prober (ImageProber, optional): Determines image dimensions. Defaults to an ImageProber on the transport.
+            state_store (CrawlStateStore, optional): State of the last crawl. If given, unchanged pages reuse their
+                                                     previous row instead of being analyzed again. Defaults to None.
+            sink (OutputSink, optional): Receives every row, in sitemap order, as soon as it is extracted. Defaults to None.
+            keep_rows (bool): If False, rows are only written to the sink and not kept in extracted_data. Defaults to True.
+            duplicate_analyzer (DuplicateAnalyzer, optional): Receives every row for the duplicate checks.
+                                                              Defaults to a new DuplicateAnalyzer.
+            journal (CheckpointJournal, optional): Checkpoints every finished row, so that an interrupted run
+                                                   can be resumed. Defaults to None.
+            ai_analyzer (AIContentAnalyzer, optional): Adds one column per prompt with its answer for the main content.
+                                                       Defaults to None (no AI analysis).
+            embedding_index (EmbeddingIndex, optional): Receives the lead and main content of every analyzed page.
+                                                        Defaults to None (no embeddings).
+            metrics (Metrics, optional): Measures the stages of the extraction, pass the Metrics of the transport
+                                         to get the requests per host as well. Defaults to new Metrics.
+            analysis_processes (int): If greater than 0, the pages are fetched by max_workers threads and parsed and
+                                      analyzed by this many processes at the same time, so that the analysis uses
+                                      all cores. Defaults to 0 (fetch and analyze in the crawl threads).
+            crawl_executor (CrawlExecutor, optional): Runs the extraction of the URLs, e.g. on threads shared with
+                                                      other sites. Defaults to a new CrawlExecutor with max_workers
+                                                      and max_workers_per_host.
+            parser_backend (str): The HTML parser of the pages, 'html.parser' or 'lxml'. Defaults to 'html.parser'.
         """
-        self.sitemap_parser = SitemapParser(sitemap_url)
-        self.html_parser = HTMLParser()
-        self.url_analyzer = ContentAnalyzer(rules_for_url)
-        self.url_analyzer_for_thema = ContentAnalyzer(rules_for_thema_by_url)
-        self.content_analyzer = ContentAnalyzer(rules_for_content)
+        self.metrics = metrics or Metrics()
+        self.transport = transport or HTTPTransport(pool_maxsize=max(10, max_workers), metrics=self.metrics)
+        self.sitemap_parser = SitemapParser(sitemap_url, transport=self.transport)
+        self.html_parser = HTMLParser(extractor=DOMExtractor(backend=parser_backend), transport=self.transport)
+        self.url_analyzer = ContentAnalyzer(rules_for_url, transport=self.transport)
+        self.url_analyzer_for_thema = ContentAnalyzer(rules_for_thema_by_url, transport=self.transport)
+        self.image_prober = image_prober or ImageProber(self.transport)
+        self.content_analyzer = ContentAnalyzer(rules_for_content, transport=self.transport, image_prober=self.image_prober)
         self.prompts_to_process = prompts_to_process
         self.filter_str = filter_urls_by
         self.k = sitemap_url_k
         self.content_class = content_class
+        self.crawl_executor = crawl_executor or CrawlExecutor(max_workers, max_workers_per_host)
+        self.page_analyzer = PageAnalyzer(self.url_analyzer, self.url_analyzer_for_thema, self.content_analyzer,
+                                          content_class, metrics=self.metrics)
+        self.analysis_processes = analysis_processes
+        self._analysis_rules = (rules_for_url, rules_for_thema_by_url, rules_for_content, content_class)
+        self.pipeline = None
+        self.state_store = state_store
+        self.ai_analyzer = ai_analyzer
+        self.embedding_index = embedding_index
+        self.fieldnames = FIELDNAMES + (list(ai_analyzer.prompts) if ai_analyzer else [])
+        # the stored main content can only be tagged again if it was extracted the same way
+        self.extraction_hash = hash_content([content_class, parser_backend])
+        # rows of an earlier crawl are only reused if they were produced by the same rules and parser
+        self.rules_hash = hash_content([rules_for_url, rules_for_thema_by_url, rules_for_content, content_class, parser_backend]
+                                       + ([ai_analyzer.prompts, ai_analyzer.model_id] if ai_analyzer else []))
+        self.sitemap_lastmods = {}
+        self.reused_pages = 0
+        self._reused_pages_lock = threading.Lock()
+        self.sink = sink
+        self.keep_rows = keep_rows
+        self.duplicate_analyzer = duplicate_analyzer or DuplicateAnalyzer()
+        self.journal = journal
         self.extracted_data = []
+        self.failed_urls = []
 
     def do_we_have_dublicates(self):
         """
-        Checks if we have dublicated page_title in the extracted_data.
+        Checks if we have dublicated page_title in the extracted pages and prints every group.
 
         Returns: True if we have dublicates, otherwise False.
 
         """
-        for i in range(len(self.extracted_data)):
-            for j in range(i+1, len(self.extracted_data)):
-                if self.extracted_data[i]['Page Title'] == self.extracted_data[j]['Page Title']:
-                    print(f"Page Title {self.extracted_data[i]['Page Title']} is dublicated in {self.extracted_data[i]['URL']} and {self.extracted_data[j]['URL']}")
-                    return True
-        print("We don't have dublicates")
-        return False
+        groups = self.duplicate_analyzer.groups('title')
+        for group in groups:
+            print(f"Page Title {group.key} is dublicated in {', '.join(group.urls)}")
+        if not groups:
+            print("We don't have dublicates")
+        return bool(groups)
 
     def do_we_have_duplicated_slugs(self):
         """
-        Checks if we have duplicated slugs in the extracted_data.
+        Checks if we have duplicated slugs in the extracted pages and prints every group.
 
         Returns: True if we have duplicates, otherwise False.
         """
-        slugs = [data['URL'].split('/')[-1].lower() for data in self.extracted_data]
-
-        for i in range(len(slugs)):
-            for j in range(i + 1, len(slugs)):
-                if slugs[i] == slugs[j]:
-                    print(f"Slug {self.extracted_data[i]['Page Title']} is duplicated in {self.extracted_data[i]['URL']} and {self.extracted_data[j]['URL']}")
-                    return True
-
-        print("We don't have duplicates in the Slug")
-        return False
+        groups = self.duplicate_analyzer.groups('slug')
+        for group in groups:
+            print(f"Slug {group.key} is duplicated in {', '.join(group.urls)}")
+        if not groups:
+            print("We don't have duplicates in the Slug")
+        return bool(groups)
 
-    def extract_information(self):
+    def extract_information(self, resume=False):
         """
         Extracts information from the URLs in the sitemap that match the filter string.
         For each URL, extracts the page title, page lead, page content, and analyzes URL and content keywords.
-        Stores the extracted information internally.
+        Pages are extracted concurrently according to the crawl limits, the rows are stored in sitemap order.
+        A failing URL is recorded in failed_urls and does not stop the extraction of the others.
+        With a state store, pages unchanged since the last crawl reuse their previous row.
+        With a journal, every finished row is checkpointed. A resumed run replays the rows of the completed URLs
+        in sitemap order and extracts only the failed and pending ones, so its output equals an uninterrupted run.
+        With analysis processes, fetching, analysis and finishing of the rows run as a staged pipeline.
+
+        Args:
+            resume (bool): Whether to resume the run recorded in the journal. Defaults to False.
         """
         try:
-            filtered_urls = self.sitemap_parser.get_urls(filter_str=self.filter_str, k=self.k)
-            for url in filtered_urls:
-
-                print(f"Extracting information from ...{url[-50:]}")
-                # no llm stuff
-                page_title = self.html_parser.get_title(url)
-                page_html_content = self.html_parser.get_html(url)
-                page_content = self.html_parser.get_content_by_class(url, self.content_class)
-                page_lead = self.html_parser.get_content_by_class_lead(url)
-                page_last_modified_date = self.html_parser.get_last_modified_date_by_class_text_dimmed(url)
-                url_keywords = self.url_analyzer.analyze_url(url)
-                url_thema = self.url_analyzer_for_thema.analyze_url(url)
-                url_depth = self.url_analyzer.analyze_url_depth(url)
-                page_numer_of_words = self.content_analyzer.analyze_count_of_words(page_content) 
-                page_content_keywords = self.content_analyzer.analyze_content(page_content)
-                page_lead_keywords = self.content_analyzer.analyze_content(page_lead)
-                page_have_iframe = self.content_analyzer.analyze_html_content_if_iframe(page_html_content)
-                page_have_image = self.content_analyzer.analyze_html_content_if_image(page_html_content)
-                page_have_video = self.content_analyzer.analyze_html_content_if_video(page_html_content)
-                is_image_resolution_not_ok = self.content_analyzer.analyze_list_of_image_urls(page_have_image)
-                # llm stuff
-                # llm_processor = AIContentAnalyzer(self.prompts_to_process, url)
-                # result_prompt1 = llm_processor.processes_content_by_llm("Prompt1")
-                # result_prompt2 = llm_processor.processes_content_by_llm("Prompt2")
-                
-                
-                self.extracted_data.append({
-                    "URL": url,
-                    "Page Title": page_title,
-                    "URL Keywords": url_keywords,
-                    "URL Thema": url_thema,
-                    "URL Depth": url_depth,
-                    "Content Keywords": page_content_keywords,
-                    "Lead Keywords": page_lead_keywords,
-                    "Page Leadtext": page_lead,
-                    "Page Modified Date": page_last_modified_date,
-                    "Have iframe": page_have_iframe,
-                    "Have image": page_have_image,
-                    "Have image with bad resolution": is_image_resolution_not_ok,
-                    "Have video": page_have_video,
-                    "Page number of words": page_numer_of_words,
-                    # "Prompt1": result_prompt1, #AI-Stuff
-                    # "Prompt2": result_prompt2, #AI-Stuff
-                })
+            with self.metrics.stage("sitemap"):
+                entries = self.sitemap_parser.get_entries(filter_str=self.filter_str, k=self.k)
         except Exception as e:
             print(f"An error occurred: {e}")
+            return
+        self.sitemap_lastmods = {entry.loc: entry.lastmod for entry in entries}
+        filtered_urls = [entry.loc for entry in entries]
+        extract = self._extract_row
+        if self.journal is not None:
+            done = self.journal.start(filtered_urls, resume=resume)
+            if resume:
+                print(f"Resuming: {done} URLs already done, {len(filtered_urls) - done} URLs to extract.")
+            extract = self._extract_or_replay_row
+
+        for url, row, error in self._extract_urls(filtered_urls, extract):
+            if error is not None:
+                print(f"An error occurred while extracting ...{url[-50:]}: {error}")
+                self.failed_urls.append((url, str(error)))
+                self.metrics.increment("failed_pages")
+                if self.journal is not None:
+                    self.journal.mark_failed(url, str(error))
+                continue
+            self.metrics.increment("pages")
+            with self.metrics.stage("write"):
+                self._record_row(row)
+        self._finish_extraction(len(filtered_urls))
+
+    def _extract_urls(self, urls, extract=None):
+        """
+        Extracts the URLs with the crawl executor, or with a staged pipeline if analysis processes are set.
+
+        Args:
+            urls (list of str): The URLs to extract the information from.
+            extract (callable, optional): Extracts one URL in the crawl executor. Defaults to _extract_row.
+
+        Returns:
+            iterator: (url, row, error) for every URL in input order.
+        """
+        if self.analysis_processes > 0:
+            return self._run_pipeline(urls)
+        return self.crawl_executor.map(extract or self._extract_row, urls)
+
+    def _finish_extraction(self, url_count):
+        """
+        Flushes the sink and the embeddings and prints the statistics of the extraction.
+
+        Args:
+            url_count (int): Number of URLs of the extraction.
+        """
+        if self.sink is not None:
+            self.sink.flush()
+        if self.embedding_index is not None:
+            self.embedding_index.flush()
+            print(f"Embeddings: {self.embedding_index.embedded} pages embedded, {self.embedding_index.skipped} unchanged pages skipped.")
+
+        if self.state_store is not None:
+            print(f"Incremental: {self.reused_pages} unchanged pages reused, {url_count - self.reused_pages} pages fetched and analyzed.")
+        stats = self.transport.stats()
+        print(f"HTTP: {stats['requests']} requests, {stats['new_connections']} new connections, {stats['reused_connections']} reused connections.")
+        if "throttled" in stats:
+            print(f"Politeness: {stats['throttled']} throttled responses (429/503).")
+        stats = self.image_prober.stats()
+        print(f"Images: {stats['cache_hits']} from cache, {stats['revalidations']} revalidated, "
+              f"{stats['images']} probed, {stats['full_downloads']} full downloads, "
+              f"{stats['bytes_downloaded']} bytes downloaded, {stats['bytes_saved']} bytes saved.")
+        if self.pipeline is not None:
+            for name, stats in self.pipeline.stats().items():
+                print(f"Pipeline {name}: {stats['processed']} pages, {stats['workers']} {'processes' if stats['processes'] else 'threads'}, "
+                      f"{stats['utilization']:.0%} busy, at most {stats['max_queue_depth']} pages waiting.")
+        if self.ai_analyzer is not None:
+            stats = self.ai_analyzer.stats()
+            print(f"AI: {stats['generator_calls']} generator calls, {stats['cache_hits']} answers from cache, {stats['cache_misses']} cache misses.")
+        self.metrics.print_summary()
+
+    def _record_row(self, row):
+        """
+        Writes a finished row to the sink, adds it to the duplicate analysis and keeps it in extracted_data if keep_rows is set.
+
+        Args:
+            row (dict): The extracted information of a page.
+        """
+        self.duplicate_analyzer.add_row(row)
+        if self.sink is not None:
+            self.sink.write_row(row)
+        if self.keep_rows:
+            self.extracted_data.append(row)
+
+    def _extract_or_replay_row(self, url):
+        """
+        Returns the journaled row of a completed URL, or extracts the URL and checkpoints its row.
+
+        Args:
+            url (str): The URL to extract the information from.
+
+        Returns:
+            dict: The extracted information of the page.
+        """
+        row = self.journal.get_row(url)
+        if row is None:
+            row = self._extract_row(url)
+            self.journal.mark_done(url, row)
+        return row
+
+    def _run_pipeline(self, urls):
+        """
+        Extracts the URLs with a staged pipeline: max_workers threads fetch the pages, analysis_processes processes
+        parse and analyze them, and max_workers threads probe the images, run the embeddings and the AI analysis
+        and store the rows.
+
+        Args:
+            urls (list of str): The URLs to extract the information from.
+
+        Yields:
+            tuple: (url, row, error) for every URL in sitemap order.
+        """
+        workers = self.crawl_executor.max_workers
+        self.pipeline = StagedPipeline([
+            Stage("fetch", self._pipeline_fetch, workers=workers),
+            Stage("analyze", analyze_in_process, workers=self.analysis_processes, processes=True,
+                  initializer=init_process_analyzer, initargs=self._analysis_rules),
+            Stage("finish", self._pipeline_finish, workers=workers),
+        ])
+        yield from self.pipeline.run(urls)
+
+    def _pipeline_fetch(self, url):
+        """
+        The fetch stage of the pipeline: replays a journaled row or fetches the page within the per-host limit.
+
+        Args:
+            url (str): The URL to fetch.
+
+        Returns:
+            FetchedPage or Finished: The fetched page, or the finished row of a completed or unchanged page.
+        """
+        if self.journal is not None:
+            row = self.journal.get_row(url)
+            if row is not None:
+                return Finished(row)
+        with self.crawl_executor.host_limiter.limit(url):
+            fetched = self._fetch_page(url)
+        if isinstance(fetched, Finished) and self.journal is not None:
+            self.journal.mark_done(url, fetched.value)
+        return fetched
+
+    def _pipeline_finish(self, analyzed):
+        """
+        The finish stage of the pipeline: completes the row of an analyzed page and checkpoints it.
+
+        Args:
+            analyzed (AnalyzedPage): The page analyzed by a process.
+
+        Returns:
+            dict: The extracted information of the page.
+        """
+        row = self._finish_row(analyzed)
+        if self.journal is not None:
+            self.journal.mark_done(analyzed.url, row)
+        return row
+
+    def _extract_row(self, url):
+        """
+        Extracts the information of one URL: fetch, analysis and finishing of its row.
+
+        Args:
+            url (str): The URL to extract the information from.
+
+        Returns:
+            dict: The extracted information of the page.
+        """
+        fetched = self._fetch_page(url)
+        if isinstance(fetched, Finished):
+            return fetched.value
+        return self._finish_row(self._analyze_page(fetched))
+
+    def _fetch_page(self, url):
+        """
+        Fetches one URL.
+        With a state store, the previous row is reused if the sitemap lastmod is unchanged,
+        if the server answers the conditional request with 304 Not Modified, or if the content hash is unchanged.
+
+        Args:
+            url (str): The URL to fetch.
+
+        Returns:
+            FetchedPage or Finished: The fetched page to analyze, or Finished with the reused row.
+        """
+        if self.state_store is None:
+            print(f"Extracting information from ...{url[-50:]}")
+            with self.metrics.stage("fetch"):
+                page = self.html_parser.get_page(url)
+            return FetchedPage(url, page, None)
+
+        lastmod = self.sitemap_lastmods.get(url)
+        previous = self.state_store.get(url)
+        if previous is not None and previous.rules_hash != self.rules_hash:
+            previous = None
+        if previous is not None and lastmod and previous.lastmod == lastmod:
+            return Finished(self._reuse_row(previous))
+
+        print(f"Extracting information from ...{url[-50:]}")
+        with self.metrics.stage("fetch"):
+            if previous is not None:
+                page = self.html_parser.get_page(url, etag=previous.etag, last_modified=previous.last_modified)
+            else:
+                page = self.html_parser.get_page(url)
+        if page.not_modified:
+            self.state_store.put(previous._replace(lastmod=lastmod))
+            return Finished(self._reuse_row(previous))
+
+        # row and content are added once the page is analyzed
+        state = PageState(url, lastmod, page.etag, page.http_last_modified, hash_content(page.html), self.rules_hash, None, None,
+                          self.extraction_hash)
+        if previous is not None and previous.content_hash == state.content_hash:
+            content = previous.content if previous.content is not None else page.get_content_by_class(self.content_class)
+            self.state_store.put(state._replace(row=previous.row, content=content))
+            return Finished(self._reuse_row(previous))
+        return FetchedPage(url, page, state)
+
+    def _reuse_row(self, previous):
+        """
+        Counts and returns the row of an unchanged page from the last crawl.
+
+        Args:
+            previous (PageState): The state of the page from the last crawl.
+
+        Returns:
+            dict: The extracted information of the page from the last crawl.
+        """
+        with self._reused_pages_lock:
+            self.reused_pages += 1
+        self.metrics.increment("reused_pages")
+        return previous.row
+
+    def _analyze_page(self, fetched):
+        """
+        Parses and analyzes a fetched page in the calling thread.
+
+        Args:
+            fetched (FetchedPage): The fetched page.
+
+        Returns:
+            AnalyzedPage: The analyzed page.
+        """
+        return self.page_analyzer.analyze(fetched)
+
+    def _finish_row(self, analyzed):
+        """
+        Completes the row of an analyzed page with the steps that need the network:
+        image resolutions, embeddings and AI answers, and stores the page in the state store.
+
+        Args:
+            analyzed (AnalyzedPage): The analyzed page.
+
+        Returns:
+            dict: The extracted information of the page.
+        """
+        # stages measured in an analysis process
+        for name, (wall, cpu) in (analyzed.stage_times or {}).items():
+            self.metrics.record_stage(name, wall, cpu)
+        row = analyzed.row
+        with self.metrics.stage("images"):
+            row["Have image with bad resolution"] = self.content_analyzer.analyze_list_of_image_urls(row["Have image"])
+        if self.embedding_index is not None:
+            with self.metrics.stage("embeddings"):
+                self.embedding_index.add(analyzed.url, f"{analyzed.lead}\n{analyzed.content}")
+        # llm stuff
+        if self.ai_analyzer is not None:
+            with self.metrics.stage("ai"):
+                row.update(self.ai_analyzer.answer_prompts(analyzed.content))  # AI-Stuff, one column per prompt
+        if analyzed.state is not None:
+            self.state_store.put(analyzed.state._replace(row=row, content=analyzed.content))
+        return row
+
+    def retag_output(self, input_path, output_path=None, batch_size=2000):
+        """
+        Tags the rows of an extracted output file again with the current rules, without fetching any page.
+        The file is read and written in the format of its extension, .csv, .jsonl or .parquet.
+        URL Keywords, URL Thema, Lead Keywords and Content Keywords are recomputed a batch of rows at a time,
+        the main content comes from the state store. Rows without a stored main content keep their Content Keywords.
+        Updated rows are also written to the state store, so the next incremental crawl does not refetch them.
+        The stored rows keep their rules hash, and are refreshed by the next incremental crawl, with an AI analyzer
+        (the AI columns are not recomputed) and if their content was extracted with another content class or parser.
+
+        Args:
+            input_path (str): Path of the output file written by an earlier run.
+            output_path (str, optional): Path of the retagged output file. Defaults to input_path.
+            batch_size (int): Number of rows tagged at once. Defaults to 2000.
+
+        Returns:
+            int: Number of rows retagged.
+
+        Raises:
+            ValueError: If the format of a path is not supported or the file has no URL column.
+        """
+        output_path = output_path or input_path
+        fieldnames, rows = read_rows(input_path)
+        if "URL" not in fieldnames:
+            raise ValueError(f"{input_path} has no URL column, it is not an output of the extraction.")
+
+        retagged_contents = 0
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            urls = [row["URL"] for row in batch]
+            states = [self.state_store.get(url) if self.state_store is not None else None for url in urls]
+            retagged = {
+                "URL Keywords": self.url_analyzer.analyze_contents(urls),
+                "URL Thema": self.url_analyzer_for_thema.analyze_contents(urls),
+                "Lead Keywords": self.content_analyzer.analyze_contents([row["Page Leadtext"] for row in batch]),
+            }
+            with_content = [i for i, state in enumerate(states) if state is not None and state.content is not None]
+            content_keywords = self.content_analyzer.analyze_contents([states[i].content for i in with_content])
+            retagged["Content Keywords"] = [None] * len(batch)
+            for i, keywords in zip(with_content, content_keywords):
+                retagged["Content Keywords"][i] = keywords
+            retagged_contents += len(with_content)
+
+            for i, row in enumerate(batch):
+                values = {column: keywords[i] for column, keywords in retagged.items() if keywords[i] is not None}
+                row.update(values)
+                if retagged["Content Keywords"][i] is not None:
+                    state = states[i]
+                    # the rules hash also covers the AI prompts and the extraction, neither is redone here
+                    current = self.ai_analyzer is None and state.extraction_hash == self.extraction_hash
+                    rules_hash = self.rules_hash if current else state.rules_hash
+                    self.state_store.put(state._replace(row={**state.row, **values}, rules_hash=rules_hash))
+
+        with create_sink(output_path, fieldnames) as sink:
+            for row in rows:
+                sink.write_row(row)
+        print(f"Retagged {len(rows)} rows ({retagged_contents} with their main content) into {output_path}.")
+        return len(rows)
 
     def save_to_csv(self, filename):
         """
@@ -136,8 +525,6 @@ class ExtractedInformationAssembler:
         Args:
             filename (str): Name of the CSV file to save the data.
         """
-        with open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=self.extracted_data[0].keys())
-            writer.writeheader()
+        with CSVSink(filename, self.fieldnames) as sink:
             for data in self.extracted_data:
-                writer.writerow(data)
+                sink.write_row(data)
@@ -0,0 +1,331 @@
+""" A module to archive raw HTTP responses on disk and to replay them without network access. """
+import gzip
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import requests
+from requests.structures import CaseInsensitiveDict
+from http_transport import HTTPTransport
+
+try:
+    import zstandard
+except ImportError:  # gzip is used instead
+    zstandard = None
+
+# headers that describe the transfer, not the archived (decoded) body
+TRANSFER_HEADERS = ('Content-Encoding', 'Transfer-Encoding', 'Content-Length', 'Connection', 'Keep-Alive')
+
+def _request_key(url, headers):
+    """
+    Returns the archive key of a request: the URL, and the requested range for partial requests.
+    """
+    byte_range = (headers or {}).get('Range')
+    return f"{url} {byte_range}" if byte_range else url
+
+
+class _ArchivedBody(io.BytesIO):
+    """
+    The body of a replayed response, readable like the raw urllib3 response of a streamed request.
+    """
+    decode_content = True
+    auto_close = True
+
+    def stream(self, amt=65536, decode_content=None):
+        while True:
+            chunk = self.read(amt)
+            if not chunk:
+                break
+            yield chunk
+
+    def release_conn(self):
+        pass
+
+
+def build_response(url, status_code, headers, body):
+    """
+    Builds a requests.Response from archived values, it can be read as a whole or as a stream.
+
+    Args:
+        url (str): The URL of the response.
+        status_code (int): The HTTP status code.
+        headers (dict): The response headers.
+        body (bytes): The decoded body.
+
+    Returns:
+        requests.Response: The response.
+    """
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers)
+    response.headers['Content-Length'] = str(len(body))
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.raw = _ArchivedBody(body)
+    response.reason = 'Replayed'
+    return response
+
+
+class HTMLArchive:
+    """
+    A content-addressed archive of raw HTTP responses: every body is stored once, compressed,
+    under the SHA-256 of its bytes, and a SQLite index maps every request to its status, headers and body.
+    Bodies are compressed with zstandard if it is installed and with gzip otherwise.
+
+    Attributes:
+        directory (str): Directory of the archive.
+        compression (str): 'zstd' or 'gzip', used for new bodies.
+
+    Methods:
+        put(url, headers, status_code, response_headers, body): Archives a response.
+        get(url, headers=None): Returns the archived response of a request, or None.
+        stats(): Returns the number of archived responses, bodies and bytes.
+        close(): Closes the index.
+    """
+
+    def __init__(self, directory):
+        """
+        Initializes the HTMLArchive and creates the directory and the index if needed.
+
+        Args:
+            directory (str): Directory of the archive.
+        """
+        self.directory = directory
+        self.compression = 'zstd' if zstandard is not None else 'gzip'
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS response ("
+            "key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, digest TEXT, compression TEXT, fetched_at REAL)"
+        )
+        self._db.commit()
+
+    def _blob_path(self, digest, compression):
+        extension = '.zst' if compression == 'zstd' else '.gz'
+        return os.path.join(self.directory, 'blobs', digest[:2], digest + extension)
+
+    def _write_blob(self, body):
+        """
+        Stores a body under its digest, an identical body is stored only once.
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest, self.compression)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self.compression == 'zstd':
+                data = zstandard.ZstdCompressor(level=10).compress(body)
+            else:
+                data = gzip.compress(body, compresslevel=6)
+            temporary_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary_path, 'wb') as blob:
+                blob.write(data)
+            os.replace(temporary_path, path)
+        return digest
+
+    def _read_blob(self, digest, compression):
+        with open(self._blob_path(digest, compression), 'rb') as blob:
+            data = blob.read()
+        if compression == 'zstd':
+            if zstandard is None:
+                raise ImportError("The archive contains zstd bodies, install zstandard with 'pip install zstandard'.")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def put(self, url, headers, status_code, response_headers, body):
+        """
+        Archives a response.
+
+        Args:
+            url (str): The requested URL.
+            headers (dict): The request headers, the Range header is part of the key.
+            status_code (int): The HTTP status code.
+            response_headers (dict): The response headers.
+            body (bytes): The decoded body.
+        """
+        digest = self._write_blob(body)
+        response_headers = {name: value for name, value in response_headers.items() if name.title() not in TRANSFER_HEADERS}
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (_request_key(url, headers), url, status_code, json.dumps(response_headers), digest, self.compression, time.time()),
+            )
+            self._db.commit()
+
+    def get(self, url, headers=None):
+        """
+        Returns the archived response of a request.
+
+        Args:
+            url (str): The requested URL.
+            headers (dict, optional): The request headers, the Range header is part of the key.
+
+        Returns:
+            requests.Response: The archived response, or None if the request is not archived.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, status, headers, digest, compression FROM response WHERE key = ?", (_request_key(url, headers),)
+            ).fetchone()
+        if row is None:
+            return None
+        archived_url, status_code, response_headers, digest, compression = row
+        return build_response(archived_url, status_code, json.loads(response_headers), self._read_blob(digest, compression))
+
+    def stats(self):
+        """
+        Returns the number of archived responses, distinct bodies and bytes on disk.
+
+        Returns:
+            dict: responses, bodies and bytes_on_disk.
+        """
+        with self._lock:
+            responses, bodies = self._db.execute("SELECT COUNT(*), COUNT(DISTINCT digest) FROM response").fetchone()
+        bytes_on_disk = sum(
+            entry.stat().st_size
+            for prefix in os.scandir(os.path.join(self.directory, 'blobs')) if prefix.is_dir()
+            for entry in os.scandir(prefix.path)
+        )
+        return {"responses": responses, "bodies": bodies, "bytes_on_disk": bytes_on_disk}
+
+    def close(self):
+        """
+        Closes the index.
+        """
+        self._db.close()
+
+
+class ArchivingTransport:
+    """
+    An HTTP transport that fetches like HTTPTransport and stores every response in an archive.
+    Streamed responses are read completely, archived and returned from the archived bytes.
+    304 Not Modified responses are not archived, the archive keeps the last full response,
+    and server errors are not archived either, a later run fetches them again.
+
+    Attributes:
+        transport (HTTPTransport): The transport fetching the responses.
+        archive (HTMLArchive): The archive.
+
+    Methods:
+        get(url, headers=None, stream=False, timeout=None): Fetches and archives a URL.
+        stats(): Returns the statistics of the transport.
+        close(): Closes the transport.
+    """
+
+    def __init__(self, archive, transport=None):
+        """
+        Initializes the ArchivingTransport.
+
+        Args:
+            archive (HTMLArchive): The archive.
+            transport (HTTPTransport, optional): The transport fetching the responses. Defaults to a new HTTPTransport.
+        """
+        self.archive = archive
+        self.transport = transport or HTTPTransport()
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        """
+        Fetches a URL and archives the response.
+
+        Args:
+            url (str): The URL.
+            headers (dict, optional): Additional request headers.
+            stream (bool): Whether the caller reads the body as a stream. Defaults to False.
+            timeout (tuple, optional): Overrides the default timeout.
+
+        Returns:
+            requests.Response: The response.
+        """
+        response = self.transport.get(url, headers=headers, stream=stream, timeout=timeout)
+        if response.status_code == 304 or response.status_code >= 500:
+            return response
+        try:
+            body = response.content  # decoded, also for streamed responses
+        finally:
+            response.close()
+        self.archive.put(url, headers, response.status_code, response.headers, body)
+        return build_response(response.url, response.status_code, response.headers, body)
+
+    def stats(self):
+        return self.transport.stats()
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayTransport:
+    """
+    An HTTP transport that answers every request from an archive, without network access.
+    Conditional request headers are ignored, the archived response is always returned in full.
+
+    Attributes:
+        archive (HTMLArchive): The archive.
+        requests (int): Number of requests answered.
+        missing (int): Number of requests not found in the archive.
+
+    Methods:
+        get(url, headers=None, stream=False, timeout=None): Returns the archived response of a URL.
+        stats(): Returns the statistics of the transport.
+        close(): Does nothing, there is no connection.
+    """
+
+    def __init__(self, archive):
+        """
+        Initializes the ReplayTransport.
+
+        Args:
+            archive (HTMLArchive): The archive.
+        """
+        self.archive = archive
+        self.requests = 0
+        self.missing = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        """
+        Returns the archived response of a URL.
+
+        Args:
+            url (str): The URL.
+            headers (dict, optional): The request headers, only Range is used.
+            stream (bool): Ignored, archived responses can always be streamed.
+            timeout (tuple, optional): Ignored.
+
+        Returns:
+            requests.Response: The archived response.
+
+        Raises:
+            requests.ConnectionError: If the URL is not in the archive.
+        """
+        response = self.archive.get(url, headers)
+        with self._lock:
+            self.requests += 1
+            if response is None:
+                self.missing += 1
+        if response is None:
+            raise requests.ConnectionError(f"{url} is not in the archive {self.archive.directory}")
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "new_connections": 0, "reused_connections": 0, "missing": self.missing}
+
+    def close(self):
+        pass
+
+
+# Example usage
+if __name__ == "__main__":
+    archive = HTMLArchive("html_archive")
+    url = 'https://www.eak.admin.ch/eak/de/home.html'
+    try:
+        response = ArchivingTransport(archive).get(url)
+        print(response.status_code, len(response.content), archive.stats())
+    except requests.RequestException as e:
+        print(f"An error occurred: {e}")
+    replayed = ReplayTransport(archive).get(url)
+    print(replayed.status_code, replayed.text[:80])
@@ -1,5 +1,7 @@
 import requests
-from bs4 import BeautifulSoup
+from dom_extractor import DOMExtractor
+from http_transport import HTTPTransport
+from page_snapshot import PageSnapshot
 
 class HTMLParser:
     """
@@ -7,30 +9,93 @@ class HTMLParser:
 
     Methods:
         get_html(url): Retrieves the raw HTML content of the specified URL.
+        get_page(url): Fetches the specified URL once and returns a PageSnapshot of it.
         get_title(url): Extracts the title of the web page from the specified URL.
         get_content_by_class(url, css_class): Extracts content from all elements with the specified CSS class.
     """
 
-    def get_html(self, url):
+    def __init__(self, extractor=None, transport=None):
         """
-        Fetches the raw HTML content from a specified URL.
+        Initializes the HTMLParser.
 
         Args:
-            url (str): The URL from which to fetch the HTML content.
+            extractor (DOMExtractor, optional): The extractor shared by all fetched pages. Defaults to a new DOMExtractor.
+            transport (HTTPTransport, optional): The HTTP transport to use. Defaults to a new HTTPTransport.
+        """
+        self.extractor = extractor or DOMExtractor()
+        self.transport = transport or HTTPTransport()
+
+    def _fetch(self, url, headers=None):
+        """
+        Fetches a URL and raises for HTTP errors.
+
+        Args:
+            url (str): The URL to fetch.
+            headers (dict, optional): Additional request headers, e.g. for conditional requests.
 
         Returns:
-            str: The raw HTML content.
+            requests.Response: The response.
 
         Raises:
             requests.RequestException: If there is an issue with network access or HTTP error.
         """
         try:
-            response = requests.get(url)
+            response = self.transport.get(url, headers=headers)
             response.raise_for_status()
-            return response.text
+            return response
         except requests.RequestException as e:
             raise requests.RequestException(f"Failed to retrieve HTML content: {e}")
 
+    def get_html(self, url):
+        """
+        Fetches the raw HTML content from a specified URL.
+
+        Args:
+            url (str): The URL from which to fetch the HTML content.
+
+        Returns:
+            str: The raw HTML content.
+
+        Raises:
+            requests.RequestException: If there is an issue with network access or HTTP error.
+        """
+        return self._fetch(url).text
+
+    def get_page(self, url, etag=None, last_modified=None):
+        """
+        Fetches a web page once and returns a snapshot of it.
+        Title, lead, content by class, last modified date and raw HTML of the page
+        can then be read from the snapshot without any further HTTP request.
+
+        If etag or last_modified of an earlier fetch are given, the page is requested conditionally
+        with If-None-Match / If-Modified-Since and the snapshot is marked not_modified on a 304 response.
+
+        Args:
+            url (str): The URL of the web page to fetch.
+            etag (str, optional): The ETag of an earlier fetch of the page.
+            last_modified (str, optional): The Last-Modified header of an earlier fetch of the page.
+
+        Returns:
+            PageSnapshot: A snapshot of the fetched web page.
+
+        Raises:
+            requests.RequestException: If there is an issue with network access or HTTP error.
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        response = self._fetch(url, headers=headers)
+        return PageSnapshot(
+            url,
+            response.text,
+            self.extractor,
+            not_modified=response.status_code == 304,
+            etag=response.headers.get('ETag', etag),
+            http_last_modified=response.headers.get('Last-Modified', last_modified),
+        )
+
     def get_title(self, url):
         """
         Extracts the title of a web page from its HTML content.
@@ -45,10 +110,7 @@ class HTMLParser:
             requests.RequestException: If there is an issue with network access or HTTP error.
         """
         try:
-            html_content = self.get_html(url)
-            soup = BeautifulSoup(html_content, 'html.parser')
-            title = soup.title.string if soup.title else 'No title found'
-            return title
+            return self.get_page(url).title
         except requests.RequestException as e:
             raise requests.RequestException(f"Failed to retrieve page title: {e}")
 
@@ -67,12 +129,7 @@ class HTMLParser:
             requests.RequestException: If there is an issue with network access or HTTP error.
         """
         try:
-            html_content = self.get_html(url)
-            soup = BeautifulSoup(html_content, 'html.parser')
-            elements = soup.find_all(class_=css_class)
-            if not elements:
-                return f"{css_class}-class not found"
-            return ' '.join(element.get_text() for element in elements)
+            return self.get_page(url).get_content_by_class(css_class)
         except requests.RequestException as e:
             raise requests.RequestException(f"Failed to retrieve content for class {css_class}: {e}")
 
@@ -99,9 +156,7 @@ class HTMLParser:
         Returns:
             str: Concatenated text content of all elements with the specified CSS class.
         """
-        last_modified_content = self.get_content_by_class(url, 'text-dimmed')
-        last_modified_date = last_modified_content[-10:]
-        return last_modified_date
+        return self.get_page(url).last_modified_date
 
 
 # Example usage
@@ -115,16 +170,13 @@ if __name__ == "__main__":
         # html_content = parser.get_html(TEST_URL)
         # print(f"HTML content:\n{html_content}\n\n")
 
-        page_title = parser.get_title(TEST_URL)
-        print(f"Page title:\n{page_title}")
-
-        page_lead = parser.get_content_by_class_lead(TEST_URL)
-        print(f"Page lead:\n{page_lead}")
+        page = parser.get_page(TEST_URL)
 
-        page_last_modified = parser.get_last_modified_date_by_class_text_dimmed(TEST_URL)
-        print(f"Page last modified:\n{page_last_modified}")
+        print(f"Page title:\n{page.title}")
+        print(f"Page lead:\n{page.lead}")
+        print(f"Page last modified:\n{page.last_modified_date}")
 
-        page_maincontent = parser.get_content_by_class(TEST_URL, 'main-content')
+        page_maincontent = page.get_content_by_class('main-content')
         #print(f"Page main-content:\n{page_maincontent}\n\n")
         
     except Exception as e:
@@ -0,0 +1,235 @@
+""" A module providing the shared HTTP transport used by all fetchers. """
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+from request_scheduler import THROTTLING_STATUS_CODES
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+class ConnectionCounter:
+    """
+    A thread-safe counter of HTTP connection usage.
+
+    Attributes:
+        requests (int): Number of requests sent, retries included.
+        new_connections (int): Number of newly opened connections.
+        reused_connections (int): Number of requests sent over an already open keep-alive connection.
+    """
+
+    def __init__(self):
+        """
+        Initializes the ConnectionCounter with all counters at zero.
+        """
+        self.requests = 0
+        self.new_connections = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        """ Counts a request that takes a connection from the pool. """
+        with self._lock:
+            self.requests += 1
+
+    def record_new_connection(self):
+        """ Counts a newly opened connection. """
+        with self._lock:
+            self.new_connections += 1
+
+    @property
+    def reused_connections(self):
+        """ Number of requests that did not need a new connection. """
+        return self.requests - self.new_connections
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter whose connection pools report to a ConnectionCounter.
+    Every request takes a connection from the pool, a new connection is only opened if the pool has none idle.
+    """
+
+    def __init__(self, counter, **kwargs):
+        self.counter = counter
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        counter = self.counter
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _get_conn(self, timeout=None):
+                counter.record_request()
+                return super()._get_conn(timeout)
+
+            def _new_conn(self):
+                counter.record_new_connection()
+                return super()._new_conn()
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _get_conn(self, timeout=None):
+                counter.record_request()
+                return super()._get_conn(timeout)
+
+            def _new_conn(self):
+                counter.record_new_connection()
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+
+class HTTPTransport:
+    """
+    A shared HTTP transport with connection pooling, keep-alive, compressed responses,
+    timeouts and retries with backoff on 429 and 5xx responses.
+
+    Attributes:
+        timeout (tuple): (connect timeout, read timeout) in seconds for every request.
+        session (requests.Session): The pooled session used for all requests.
+        counter (ConnectionCounter): Counts requests, new and reused connections.
+        metrics (Metrics): Records the duration, size and status of every request per host, None records nothing.
+        scheduler (RequestScheduler): Decides when every request is sent, None sends them at once.
+
+    Methods:
+        get(url, headers=None, stream=False, timeout=None): Sends a GET request over the pooled session.
+        stats(): Returns the connection counters as a dictionary.
+        close(): Closes all pooled connections.
+    """
+
+    def __init__(self, timeout=(5, 30), retries=3, backoff_factor=0.5, pool_maxsize=10, user_agent=None, metrics=None,
+                 scheduler=None):
+        """
+        Initializes the HTTPTransport.
+
+        Args:
+            timeout (float or tuple): Timeout in seconds, or (connect timeout, read timeout). Defaults to (5, 30).
+            retries (int): Number of retries on connection errors, 429 and 5xx responses. Defaults to 3.
+            backoff_factor (float): Backoff factor between retries, a Retry-After header is respected. Defaults to 0.5.
+            pool_maxsize (int): Maximum number of keep-alive connections per host. Defaults to 10.
+            user_agent (str, optional): User-Agent header sent with every request.
+            metrics (Metrics, optional): Records the duration, size and status of every request. Defaults to None.
+            scheduler (RequestScheduler, optional): Every request waits for the scheduler, which follows robots.txt
+                                                    and adapts the rate per host. 429 and 503 responses are then
+                                                    retried through the scheduler, so that it sees them. Defaults to None.
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.metrics = metrics
+        self.scheduler = scheduler
+        self.counter = ConnectionCounter()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[code for code in RETRY_STATUS_CODES if scheduler is None or code not in THROTTLING_STATUS_CODES],
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            # with a scheduler, 429/503 and their Retry-After go to the scheduler instead
+            respect_retry_after_header=scheduler is None,
+            raise_on_status=False,
+        )
+        adapter = _CountingHTTPAdapter(self.counter, pool_connections=10, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # gzip and deflate, plus br if brotli is installed
+        self.session.headers['Accept-Encoding'] = make_headers(accept_encoding=True)['accept-encoding']
+        if user_agent:
+            self.session.headers['User-Agent'] = user_agent
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        """
+        Sends a GET request over the pooled session, when the scheduler allows it.
+
+        Args:
+            url (str): The URL to fetch.
+            headers (dict, optional): Additional request headers.
+            stream (bool): If True, the body is not downloaded until it is read. Defaults to False.
+            timeout (float or tuple, optional): Overrides the default timeout of the transport.
+
+        Returns:
+            requests.Response: The response, after retries.
+
+        Raises:
+            requests.RequestException: If there is an issue with network access.
+            RobotsDisallowedError: If the scheduler follows robots.txt and it disallows the URL.
+        """
+        if self.scheduler is None:
+            return self._send(url, headers, stream, timeout)
+        attempt = 0
+        while True:
+            ticket = self.scheduler.acquire(url)
+            try:
+                response = self._send(url, headers, stream, timeout)
+            except requests.RequestException:
+                self.scheduler.release(ticket, None)
+                raise
+            self.scheduler.release(ticket, response)
+            if response.status_code not in THROTTLING_STATUS_CODES or attempt >= self.retries:
+                return response
+            # the scheduler pauses the host as long as the server asks for
+            response.close()
+            attempt += 1
+
+    def _send(self, url, headers, stream, timeout):
+        if self.metrics is None:
+            return self.session.get(url, headers=headers, stream=stream, timeout=timeout or self.timeout)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, headers=headers, stream=stream, timeout=timeout or self.timeout)
+        except requests.RequestException:
+            self.metrics.record_fetch(url, time.perf_counter() - start, 0, None)
+            raise
+        self.metrics.record_fetch(url, time.perf_counter() - start, _received_bytes(response, stream), response.status_code)
+        return response
+
+    def stats(self):
+        """
+        Returns the connection counters of the transport.
+
+        Returns:
+            dict: Number of requests, new connections and reused connections,
+                  and with a scheduler the number of throttled responses.
+        """
+        stats = {
+            "requests": self.counter.requests,
+            "new_connections": self.counter.new_connections,
+            "reused_connections": self.counter.reused_connections,
+        }
+        if self.scheduler is not None:
+            stats["throttled"] = sum(host["throttled"] for host in self.scheduler.stats().values())
+        return stats
+
+    def close(self):
+        """
+        Closes all pooled connections.
+        """
+        self.session.close()
+
+
+def _received_bytes(response, stream):
+    """
+    Returns the number of bytes received for a response: the bytes read from the connection
+    (before decompression) for a downloaded body, the announced Content-Length for a streamed one.
+    """
+    if not stream:
+        try:
+            return response.raw.tell()
+        except (AttributeError, ValueError):
+            return len(response.content)
+    try:
+        return int(response.headers.get('Content-Length', 0))
+    except ValueError:
+        return 0
+
+
+# Example usage
+if __name__ == "__main__":
+    transport = HTTPTransport(timeout=(3, 10), retries=2)
+    for _ in range(3):
+        response = transport.get('https://www.eak.admin.ch/eak/de/home.html')
+        print(response.status_code, response.headers.get('Content-Encoding'))
+    print(transport.stats())  # 3 requests, 1 new connection, 2 reused
+    transport.close()
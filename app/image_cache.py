@@ -0,0 +1,136 @@
+""" A module to cache image metadata across pages and, optionally, across runs. """
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+ImageMetadata = namedtuple('ImageMetadata', ['width', 'height', 'format', 'content_length', 'etag', 'checked_at'])
+
+class ImageMetadataCache:
+    """
+    A cache of image metadata keyed by URL, with an in-memory LRU tier and an optional SQLite tier
+    that survives between runs.
+
+    Attributes:
+        max_entries (int): Maximum number of entries held in memory.
+        path (str): Path of the SQLite file, None keeps the cache in memory only.
+        revalidate_after (float): Seconds after which an entry has to be revalidated, None means never.
+
+    Methods:
+        get(url): Returns the cached metadata of the URL, or None.
+        put(url, metadata): Stores the metadata of the URL.
+        touch(url): Marks the entry of the URL as checked now.
+        is_fresh(metadata): Returns True if the metadata does not need a revalidation.
+        close(): Closes the SQLite file.
+    """
+
+    def __init__(self, max_entries=10000, path=None, revalidate_after=None):
+        """
+        Initializes the ImageMetadataCache.
+
+        Args:
+            max_entries (int): Maximum number of entries held in memory. Defaults to 10000.
+            path (str, optional): Path of the SQLite file. Defaults to None (memory only).
+            revalidate_after (float, optional): Seconds after which an entry has to be revalidated.
+                                                Defaults to None (entries never expire).
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.revalidate_after = revalidate_after
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS image_metadata ("
+                "url TEXT PRIMARY KEY, width INTEGER, height INTEGER, format TEXT, "
+                "content_length INTEGER, etag TEXT, checked_at REAL)"
+            )
+            self._db.commit()
+
+    def get(self, url):
+        """
+        Returns the cached metadata of the URL, looking at memory first and at the SQLite file second.
+
+        Args:
+            url (str): The URL of the image.
+
+        Returns:
+            ImageMetadata: The cached metadata, or None if the URL is not cached.
+        """
+        with self._lock:
+            metadata = self._entries.get(url)
+            if metadata is not None:
+                self._entries.move_to_end(url)
+            elif self._db is not None:
+                row = self._db.execute(
+                    "SELECT width, height, format, content_length, etag, checked_at FROM image_metadata WHERE url = ?", (url,)
+                ).fetchone()
+                if row is not None:
+                    metadata = ImageMetadata(*row)
+                    self._remember(url, metadata)
+            return metadata
+
+    def put(self, url, metadata):
+        """
+        Stores the metadata of the URL in memory and, if configured, in the SQLite file.
+
+        Args:
+            url (str): The URL of the image.
+            metadata (ImageMetadata): The metadata of the image.
+        """
+        with self._lock:
+            self._remember(url, metadata)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO image_metadata VALUES (?, ?, ?, ?, ?, ?, ?)", (url, *metadata))
+                self._db.commit()
+
+    def touch(self, url):
+        """
+        Marks the entry of the URL as checked now, e.g. after a 304 Not Modified response.
+
+        Args:
+            url (str): The URL of the image.
+        """
+        with self._lock:
+            metadata = self._entries.get(url)
+        if metadata is not None:
+            self.put(url, metadata._replace(checked_at=time.time()))
+
+    def is_fresh(self, metadata):
+        """
+        Returns True if the metadata does not need a revalidation.
+
+        Args:
+            metadata (ImageMetadata): The cached metadata.
+
+        Returns:
+            bool: True if the metadata can be used without asking the server.
+        """
+        if self.revalidate_after is None:
+            return True
+        return time.time() - metadata.checked_at < self.revalidate_after
+
+    def _remember(self, url, metadata):
+        self._entries[url] = metadata
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def close(self):
+        """
+        Closes the SQLite file.
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+# Example usage
+if __name__ == "__main__":
+    cache = ImageMetadataCache(max_entries=2, revalidate_after=24 * 3600)
+    url = 'https://www.eak.admin.ch/eak/de/_jcr_content/logo/image.imagespooler.png/1674124800670/logo.png'
+    cache.put(url, ImageMetadata(256, 80, 'PNG', 4711, '"abc"', time.time()))
+    metadata = cache.get(url)
+    print(metadata, cache.is_fresh(metadata))
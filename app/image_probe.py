@@ -0,0 +1,305 @@
+""" A module to read the dimensions of images from their first bytes instead of downloading them in full. """
+import re
+import struct
+import threading
+import time
+from io import BytesIO
+from PIL import Image
+from http_transport import HTTPTransport
+from image_cache import ImageMetadata
+
+# returned instead of metadata when a revalidation is answered with 304 Not Modified
+NOT_MODIFIED = object()
+
+def probe_image_size(data):
+    """
+    Reads the width and height of an image from its first bytes.
+    Supports PNG, GIF, JPEG (scan for the SOF marker), WebP and SVG.
+
+    Args:
+        data (bytes): The first bytes of the image.
+
+    Returns:
+        tuple: (width, height, format) if the bytes are conclusive, otherwise None.
+    """
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        if len(data) >= 24 and data[12:16] == b'IHDR':
+            width, height = struct.unpack('>II', data[16:24])
+            return width, height, 'PNG'
+        return None
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        if len(data) >= 10:
+            width, height = struct.unpack('<HH', data[6:10])
+            return width, height, 'GIF'
+        return None
+    if data[:2] == b'\xff\xd8':
+        return _probe_jpeg(data)
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return _probe_webp(data)
+    if b'<svg' in data[:4096]:
+        return _probe_svg(data)
+    return None
+
+def _probe_jpeg(data):
+    """
+    Walks the JPEG segments until a start of frame (SOF) marker, which holds the dimensions.
+    """
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:  # fill byte
+            position += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # markers without length
+            position += 2
+            continue
+        segment_length = struct.unpack('>H', data[position + 2:position + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if position + 9 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[position + 5:position + 9])
+            return width, height, 'JPEG'
+        position += 2 + segment_length
+    return None
+
+def _probe_webp(data):
+    """
+    Reads the dimensions from the first chunk of a WebP image (VP8, VP8L or VP8X).
+    """
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and len(data) >= 30:
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF, 'WEBP'
+    if chunk == b'VP8L' and len(data) >= 25:
+        bits = struct.unpack('<I', data[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1, 'WEBP'
+    if chunk == b'VP8X' and len(data) >= 30:
+        width = int.from_bytes(data[24:27], 'little') + 1
+        height = int.from_bytes(data[27:30], 'little') + 1
+        return width, height, 'WEBP'
+    return None
+
+_SVG_TAG = re.compile(rb'<svg\b[^>]*>', re.IGNORECASE | re.DOTALL)
+_SVG_LENGTH = r'\b{}\s*=\s*["\']\s*([0-9.]+)\s*(px)?\s*["\']'
+_SVG_VIEWBOX = re.compile(r'\bviewBox\s*=\s*["\']\s*[-0-9.]+[\s,]+[-0-9.]+[\s,]+([0-9.]+)[\s,]+([0-9.]+)\s*["\']', re.IGNORECASE)
+
+def _probe_svg(data):
+    """
+    Reads the dimensions from the width and height attributes of the svg tag, or from its viewBox.
+    """
+    match = _SVG_TAG.search(data)
+    if match is None:
+        return None
+    tag = match.group(0).decode('utf-8', errors='replace')
+    width = re.search(_SVG_LENGTH.format('width'), tag)
+    height = re.search(_SVG_LENGTH.format('height'), tag)
+    if width and height:
+        return round(float(width.group(1))), round(float(height.group(1))), 'SVG'
+    viewbox = _SVG_VIEWBOX.search(tag)
+    if viewbox:
+        return round(float(viewbox.group(1))), round(float(viewbox.group(2))), 'SVG'
+    return None
+
+
+class ImageProber:
+    """
+    A class to determine the dimensions of remote images with as few downloaded bytes as possible.
+
+    The first bytes of an image are requested with an HTTP Range request and read as a stream
+    that stops as soon as the dimensions are known. The full image is only downloaded and decoded
+    with PIL if the header is inconclusive. With an ImageMetadataCache, images already seen on
+    another page are answered from the cache, stale entries are revalidated with If-None-Match.
+
+    Attributes:
+        transport (HTTPTransport): The HTTP transport used to fetch the images.
+        probe_bytes (int): Maximum number of bytes read for header probing.
+        probe_headers (bool): If False, every image is downloaded in full.
+        cache (ImageMetadataCache): Cache of image metadata, None disables caching.
+        cache_hits (int): Number of images answered by the cache without network access.
+        revalidations (int): Number of stale cache entries confirmed by a 304 Not Modified response.
+        images (int): Number of images whose dimensions were determined.
+        full_downloads (int): Number of images that had to be downloaded in full.
+        bytes_downloaded (int): Number of image bytes downloaded.
+        bytes_saved (int): Number of image bytes not downloaded thanks to header probing.
+
+    Methods:
+        get_image_size(url): Returns (width, height, format) of the image at the URL.
+        get_cached_size(url): Returns (width, height, format) from the cache without network access, or None.
+        stats(): Returns the probing counters as a dictionary.
+    """
+
+    def __init__(self, transport=None, probe_bytes=16384, chunk_size=2048, probe_headers=True, cache=None):
+        """
+        Initializes the ImageProber.
+
+        Args:
+            transport (HTTPTransport, optional): The HTTP transport to use. Defaults to a new HTTPTransport.
+            probe_bytes (int): Maximum number of bytes read for header probing. Defaults to 16384.
+            chunk_size (int): Number of bytes read before each probing attempt. Defaults to 2048.
+            probe_headers (bool): If False, every image is downloaded in full. Defaults to True.
+            cache (ImageMetadataCache, optional): Cache of image metadata. Defaults to None (no caching).
+        """
+        self.transport = transport or HTTPTransport()
+        self.probe_bytes = probe_bytes
+        self.chunk_size = chunk_size
+        self.probe_headers = probe_headers
+        self.cache = cache
+        self.cache_hits = 0
+        self.revalidations = 0
+        self.images = 0
+        self.full_downloads = 0
+        self.bytes_downloaded = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+    def get_image_size(self, url):
+        """
+        Returns the dimensions of the image at the URL.
+
+        Args:
+            url (str): The URL of the image.
+
+        Returns:
+            tuple: (width, height, format) of the image.
+
+        Raises:
+            requests.RequestException: If there is an issue with network access or HTTP error.
+            PIL.UnidentifiedImageError: If the full download cannot be decoded as an image.
+        """
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None and self.cache.is_fresh(cached):
+            with self._lock:
+                self.cache_hits += 1
+            return cached.width, cached.height, cached.format
+
+        headers = {'If-None-Match': cached.etag} if cached is not None and cached.etag else {}
+        metadata = None
+        if self.probe_headers:
+            metadata = self._probe(url, headers)
+        if metadata is None:
+            metadata = self._download(url, headers)
+
+        if metadata is NOT_MODIFIED:
+            self.cache.touch(url)
+            with self._lock:
+                self.revalidations += 1
+            return cached.width, cached.height, cached.format
+        if self.cache is not None:
+            self.cache.put(url, metadata)
+        return metadata.width, metadata.height, metadata.format
+
+    def get_cached_size(self, url):
+        """
+        Returns the dimensions of the image at the URL if the cache holds a fresh entry, without network access.
+
+        Args:
+            url (str): The URL of the image.
+
+        Returns:
+            tuple: (width, height, format) of the image, or None if it is not cached or stale.
+        """
+        if self.cache is None:
+            return None
+        cached = self.cache.get(url)
+        if cached is None or not self.cache.is_fresh(cached):
+            return None
+        with self._lock:
+            self.cache_hits += 1
+        return cached.width, cached.height, cached.format
+
+    def _probe(self, url, headers):
+        """
+        Reads the first bytes of the image and stops as soon as its dimensions are known.
+
+        Returns:
+            ImageMetadata: The metadata of the image, NOT_MODIFIED on a 304 response,
+                           or None if the header is inconclusive.
+        """
+        response = self.transport.get(url, headers={**headers, 'Range': f'bytes=0-{self.probe_bytes - 1}'}, stream=True)
+        try:
+            if response.status_code == 304:
+                return NOT_MODIFIED
+            response.raise_for_status()
+            data = b''
+            size = None
+            drained = 0
+            chunks = response.iter_content(chunk_size=self.chunk_size)
+            for chunk in chunks:
+                data += chunk
+                size = probe_image_size(data)
+                if size is not None or len(data) >= self.probe_bytes:
+                    break
+            if response.status_code == 206:
+                # the rest of the range is at most probe_bytes, reading it keeps the connection alive
+                drained = sum(len(chunk) for chunk in chunks)
+            total_length = _total_length(response)
+            etag = response.headers.get('ETag')
+        finally:
+            response.close()
+
+        with self._lock:
+            self.bytes_downloaded += len(data) + drained
+            if size is not None:
+                self.images += 1
+                if total_length is not None:
+                    self.bytes_saved += max(0, total_length - len(data) - drained)
+        if size is None:
+            return None
+        return ImageMetadata(size[0], size[1], size[2], total_length, etag, time.time())
+
+    def _download(self, url, headers):
+        """
+        Downloads the full image and decodes it with PIL.
+
+        Returns:
+            ImageMetadata: The metadata of the image, or NOT_MODIFIED on a 304 response.
+        """
+        response = self.transport.get(url, headers=headers)
+        if response.status_code == 304:
+            return NOT_MODIFIED
+        response.raise_for_status()
+        image = Image.open(BytesIO(response.content))
+        with self._lock:
+            self.images += 1
+            self.full_downloads += 1
+            self.bytes_downloaded += len(response.content)
+        return ImageMetadata(image.size[0], image.size[1], image.format, len(response.content), response.headers.get('ETag'), time.time())
+
+    def stats(self):
+        """
+        Returns the probing counters.
+
+        Returns:
+            dict: Number of cache hits, revalidations, probed images, full downloads, downloaded bytes and saved bytes.
+        """
+        return {
+            "cache_hits": self.cache_hits,
+            "revalidations": self.revalidations,
+            "images": self.images,
+            "full_downloads": self.full_downloads,
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+def _total_length(response):
+    """
+    Returns the full size of the resource from Content-Range (206) or Content-Length (200), if known.
+    """
+    content_range = response.headers.get('Content-Range', '')
+    if '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    if response.status_code == 200 and response.headers.get('Content-Length', '').isdigit():
+        return int(response.headers['Content-Length'])
+    return None
+
+
+# Example usage
+if __name__ == "__main__":
+    prober = ImageProber()
+    url = 'https://www.eak.admin.ch/eak/de/_jcr_content/logo/image.imagespooler.png/1674124800670/logo.png'
+    print(prober.get_image_size(url))  # (width, height, 'PNG')
+    print(prober.stats())
@@ -0,0 +1,256 @@
+""" A module to match many keywords against a text in a single pass. """
+import json
+import re
+import threading
+from collections import Counter
+import numpy as np
+
+# below this number of keywords, one C-level substring scan per keyword is faster than the compiled pattern
+SCAN_THRESHOLD = 100
+
+def _trie_pattern(keywords):
+    """
+    Builds a regular expression that matches the longest of the keywords at a position.
+    The alternation is shaped like a trie, so the regex engine follows one branch per character
+    instead of trying every keyword, which makes it behave like an Aho-Corasick automaton.
+
+    Args:
+        keywords (iterable of str): The keywords, not empty.
+
+    Returns:
+        str: The regular expression.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char != '']
+        if not branches:
+            return ''
+        if len(branches) == 1 and '' not in node:
+            return branches[0]
+        body = '(?:' + '|'.join(branches) + ')'
+        return body + '?' if '' in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    A class that compiles keyword rules once and matches all keywords in one pass over a text.
+
+    Matching is case-insensitive and substring-based, exactly like `word in text.lower()`.
+    At every position of the text the compiled pattern finds the longest keyword starting there,
+    the shorter keywords starting at the same position are its prefixes and are added from a table.
+    For small rule tables match_rules uses one substring scan per keyword instead, which is faster
+    in CPython until about SCAN_THRESHOLD keywords (see benchmarks/benchmark_keyword_matcher.py).
+
+    Attributes:
+        keywords_rules (dict): A dictionary mapping rules to their lowercased keywords.
+        strategy (str): 'pattern' or 'scan', the matching used by match_rules.
+
+    Methods:
+        match_rules(text): Returns the rules with at least one keyword in the text, in rule order.
+        find_all(text): Returns (position, keyword) of every keyword occurrence in the text.
+        count_rules(text): Returns the number of keyword occurrences per rule.
+        count_matrix(texts): Returns the number of keyword occurrences per text and rule as a matrix.
+        match_matrix(texts): Returns whether each rule matches each text as a boolean matrix.
+    """
+
+    def __init__(self, keywords_rules, strategy='auto'):
+        """
+        Initializes the KeywordMatcher and compiles the keyword rules.
+
+        Args:
+            keywords_rules (dict): A dictionary mapping rules to their keywords.
+            strategy (str): 'pattern', 'scan' or 'auto' to choose by the number of keywords. Defaults to 'auto'.
+        """
+        self.keywords_rules = {rule: [word.lower() for word in words] for rule, words in keywords_rules.items()}
+        keywords = {word for words in self.keywords_rules.values() for word in words if word}
+        self._rules_by_keyword = {keyword: [] for keyword in keywords}
+        for rule, words in self.keywords_rules.items():
+            for word in words:
+                if word and rule not in self._rules_by_keyword[word]:
+                    self._rules_by_keyword[word].append(rule)
+        # an empty keyword is contained in every text
+        self._always_matching_rules = {rule for rule, words in self.keywords_rules.items() if '' in words}
+        self._prefixes = {keyword: [other for other in keywords if other != keyword and keyword.startswith(other)] for keyword in keywords}
+        self._pattern = re.compile(_trie_pattern(keywords)) if keywords else None
+        # keyword x rule indicator, so that rule counts are one matrix product over keyword counts
+        self._keywords = sorted(keywords)
+        self._keyword_index = {keyword: i for i, keyword in enumerate(self._keywords)}
+        self._rules = list(self.keywords_rules)
+        self._keyword_rules = np.zeros((len(self._keywords), len(self._rules)), dtype=np.int64)
+        for j, rule in enumerate(self._rules):
+            for word in set(self.keywords_rules[rule]):
+                if word:
+                    self._keyword_rules[self._keyword_index[word], j] = 1
+        if strategy == 'auto':
+            strategy = 'scan' if len(keywords) < SCAN_THRESHOLD else 'pattern'
+        self.strategy = strategy
+
+    def _longest_matches(self, text):
+        """
+        Yields (position, keyword) for the longest keyword at every position where a keyword starts.
+        """
+        if self._pattern is None:
+            return
+        text = text.lower()
+        search = self._pattern.search
+        match = search(text)
+        while match is not None:
+            yield match.start(), match.group()
+            # restart one character later, so overlapping keywords are found as well
+            match = search(text, match.start() + 1)
+
+    def match_rules(self, text):
+        """
+        Returns the rules with at least one keyword in the text.
+
+        Args:
+            text (str): The text to be analyzed.
+
+        Returns:
+            list of str: The matched rules, in the order of keywords_rules.
+        """
+        if self.strategy == 'scan':
+            text = text.lower()
+            return [rule for rule, words in self.keywords_rules.items() if any(word in text for word in words)]
+
+        matched = set(self._always_matching_rules)
+        for _, keyword in self._longest_matches(text):
+            matched.update(self._rules_by_keyword[keyword])
+            for prefix in self._prefixes[keyword]:
+                matched.update(self._rules_by_keyword[prefix])
+            if len(matched) == len(self.keywords_rules):
+                break
+        return [rule for rule in self.keywords_rules if rule in matched]
+
+    def find_all(self, text):
+        """
+        Returns every keyword occurrence in the text, overlapping occurrences included.
+
+        Args:
+            text (str): The text to be analyzed.
+
+        Returns:
+            list of tuple: (position in the lowercased text, keyword) of every occurrence, ordered by position.
+        """
+        occurrences = []
+        for position, keyword in self._longest_matches(text):
+            occurrences.append((position, keyword))
+            occurrences.extend((position, prefix) for prefix in self._prefixes[keyword])
+        return occurrences
+
+    def count_rules(self, text):
+        """
+        Returns the number of keyword occurrences per rule.
+
+        Args:
+            text (str): The text to be analyzed.
+
+        Returns:
+            dict: A dictionary mapping every rule to its number of keyword occurrences.
+        """
+        counts = Counter(keyword for _, keyword in self.find_all(text))
+        return {rule: sum(counts[word] for word in set(words)) for rule, words in self.keywords_rules.items()}
+
+    def count_matrix(self, texts):
+        """
+        Counts the keyword occurrences of every rule in many texts at once, like count_rules for each text.
+        The texts are joined into one corpus that the compiled pattern scans in a single pass,
+        the occurrences are mapped back to their text with a binary search over the text offsets
+        and summed per rule with a matrix product.
+
+        Args:
+            texts (list of str): The texts to be analyzed.
+
+        Returns:
+            numpy.ndarray: A (texts x rules) matrix of keyword occurrences, the columns in the order of keywords_rules.
+        """
+        keyword_counts = np.zeros((len(texts), len(self._keywords)), dtype=np.int64)
+        if texts and self._keywords:
+            # NUL separates the texts, no keyword contains it, so no occurrence spans two texts
+            lowered = [text.lower() for text in texts]
+            corpus = '\x00'.join(lowered)
+            starts = np.cumsum([0] + [len(text) + 1 for text in lowered[:-1]])
+            positions, keyword_ids = [], []
+            index = self._keyword_index
+            for position, keyword in self._longest_matches(corpus):
+                positions.append(position)
+                keyword_ids.append(index[keyword])
+                for prefix in self._prefixes[keyword]:
+                    positions.append(position)
+                    keyword_ids.append(index[prefix])
+            if positions:
+                documents = np.searchsorted(starts, np.array(positions), side='right') - 1
+                np.add.at(keyword_counts, (documents, np.array(keyword_ids)), 1)
+        return keyword_counts @ self._keyword_rules
+
+    def match_matrix(self, texts):
+        """
+        Returns whether each rule has at least one keyword in each text, like match_rules for each text.
+        With the pattern strategy the matrix comes from count_matrix. With the scan strategy (small rule tables)
+        the substring scans per text and rule are faster than any pattern over the corpus and fill the matrix directly.
+
+        Args:
+            texts (list of str): The texts to be analyzed.
+
+        Returns:
+            numpy.ndarray: A (texts x rules) boolean matrix, the columns in the order of keywords_rules.
+        """
+        if self.strategy == 'scan':
+            rules = [self.keywords_rules[rule] for rule in self._rules]
+            matches = np.zeros((len(texts), len(rules)), dtype=bool)
+            for i, text in enumerate(texts):
+                text = text.lower()
+                matches[i] = [any(word in text for word in words) for words in rules]
+            return matches
+
+        matches = self.count_matrix(texts) > 0
+        for j, rule in enumerate(self._rules):
+            if rule in self._always_matching_rules:
+                matches[:, j] = True
+        return matches
+
+
+_compiled_matchers = {}
+_compiled_matchers_lock = threading.Lock()
+
+def compiled_matcher(keywords_rules):
+    """
+    Returns a KeywordMatcher for the keyword rules, compiled only once per process for equal rules,
+    e.g. when several sites of a batch or several analyzers share a rule set. A KeywordMatcher is not
+    changed after compiling, so one instance can be used by all threads.
+
+    Args:
+        keywords_rules (dict): A dictionary mapping rules to their keywords.
+
+    Returns:
+        KeywordMatcher: The compiled matcher.
+    """
+    # the rule order is part of the key, match_rules returns the rules in this order
+    key = json.dumps(keywords_rules, ensure_ascii=False)
+    with _compiled_matchers_lock:
+        matcher = _compiled_matchers.get(key)
+        if matcher is None:
+            matcher = _compiled_matchers[key] = KeywordMatcher(keywords_rules)
+        return matcher
+
+
+# Example usage
+if __name__ == "__main__":
+    rules = {
+        "AHV": ["ahv", "ahv 21", "alters- und hinterlassenenversicherung"],
+        "FamZG": ["familienzulagen", "familienausgleichskasse"],
+    }
+    matcher = KeywordMatcher(rules)
+    text = "Die Reform AHV 21 betrifft die AHV und die Familienausgleichskasse."
+    print(matcher.match_rules(text))  # ['AHV', 'FamZG']
+    print(matcher.find_all(text))     # [(11, 'ahv 21'), (11, 'ahv'), (31, 'ahv'), (43, 'familienausgleichskasse')]
+    print(matcher.count_rules(text))  # {'AHV': 3, 'FamZG': 1}
+    print(matcher.count_matrix([text, "Familienzulagen", "Nichts"]))  # [[3 1] [0 1] [0 0]]
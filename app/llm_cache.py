@@ -0,0 +1,156 @@
+""" A module to cache LLM answers by the content they were generated from. """
+import sqlite3
+import threading
+import time
+from crawl_state import hash_content
+
+def cache_key(model, template, task, content):
+    """
+    Returns the key of an answer: the hash of everything the answer depends on.
+
+    Args:
+        model (str): The name of the LLM.
+        template (str): The prompt template.
+        task (str): The task of the prompt.
+        content (str): The cleaned content of the documents.
+
+    Returns:
+        str: The SHA-256 hex digest of the four values.
+    """
+    return hash_content([model, template, task, content])
+
+
+class LLMResponseCache:
+    """
+    A persistent SQLite cache of LLM answers, keyed by the hash of model, template, task and content.
+
+    Identical prompts for unchanged content are answered from the cache, so a re-run over an
+    unchanged site makes no LLM calls. The least recently used answers are evicted above max_entries,
+    answers older than max_age are not used anymore.
+
+    Attributes:
+        path (str): Path of the SQLite file, ':memory:' keeps the cache for one run only.
+        max_entries (int): Maximum number of answers kept, None means no limit.
+        max_age (float): Seconds after which an answer is generated again, None means never.
+        hits (int): Number of answers found in the cache.
+        misses (int): Number of answers not found in the cache.
+        evictions (int): Number of answers evicted because of max_entries or max_age.
+
+    Methods:
+        get(key): Returns the cached answer of the key, or None.
+        put(key, answer): Stores the answer of the key.
+        stats(): Returns the hit, miss and eviction counts.
+        close(): Closes the SQLite file.
+    """
+
+    def __init__(self, path=':memory:', max_entries=100000, max_age=None):
+        """
+        Initializes the LLMResponseCache, creates the SQLite file if needed and drops expired answers.
+
+        Args:
+            path (str): Path of the SQLite file. Defaults to ':memory:'.
+            max_entries (int, optional): Maximum number of answers kept. Defaults to 100000.
+            max_age (float, optional): Seconds after which an answer expires. Defaults to None (answers never expire).
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_response ("
+            "key TEXT PRIMARY KEY, answer TEXT, created_at REAL, used_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_response_used_at ON llm_response (used_at)")
+        with self._lock:
+            if max_age is not None:
+                self.evictions += self._db.execute("DELETE FROM llm_response WHERE created_at < ?", (time.time() - max_age,)).rowcount
+            self._db.commit()
+            self._entries = self._db.execute("SELECT COUNT(*) FROM llm_response").fetchone()[0]
+
+    def get(self, key):
+        """
+        Returns the cached answer of the key and counts a hit or a miss.
+
+        Args:
+            key (str): The key, see cache_key().
+
+        Returns:
+            str: The cached answer, or None if the key is not cached or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT answer, created_at FROM llm_response WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_age is not None and now - row[1] >= self.max_age:
+                self._db.execute("DELETE FROM llm_response WHERE key = ?", (key,))
+                self._db.commit()
+                self._entries -= 1
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE llm_response SET used_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key, answer):
+        """
+        Stores the answer of the key and evicts the least recently used answers above max_entries.
+
+        Args:
+            key (str): The key, see cache_key().
+            answer (str): The answer of the LLM.
+        """
+        now = time.time()
+        with self._lock:
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO llm_response VALUES (?, ?, ?, ?)", (key, answer, now, now)
+            ).rowcount
+            if not inserted:
+                self._db.execute("UPDATE llm_response SET answer = ?, created_at = ?, used_at = ? WHERE key = ?", (answer, now, now, key))
+            self._entries += inserted
+            if self.max_entries is not None and self._entries > self.max_entries:
+                evicted = self._db.execute(
+                    "DELETE FROM llm_response WHERE key IN (SELECT key FROM llm_response ORDER BY used_at LIMIT ?)",
+                    (self._entries - self.max_entries,),
+                ).rowcount
+                self._entries -= evicted
+                self.evictions += evicted
+            self._db.commit()
+
+    def stats(self):
+        """
+        Returns the hit, miss and eviction counts of this run.
+
+        Returns:
+            dict: hits, misses, evictions, entries and hit_rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": self._entries,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        """
+        Closes the SQLite file.
+        """
+        self._db.close()
+
+
+# Example usage
+if __name__ == "__main__":
+    cache = LLMResponseCache(max_entries=2, max_age=30 * 24 * 3600)
+    key = cache_key("gpt-3.5-turbo-1106", "{{query}}", "Fasse den Text zusammen.", "Die EAK ist die Ausgleichskasse des Bundes.")
+    print(cache.get(key))
+    cache.put(key, "Die EAK ist die Ausgleichskasse des Bundes.")
+    print(cache.get(key), cache.stats())
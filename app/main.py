@@ -1,144 +1,224 @@
-""" Main file for the execution of the information extraction. """
+""" Main file for the execution of the information extraction.
+The AI analysis, the embeddings, the HTML archive and the distributed crawl are imported only when they are used,
+so a run without them starts without loading Haystack, OpenAI or sentence-transformers. """
 from extracted_information_assembler import ExtractedInformationAssembler
+from http_transport import HTTPTransport
+from image_probe import ImageProber
+from image_cache import ImageMetadataCache
+from crawl_state import CrawlStateStore
+from output_sinks import create_sink
+from extracted_information_assembler import FIELDNAMES
+from duplicate_analyzer import REPORT_FIELDNAMES
+from checkpoint_journal import CheckpointJournal
+from metrics import Metrics
+from request_scheduler import RequestScheduler
+import argparse
 import toml
 
-# Laden der Konfigurationsdatei
-config = toml.load("config_eak.toml")
 
-# Zugriff auf die Konfigurationswerte
-sitemap_url = config["Sitemap"]["url"]
-sitemap_url_k = config["Sitemap"]["k"]
-filter_urls_by = "/de/"
-content_class = 'main-content'
-# Regeln für URL- und Inhaltsanalyse
-rules_for_url = {
-    "Firmen": ["/firmen/"], 
-    "Private": ["/dokumentation/"],
-    "Publikation": ["/publikationen/"],
-    "Jahresbericht": ["/jahresberichte/"],
-    "News-mitteilung": ["/mitteilungs-archiv/"],
-    "Neuerungen-mitteilung": ["neuerungen"],
-}
-rules_for_thema_by_url = {
-    # Firmen
-    "Anschluss": ["/anschluss/", "anschluss.html"],
-    "Personal": ["/personal/", "personal.html"],
-    "Externe Aufträge": ["/externe_auftraege/", "externe_auftraege.html"],
-    "Arbeiten im Ausland": ["/arbeiten_im_ausland/", "arbeiten_im_ausland.html"],
-    "Beiträge & Löhne": ["/beitraege_und_loehne/", "beitraege_und_loehne.html"],
-    "Familienzulagen": ["/familienzulagen/", "familienzulagen.html"],
-    "Erwerbsersatzleistungen": ["/erwerbsersatz/", "erwerbsersatz.html"],
-    "connect.eak": ["/connect-eak/", "connect-eak.html"],
-    # Private
-    "Mein AHV-Konto": ["/mein_ahv-konto/", "mein_ahv-konto.html"],
-    "Zivilstand": ["/zivilstand/", "zivilstand.html"],
-    "Kinder": ["/kinder/", "kinder.html"],
-    "Arbeit": ["/arbeit/", "arbeit.html"],
-    "Arbeitsunterbruch / Keine Erwerbstätigkeit": ["/arbeitsunterbruch_keine_erwerbstaetigkeit/", "arbeitsunterbruch_keine_erwerbstaetigkeit.html"],
-    "Pensionierung": ["/pensionierung/", "pensionierung.html"],
-    "Im Ausland": ["/im_ausland/", "im_ausland.html"],
-    "Steuerausweis": ["/steuerausweis/", "steuerausweis.html"],
-    # Formulare
-    "Formulare": ["/formulare/", "formulare.html"],
-    # Die EAK
-    "Unsere Produkte": ["/unsere-leistungen/", "unsere-leistungen.html"],
-    "Porträt": ["/portrait/", "portrait.html"],
-    "Organisation": ["/organisation/", "organisation.html"],
-    "Publikationen": ["/publikationen/", "publikationen.html"],
-    "Kurse und Beratung": ["/kurse-und-beratung/", "kurse-und-beratung.html"],
-    "Offene Stellen": ["/offene-stellen/", "offene-stellen0", "offene-stellen0.html"],
-    # Reform AHV 21
-    "Reform AHV 21": ["/reform-ahv21/", "reform-ahv21.html"],
-}
-rules_for_content = {
-    "AHV": [
-        "alters- und hinterlassenenvorsorge", 
-        "alters- und hinterlassenenversicherung", 
-        "ahv",
-        "altersvorsorge",
-        "altersrente",
-        "stabilsierung der ahv",
-        "ahv 21",
-        "ahv21",
-        "hinterlassenenrenten",
-        ], 
-    "IV": [
-        "Invalidenversicherung", 
-        " iv ", 
-        "invalid", 
-        "invalidenvorsorge",
-        "eingliederungsmassnahmen",
-        "invalidenrenten",
-        "assistenzbeitrag",
-        ],
-    "EL": [
-        "hilflosenentschädigung",
-        "ergänzungsleistungen",
-        "jährliche ergänzungsleistungen",
-        "krankheits- und behinderungskosten",
-        "recht auf ergänzungsleistungen",
-        "berechnung ergänzungsleistungen",
-        " el ", 
-        "ergänzungsleistung",
-        "minimalen Lebenskosten nicht decken",
-        ],
-    "EO-MSE-EAE-BUE-AdopE": [
-        "erwerbsersatz", 
-        "mutterschaft",
-        "mutterschaftsentschädigung",
-        "vaterschafts", 
-        "mutter- & andern elternteil", 
-        "betreuung", 
-        "adoption", 
-        " eo ", 
-        " mse ", 
-        " eae ", 
-        " bue ", 
-        "adope", 
-        "erwerbsausfall", 
-        "erwerbsersatzordnung", 
-        "dienstpflicht", 
-        "anderen elternteil",
-        "beeinträchtigten kind",
-        "beeinträchtigtes kind",
-        "dienstreisende",
-        ],
-    "FamZG": [
-        "Familienzulagen", 
-        "famzg", 
-        " fz ",
-        "unterhalt ihrer kinder",
-        "unterhalt der kinder",
-        "kinder- und ausbildungszulagen",
-        "kinderzulagen",
-        "ausbildungszulagen",
-        "familienausgleichskasse",
-        "familienzulage",
-        ],
-}
+def main(argv=None):
+    """
+    Runs the information extraction as configured in config_eak.toml.
 
-prompts_to_process = {
-    "Prompt1": config['Prompts']['Prompt1']['tasks'],
-    "Prompt2": config['Prompts']['Prompt2']['tasks']
-}  
+    Args:
+        argv (list of str, optional): The command line arguments. Defaults to sys.argv.
+    """
+    argument_parser = argparse.ArgumentParser(description="Extracts information from the pages of the EAK sitemap.")
+    argument_parser.add_argument("--resume", action="store_true",
+                                 help="Resume the last run from its checkpoint, only failed and pending URLs are extracted again. "
+                                      "Needs [Checkpoint] enabled or --coordinator.")
+    # one mode per run, without a mode the pages are extracted from the sitemap
+    modes = argument_parser.add_mutually_exclusive_group()
+    modes.add_argument("--retag", action="store_true",
+                       help="Tag the rows of the output (.csv, .jsonl or .parquet) again with the current rules, without fetching any page.")
+    modes.add_argument("--replay", action="store_true",
+                       help="Run the full extraction from the HTML archive of an earlier run, without network access.")
+    modes.add_argument("--coordinator", action="store_true",
+                       help="Fill the shared URL frontier from the sitemap and merge the rows of the workers into the output.")
+    modes.add_argument("--worker", action="store_true",
+                       help="Extract URLs leased from the shared URL frontier, start one or more next to a coordinator.")
+    argument_parser.add_argument("--config", default="config_eak.toml", help="The configuration file.")
+    args = argument_parser.parse_args(argv)
 
-# Initialisierung und Ausführung des Informationssammlers
-assembler = ExtractedInformationAssembler(
-    sitemap_url=sitemap_url,
-    rules_for_url=rules_for_url,
-    sitemap_url_k=sitemap_url_k,
-    rules_for_thema_by_url=rules_for_thema_by_url,
-    rules_for_content=rules_for_content,
-    filter_urls_by=filter_urls_by,
-    content_class=content_class,
-    prompts_to_process=prompts_to_process,
-)
+    # Laden der Konfigurationsdatei
+    config = toml.load(args.config)
+    if args.resume and (args.retag or args.worker):
+        argument_parser.error("--resume cannot be used with --retag or --worker, resume the coordinator instead.")
+    if args.resume and not (args.coordinator or config["Checkpoint"]["enabled"]):
+        argument_parser.error(f"--resume needs a checkpoint, enable [Checkpoint] in {args.config} or resume a --coordinator run.")
+    if config["Embeddings"]["enabled"] and (args.coordinator or args.worker):
+        # every worker would write the same index, and the coordinator only receives the rows
+        argument_parser.error(f"The embeddings are not computed in a distributed crawl, disable [Embeddings] in {args.config}.")
 
-try:
-    assembler.extract_information()
-    assembler.do_we_have_dublicates()
-    assembler.do_we_have_duplicated_slugs()
-    assembler.save_to_csv('extracted_data.csv')
-    print("Data extraction and CSV file creation completed.")
-except Exception as e:
-    print(f"An error occurred during data extraction or CSV file creation: {e}")
+    # Zugriff auf die Konfigurationswerte
+    sitemap_url = config["Sitemap"]["url"]
+    sitemap_url_k = config["Sitemap"]["k"]
+    max_workers = config["Crawl"]["max_workers"]
+    max_workers_per_host = config["Crawl"]["max_workers_per_host"]
+    analysis_processes = config["Crawl"]["analysis_processes"]
+    parser_backend = config["Crawl"]["parser"]
+    metrics = Metrics()
+    if config["Metrics"]["prometheus_port"]:
+        host = config["Metrics"]["prometheus_host"]
+        port = metrics.serve(config["Metrics"]["prometheus_port"], host=host)
+        print(f"Prometheus metrics on http://{host}:{port}/metrics")
+    scheduler = None
+    if config["Politeness"]["enabled"]:
+        scheduler = RequestScheduler(
+            user_agent=config["Politeness"]["user_agent"],
+            respect_robots=config["Politeness"]["respect_robots"],
+            requests_per_second=config["Politeness"]["requests_per_second"] or None,
+            initial_concurrency=config["Politeness"]["initial_concurrency_per_host"],
+            max_concurrency=max_workers_per_host or max_workers,
+            latency_factor=config["Politeness"]["latency_factor"],
+        )
+    transport = HTTPTransport(
+        timeout=(config["HTTP"]["connect_timeout"], config["HTTP"]["read_timeout"]),
+        retries=config["HTTP"]["retries"],
+        backoff_factor=config["HTTP"]["backoff_factor"],
+        pool_maxsize=max(config["HTTP"]["pool_maxsize"], max_workers),
+        user_agent=config["Politeness"]["user_agent"],
+        metrics=metrics,
+        scheduler=scheduler,
+    )
+    archive = None
+    if config["Archive"]["enabled"] or args.replay:
+        from html_archive import HTMLArchive, ArchivingTransport, ReplayTransport
+        archive = HTMLArchive(config["Archive"]["directory"])
+        # replay answers every request from the archive, otherwise every response is archived
+        transport = ReplayTransport(archive) if args.replay else ArchivingTransport(archive, transport)
+    image_cache = ImageMetadataCache(
+        max_entries=config["ImageCache"]["max_entries"],
+        path=config["ImageCache"]["path"] or None,
+        revalidate_after=config["ImageCache"]["revalidate_after"] or None,
+    )
+    image_prober = ImageProber(
+        transport,
+        probe_bytes=config["Images"]["probe_bytes"],
+        probe_headers=config["Images"]["probe_headers"],
+        cache=image_cache,
+    )
+    state_store = None
+    if config["Incremental"]["enabled"]:
+        # the workers of a distributed crawl write the state at the same time
+        state_store = CrawlStateStore(config["Incremental"]["state_path"], timeout=60.0 if args.worker else 5.0)
+    # a distributed crawl is checkpointed in its frontier
+    journal = None
+    if config["Checkpoint"]["enabled"] and not (args.coordinator or args.worker):
+        journal = CheckpointJournal(config["Checkpoint"]["path"])
+    frontier = None
+    if args.coordinator or args.worker:
+        from url_frontier import SQLiteFrontier
+        frontier = SQLiteFrontier(config["Distributed"]["frontier_path"])
+    filter_urls_by = config["Rules"]["filter"]
+    content_class = config["Rules"]["content_class"]
+    # Regeln für URL- und Inhaltsanalyse
+    rules_for_url = config["Rules"]["url"]
+    rules_for_thema_by_url = config["Rules"]["thema_by_url"]
+    rules_for_content = config["Rules"]["content"]
+
+    prompts_to_process = {name: prompt['tasks'] for name, prompt in config['Prompts'].items()}
+    ai_analyzer = None
+    llm_cache = None
+    if config["AI"]["enabled"] and prompts_to_process:
+        # Haystack, OpenAI and dotenv are only loaded for the AI analysis
+        from content_analyzer_ai import AIContentAnalyzer, EchoGenerator
+        from llm_cache import LLMResponseCache
+        if config["AICache"]["enabled"]:
+            llm_cache = LLMResponseCache(
+                config["AICache"]["path"],
+                max_entries=config["AICache"]["max_entries"] or None,
+                max_age=config["AICache"]["max_age_days"] * 24 * 3600 or None,
+            )
+        ai_analyzer = AIContentAnalyzer(
+            prompts_to_process,
+            generator_factory=EchoGenerator if config["AI"]["generator"] == "echo" else None,
+            generation_model=config["AI"]["model"],
+            max_concurrent_requests=config["AI"]["max_concurrent_requests"],
+            cache=llm_cache,
+            max_answer_tokens=config["AI"]["max_answer_tokens"],
+            short_page_tokens=config["AI"]["short_page_tokens"],
+            max_pages_per_request=config["AI"]["max_pages_per_request"],
+            # packing waits for pages of the other workers, only useful with several workers
+            pack_wait=config["AI"]["pack_wait_seconds"] if max_workers > 1 else 0.0,
+        )
+
+    embedding_index = None
+    if config["Embeddings"]["enabled"]:
+        from embedding_index import EmbeddingIndex, SentenceTransformerEncoder
+        embedding_index = EmbeddingIndex(
+            config["Embeddings"]["directory"],
+            encoder=SentenceTransformerEncoder(config["Embeddings"]["model"], batch_size=config["Embeddings"]["batch_size"]),
+            batch_size=config["Embeddings"]["batch_size"],
+        )
+
+    # one column per prompt if the AI analysis is enabled
+    fieldnames = FIELDNAMES + (list(prompts_to_process) if ai_analyzer else [])
+    # retagging reads the existing output, it must not be truncated by a new sink, workers send their rows to the frontier
+    sink = None if args.retag or args.worker else create_sink(config["Output"]["path"], fieldnames, batch_size=config["Output"]["batch_size"] or None)
+
+    # Initialisierung und Ausführung des Informationssammlers
+    assembler = ExtractedInformationAssembler(
+        sitemap_url=sitemap_url,
+        rules_for_url=rules_for_url,
+        sitemap_url_k=sitemap_url_k,
+        rules_for_thema_by_url=rules_for_thema_by_url,
+        rules_for_content=rules_for_content,
+        filter_urls_by=filter_urls_by,
+        content_class=content_class,
+        prompts_to_process=prompts_to_process,
+        max_workers=max_workers,
+        max_workers_per_host=max_workers_per_host,
+        analysis_processes=analysis_processes,
+        parser_backend=parser_backend,
+        transport=transport,
+        image_prober=image_prober,
+        state_store=state_store,
+        sink=sink,
+        # rows are only written to the sink, the duplicate checks do not need them in memory
+        keep_rows=False,
+        journal=journal,
+        ai_analyzer=ai_analyzer,
+        embedding_index=embedding_index,
+        metrics=metrics,
+    )
+
+    try:
+        if args.retag:
+            assembler.retag_output(config["Output"]["path"])
+        elif args.worker:
+            from distributed_crawl import CrawlWorker
+            CrawlWorker(assembler, frontier, lease_seconds=config["Distributed"]["lease_seconds"]).run()
+        else:
+            if args.coordinator:
+                from distributed_crawl import CrawlCoordinator
+                CrawlCoordinator(assembler, frontier, worker_timeout=config["Distributed"]["worker_timeout"]).run(resume=args.resume)
+            else:
+                assembler.extract_information(resume=args.resume)
+            assembler.do_we_have_dublicates()
+            assembler.do_we_have_duplicated_slugs()
+            with create_sink(config["Output"]["duplicates_path"], REPORT_FIELDNAMES) as duplicates_sink:
+                groups = assembler.duplicate_analyzer.write_report(duplicates_sink)
+            print(f"{groups} duplicate groups written to {config['Output']['duplicates_path']}.")
+            print("Data extraction and CSV file creation completed.")
+    except Exception as e:
+        print(f"An error occurred during data extraction or CSV file creation: {e}")
+    finally:
+        # writes the rows still buffered, also after an error
+        if sink is not None:
+            sink.close()
+        if embedding_index is not None:
+            embedding_index.close()
+        for store in (journal, state_store, image_cache, llm_cache, frontier):
+            if store is not None:
+                store.close()
+        if archive is not None:
+            print(f"Archive: {archive.stats()}")
+            archive.close()
+        if config["Metrics"]["path"]:
+            metrics.write_json(config["Metrics"]["path"])
+        metrics.close()
+
+
+if __name__ == "__main__":
+    main()
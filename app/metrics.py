@@ -0,0 +1,349 @@
+""" A module to measure the extraction: stage timers, per-host HTTP counters and latency histograms. """
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# upper bounds of the latency buckets in seconds, the last bucket is unbounded
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """
+    A histogram of durations with fixed buckets, so that recording is one bisect and one increment.
+    Quantiles are interpolated within their bucket, like Prometheus' histogram_quantile.
+    Not thread-safe on its own, Metrics records under its lock.
+
+    Attributes:
+        buckets (tuple): Upper bounds of the buckets in seconds.
+        counts (list of int): Number of durations per bucket, the last one counts durations above all bounds.
+        count (int): Number of durations.
+        sum (float): Sum of the durations in seconds.
+        max (float): Longest duration in seconds.
+
+    Methods:
+        record(seconds): Adds a duration.
+        quantile(q): Returns the estimated q-quantile in seconds.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Initializes the LatencyHistogram.
+
+        Args:
+            buckets (tuple): Ascending upper bounds of the buckets in seconds. Defaults to LATENCY_BUCKETS.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """
+        Adds a duration.
+
+        Args:
+            seconds (float): The duration in seconds.
+        """
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """
+        Returns the estimated q-quantile.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The quantile in seconds, None without any duration.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / bucket_count, self.max)
+            seen += bucket_count
+        return self.max
+
+    def to_dict(self):
+        result = {"count": self.count, "sum": round(self.sum, 6), "max": round(self.max, 6)}
+        for q in QUANTILES:
+            value = self.quantile(q)
+            result[f"p{round(q * 100)}"] = round(value, 6) if value is not None else None
+        return result
+
+
+class Metrics:
+    """
+    A thread-safe collection of the measurements of a run: wall and CPU time per stage,
+    requests, errors and bytes per host, latency histograms of stages and fetches, and plain counters.
+    Every measurement costs a few timer calls and one lock, so the metrics can stay enabled.
+
+    Attributes:
+        started (float): time.perf_counter() when the metrics were created.
+
+    Methods:
+        stage(name): Context manager measuring the wall and CPU time of a stage.
+        record_stage(name, wall, cpu): Records a stage measured elsewhere, e.g. in another process.
+        stage_times(): Returns the wall and CPU time of every stage.
+        record_fetch(url, seconds, size, status_code): Records an HTTP request.
+        increment(name, amount=1): Increments a counter.
+        to_dict(): Returns all measurements as a dictionary.
+        to_prometheus(): Returns all measurements in the Prometheus text format.
+        write_json(path): Writes all measurements to a JSON file.
+        print_summary(): Prints a summary of the run.
+        serve(port, host='127.0.0.1'): Serves the measurements for Prometheus on http://host:port/metrics.
+        close(): Stops the Prometheus endpoint.
+    """
+
+    def __init__(self):
+        """
+        Initializes the Metrics with all measurements at zero.
+        """
+        self.started = time.perf_counter()
+        self._stages = {}
+        self._hosts = {}
+        self._fetches = LatencyHistogram()
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measures the wall time and the CPU time of the calling thread for the duration of the block.
+
+        Args:
+            name (str): The name of the stage, e.g. 'fetch' or 'parse'.
+        """
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - wall_start, time.thread_time() - cpu_start)
+
+    def record_stage(self, name, wall, cpu):
+        """
+        Records one run of a stage.
+
+        Args:
+            name (str): The name of the stage.
+            wall (float): The wall time in seconds.
+            cpu (float): The CPU time in seconds.
+        """
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = {"calls": 0, "wall": 0.0, "cpu": 0.0, "latency": LatencyHistogram()}
+            stage["calls"] += 1
+            stage["wall"] += wall
+            stage["cpu"] += cpu
+            stage["latency"].record(wall)
+
+    def stage_times(self):
+        """
+        Returns the total wall and CPU time of every stage.
+
+        Returns:
+            dict: (wall seconds, CPU seconds) by stage name.
+        """
+        with self._lock:
+            return {name: (stage["wall"], stage["cpu"]) for name, stage in self._stages.items()}
+
+    def record_fetch(self, url, seconds, size, status_code):
+        """
+        Records an HTTP request.
+
+        Args:
+            url (str): The requested URL, counted for its host.
+            seconds (float): The duration of the request.
+            size (int): Number of bytes received.
+            status_code (int): The HTTP status code, None if the request failed without a response.
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            counters = self._hosts.get(host)
+            if counters is None:
+                counters = self._hosts[host] = {"requests": 0, "errors": 0, "bytes": 0, "latency": LatencyHistogram()}
+            counters["requests"] += 1
+            counters["bytes"] += size
+            if status_code is None or status_code >= 400:
+                counters["errors"] += 1
+            counters["latency"].record(seconds)
+            self._fetches.record(seconds)
+
+    def increment(self, name, amount=1):
+        """
+        Increments a counter, e.g. the number of extracted pages.
+
+        Args:
+            name (str): The name of the counter.
+            amount (int): The increment. Defaults to 1.
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def to_dict(self):
+        """
+        Returns all measurements.
+
+        Returns:
+            dict: elapsed_seconds, counters, pages_per_second, stages, fetches and hosts.
+        """
+        with self._lock:
+            elapsed = time.perf_counter() - self.started
+            return {
+                "elapsed_seconds": round(elapsed, 3),
+                "counters": dict(self._counters),
+                "pages_per_second": round(self._counters.get("pages", 0) / elapsed, 3) if elapsed else None,
+                "stages": {
+                    name: {"calls": stage["calls"], "wall_seconds": round(stage["wall"], 6),
+                           "cpu_seconds": round(stage["cpu"], 6), "latency": stage["latency"].to_dict()}
+                    for name, stage in self._stages.items()
+                },
+                "fetches": self._fetches.to_dict(),
+                "hosts": {
+                    host: {"requests": counters["requests"], "errors": counters["errors"],
+                           "bytes": counters["bytes"], "latency": counters["latency"].to_dict()}
+                    for host, counters in self._hosts.items()
+                },
+            }
+
+    def to_prometheus(self):
+        """
+        Returns all measurements in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics, one sample per line.
+        """
+        lines = []
+
+        def histogram(name, labels, latency):
+            cumulative = 0
+            for bound, bucket_count in zip(latency.buckets + (float('inf'),), latency.counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {latency.sum}')
+            lines.append(f'{name}_count{{{labels}}} {latency.count}')
+
+        with self._lock:
+            lines.append('# TYPE eak_elapsed_seconds gauge')
+            lines.append(f'eak_elapsed_seconds {time.perf_counter() - self.started}')
+            lines.append('# TYPE eak_events_total counter')
+            for name, value in self._counters.items():
+                lines.append(f'eak_events_total{{event="{name}"}} {value}')
+            lines.append('# TYPE eak_stage_wall_seconds_total counter')
+            lines.extend(f'eak_stage_wall_seconds_total{{stage="{name}"}} {stage["wall"]}' for name, stage in self._stages.items())
+            lines.append('# TYPE eak_stage_cpu_seconds_total counter')
+            lines.extend(f'eak_stage_cpu_seconds_total{{stage="{name}"}} {stage["cpu"]}' for name, stage in self._stages.items())
+            lines.append('# TYPE eak_stage_seconds histogram')
+            for name, stage in self._stages.items():
+                histogram('eak_stage_seconds', f'stage="{name}"', stage["latency"])
+            for key in ("requests", "errors", "bytes"):
+                lines.append(f'# TYPE eak_http_{key}_total counter')
+                lines.extend(f'eak_http_{key}_total{{host="{host}"}} {counters[key]}' for host, counters in self._hosts.items())
+            lines.append('# TYPE eak_http_fetch_seconds histogram')
+            for host, counters in self._hosts.items():
+                histogram('eak_http_fetch_seconds', f'host="{host}"', counters["latency"])
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        """
+        Writes all measurements to a JSON file.
+
+        Args:
+            path (str): Path of the JSON file.
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def print_summary(self):
+        """
+        Prints the throughput, the time per stage, the fetch latencies and the traffic per host.
+        """
+        summary = self.to_dict()
+        pages = summary["counters"].get("pages", 0)
+        print(f"Metrics: {pages} pages in {summary['elapsed_seconds']:.1f}s ({summary['pages_per_second']} pages/s).")
+        for name, stage in sorted(summary["stages"].items(), key=lambda item: -item[1]["wall_seconds"]):
+            print(f"  Stage {name}: {stage['calls']} calls, {stage['wall_seconds']:.3f}s wall, {stage['cpu_seconds']:.3f}s CPU, "
+                  f"p95 {_milliseconds(stage['latency']['p95'])}.")
+        fetches = summary["fetches"]
+        if fetches["count"]:
+            print(f"  Fetches: {fetches['count']} requests, p50 {_milliseconds(fetches['p50'])}, "
+                  f"p95 {_milliseconds(fetches['p95'])}, p99 {_milliseconds(fetches['p99'])}, max {_milliseconds(fetches['max'])}.")
+        for host, counters in summary["hosts"].items():
+            print(f"  Host {host}: {counters['requests']} requests, {counters['errors']} errors, {counters['bytes']} bytes, "
+                  f"p95 {_milliseconds(counters['latency']['p95'])}.")
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serves the measurements in the Prometheus text format on http://host:port/metrics, from a daemon thread.
+
+        Args:
+            port (int): The port, 0 picks a free port.
+            host (str): The interface to listen on, '0.0.0.0' for all interfaces. Defaults to 127.0.0.1 (this machine only).
+
+        Returns:
+            int: The port of the endpoint.
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # no output for every scrape
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.server_address[1]
+
+    def close(self):
+        """
+        Stops the Prometheus endpoint, if it was started.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _milliseconds(seconds):
+    return f"{seconds * 1000:.0f}ms" if seconds is not None else "-"
+
+
+# Example usage
+if __name__ == "__main__":
+    metrics = Metrics()
+    for delay in (0.002, 0.004, 0.03):
+        with metrics.stage("fetch"):
+            time.sleep(delay)
+        metrics.record_fetch("https://www.eak.admin.ch/eak/de/home.html", delay, 20000, 200)
+        metrics.increment("pages")
+    metrics.print_summary()
+    print(metrics.to_prometheus()[:300])
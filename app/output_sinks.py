@@ -0,0 +1,227 @@
+""" A module with output sinks that write extracted rows while the crawl is running. """
+import csv
+import json
+import os
+from abc import ABC, abstractmethod
+
+class OutputSink(ABC):
+    """
+    Base class of the output sinks. Rows are buffered and written in batches,
+    the columns are fixed when the sink is created.
+
+    Attributes:
+        path (str): Path of the output file.
+        fieldnames (list of str): The columns of the output, in order.
+        batch_size (int): Number of rows buffered before they are written.
+
+    Methods:
+        write_row(row): Buffers a row and writes the buffer once it holds batch_size rows.
+        flush(): Writes all buffered rows.
+        close(): Writes all buffered rows and closes the output file.
+    """
+
+    def __init__(self, path, fieldnames, batch_size=50):
+        """
+        Initializes the sink.
+
+        Args:
+            path (str): Path of the output file.
+            fieldnames (list of str): The columns of the output, in order.
+            batch_size (int): Number of rows buffered before they are written. Defaults to 50.
+        """
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.batch_size = batch_size
+        self._buffer = []
+
+    def write_row(self, row):
+        """
+        Buffers a row and writes the buffer once it holds batch_size rows.
+
+        Args:
+            row (dict): The row, keys not in fieldnames are ignored, missing keys are written empty.
+        """
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all buffered rows.
+        """
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self._buffer = []
+
+    def close(self):
+        """
+        Writes all buffered rows and closes the output file.
+        """
+        self.flush()
+        self._close()
+
+    @abstractmethod
+    def _write_batch(self, rows):
+        pass
+
+    @abstractmethod
+    def _close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CSVSink(OutputSink):
+    """
+    Writes the rows to a CSV file in utf-8-sig, the format of extracted_data.csv.
+    """
+
+    def __init__(self, path, fieldnames, batch_size=50):
+        super().__init__(path, fieldnames, batch_size)
+        self._file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction='ignore')
+        self._writer.writeheader()
+        self._file.flush()
+
+    def _write_batch(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class JSONLSink(OutputSink):
+    """
+    Writes the rows to a JSON Lines file, one JSON object per row with the columns in fieldnames order.
+    """
+
+    def __init__(self, path, fieldnames, batch_size=50):
+        super().__init__(path, fieldnames, batch_size)
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def _write_batch(self, rows):
+        for row in rows:
+            record = {field: row.get(field) for field in self.fieldnames}
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class ParquetSink(OutputSink):
+    """
+    Writes the rows to a Parquet file, one row group per batch. Requires pyarrow.
+    Every column is stored as a string, formatted like in the CSV file.
+    """
+
+    def __init__(self, path, fieldnames, batch_size=500):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("ParquetSink requires pyarrow, install it with 'pip install pyarrow'.")
+        super().__init__(path, fieldnames, batch_size)
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema([(field, pyarrow.string()) for field in self.fieldnames])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def _write_batch(self, rows):
+        columns = {
+            field: [None if row.get(field) is None else str(row.get(field)) for row in rows]
+            for field in self.fieldnames
+        }
+        self._writer.write_table(self._pyarrow.table(columns, schema=self._schema))
+
+    def _close(self):
+        self._writer.close()
+
+
+SINKS_BY_EXTENSION = {
+    '.csv': CSVSink,
+    '.jsonl': JSONLSink,
+    '.parquet': ParquetSink,
+}
+
+def create_sink(path, fieldnames, batch_size=None):
+    """
+    Creates the sink matching the file extension of the path.
+
+    Args:
+        path (str): Path of the output file, ending in .csv, .jsonl or .parquet.
+        fieldnames (list of str): The columns of the output, in order.
+        batch_size (int, optional): Number of rows buffered before they are written.
+                                    Defaults to None (the default of the sink, 50, or 500 for Parquet).
+
+    Returns:
+        OutputSink: The sink writing to the path.
+
+    Raises:
+        ValueError: If the file extension is not supported.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINKS_BY_EXTENSION:
+        raise ValueError(f"Unsupported output format '{extension}', use one of {', '.join(SINKS_BY_EXTENSION)}.")
+    if batch_size is None:
+        return SINKS_BY_EXTENSION[extension](path, fieldnames)
+    return SINKS_BY_EXTENSION[extension](path, fieldnames, batch_size)
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as csv_file:
+        reader = csv.DictReader(csv_file)
+        return list(reader.fieldnames or []), list(reader)
+
+
+def _read_jsonl(path):
+    with open(path, encoding='utf-8') as jsonl_file:
+        rows = [json.loads(line) for line in jsonl_file if line.strip()]
+    return (list(rows[0]) if rows else []), rows
+
+
+def _read_parquet(path):
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Reading Parquet files requires pyarrow, install it with 'pip install pyarrow'.")
+    table = pyarrow.parquet.read_table(path)
+    return list(table.column_names), table.to_pylist()
+
+
+READERS_BY_EXTENSION = {
+    '.csv': _read_csv,
+    '.jsonl': _read_jsonl,
+    '.parquet': _read_parquet,
+}
+
+def read_rows(path):
+    """
+    Reads all rows of an output file written by the sink matching its file extension.
+
+    Args:
+        path (str): Path of the output file, ending in .csv, .jsonl or .parquet.
+
+    Returns:
+        tuple: The columns of the file in order (list of str) and the rows (list of dict).
+
+    Raises:
+        ValueError: If the file extension is not supported.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS_BY_EXTENSION:
+        raise ValueError(f"Unsupported output format '{extension}', use one of {', '.join(READERS_BY_EXTENSION)}.")
+    return READERS_BY_EXTENSION[extension](path)
+
+
+# Example usage
+if __name__ == "__main__":
+    fieldnames = ["URL", "Page Title", "URL Keywords"]
+    with create_sink('example_output.jsonl', fieldnames, batch_size=2) as sink:
+        sink.write_row({"URL": "https://www.eak.admin.ch/eak/de/home.html", "Page Title": "Startseite", "URL Keywords": ["Sonstiges"]})
+    print(open('example_output.jsonl', encoding='utf-8').read())
+    print(read_rows('example_output.jsonl'))
@@ -0,0 +1,130 @@
+""" A module with the analysis of a fetched page that needs no network: parsing, keywords and the content fingerprint.
+It runs in the crawl threads or, for a staged pipeline, in the processes of a process pool. """
+from collections import namedtuple
+from content_analyzer import ContentAnalyzer
+from duplicate_analyzer import simhash
+from metrics import Metrics
+
+# a fetched page on its way to the analysis, state is the PageState without row and content, None without state store
+FetchedPage = namedtuple('FetchedPage', ['url', 'page', 'state'])
+# the analyzed page: the row without the image check and the AI answers, the main content and the lead
+AnalyzedPage = namedtuple('AnalyzedPage', ['url', 'row', 'content', 'lead', 'state', 'stage_times'])
+
+class PageAnalyzer:
+    """
+    A class for the CPU-bound part of the extraction of a page: parsing, URL and content keywords,
+    word count, iframes, images and videos, and the content fingerprint.
+
+    Attributes:
+        url_analyzer (ContentAnalyzer): Analyzes the URL keywords and depth.
+        url_analyzer_for_thema (ContentAnalyzer): Analyzes the URL themes.
+        content_analyzer (ContentAnalyzer): Analyzes the keywords of the lead and the main content.
+        content_class (str): CSS class name to identify the main content on a webpage.
+        metrics (Metrics): Measures the parse, keywords and fingerprint stages.
+
+    Methods:
+        analyze(fetched): Analyzes a fetched page and returns an AnalyzedPage.
+    """
+
+    def __init__(self, url_analyzer, url_analyzer_for_thema, content_analyzer, content_class, metrics=None):
+        """
+        Initializes the PageAnalyzer.
+
+        Args:
+            url_analyzer (ContentAnalyzer): Analyzes the URL keywords and depth.
+            url_analyzer_for_thema (ContentAnalyzer): Analyzes the URL themes.
+            content_analyzer (ContentAnalyzer): Analyzes the keywords of the lead and the main content.
+            content_class (str): CSS class name to identify the main content on a webpage.
+            metrics (Metrics, optional): Measures the stages. Defaults to new Metrics.
+        """
+        self.url_analyzer = url_analyzer
+        self.url_analyzer_for_thema = url_analyzer_for_thema
+        self.content_analyzer = content_analyzer
+        self.content_class = content_class
+        self.metrics = metrics or Metrics()
+
+    def analyze(self, fetched):
+        """
+        Analyzes a fetched page.
+
+        Args:
+            fetched (FetchedPage): The fetched page.
+
+        Returns:
+            AnalyzedPage: The row of the page without "Have image with bad resolution" and AI answers,
+                          its main content and lead.
+        """
+        url, page = fetched.url, fetched.page
+        with self.metrics.stage("parse"):
+            page_title = page.title
+            page_content = page.get_content_by_class(self.content_class)
+            page_lead = page.lead
+            page_last_modified_date = page.last_modified_date
+            page_have_iframe = self.content_analyzer.analyze_html_content_if_iframe(page.dom)
+            page_have_image = self.content_analyzer.analyze_html_content_if_image(page.dom)
+            page_have_video = self.content_analyzer.analyze_html_content_if_video(page.dom)
+        with self.metrics.stage("keywords"):
+            url_keywords = self.url_analyzer.analyze_url(url)
+            url_thema = self.url_analyzer_for_thema.analyze_url(url)
+            url_depth = self.url_analyzer.analyze_url_depth(url)
+            page_numer_of_words = self.content_analyzer.analyze_count_of_words(page_content)
+            page_content_keywords = self.content_analyzer.analyze_content(page_content)
+            page_lead_keywords = self.content_analyzer.analyze_content(page_lead)
+        with self.metrics.stage("fingerprint"):
+            content_fingerprint = simhash(page_content)
+
+        row = {
+            "URL": url,
+            "Page Title": page_title,
+            "URL Keywords": url_keywords,
+            "URL Thema": url_thema,
+            "URL Depth": url_depth,
+            "Content Keywords": page_content_keywords,
+            "Lead Keywords": page_lead_keywords,
+            "Page Leadtext": page_lead,
+            "Page Modified Date": page_last_modified_date,
+            "Have iframe": page_have_iframe,
+            "Have image": page_have_image,
+            "Have image with bad resolution": None,  # needs the network, see ExtractedInformationAssembler
+            "Have video": page_have_video,
+            "Page number of words": page_numer_of_words,
+            # not written to the output, used for the near-duplicate check
+            "Content Fingerprint": content_fingerprint,
+        }
+        return AnalyzedPage(url, row, page_content, page_lead, fetched.state, None)
+
+
+# the PageAnalyzer of a process of the pool, created once per process by init_process_analyzer
+_process_analyzer = None
+
+def init_process_analyzer(rules_for_url, rules_for_thema_by_url, rules_for_content, content_class):
+    """
+    Creates the PageAnalyzer of a process of a process pool.
+
+    Args:
+        rules_for_url (dict): Rules for URL keyword analysis.
+        rules_for_thema_by_url (dict): Rules for URL theme analysis.
+        rules_for_content (dict): Rules for content keyword analysis.
+        content_class (str): CSS class name to identify the main content on a webpage.
+    """
+    global _process_analyzer
+    _process_analyzer = PageAnalyzer(
+        ContentAnalyzer(rules_for_url),
+        ContentAnalyzer(rules_for_thema_by_url),
+        ContentAnalyzer(rules_for_content),
+        content_class,
+    )
+
+def analyze_in_process(fetched):
+    """
+    Analyzes a fetched page in a process of a process pool, see init_process_analyzer.
+
+    Args:
+        fetched (FetchedPage): The fetched page.
+
+    Returns:
+        AnalyzedPage: The analyzed page, with the wall and CPU time of its stages for the Metrics of the crawl.
+    """
+    _process_analyzer.metrics = Metrics()
+    analyzed = _process_analyzer.analyze(fetched)
+    return analyzed._replace(stage_times=_process_analyzer.metrics.stage_times())
@@ -0,0 +1,99 @@
+""" A module holding a single fetched web page and the information extracted from it. """
+from dom_extractor import DOMExtractor
+
+class PageSnapshot:
+    """
+    A snapshot of a single web page, fetched once and parsed once.
+
+    All accessors work on the same HTML response, so extracting the title, the lead,
+    the main content and the last modified date of a page costs one HTTP round trip
+    and one parse of the HTML.
+
+    Attributes:
+        url (str): The URL the page was fetched from.
+        html (str): The raw HTML content of the page.
+        dom (ExtractedDOM): The result of the single extraction pass over the HTML.
+        not_modified (bool): True if the page was requested conditionally and the server answered 304 Not Modified.
+        etag (str): The ETag header of the response, if any.
+        http_last_modified (str): The Last-Modified header of the response, if any.
+
+    Methods:
+        title: The title of the web page.
+        lead: Concatenated text content of all elements with the lead class.
+        last_modified_date: The last modified date taken from the text-dimmed class.
+        get_content_by_class(css_class): Concatenated text content of all elements with the specified CSS class.
+    """
+
+    def __init__(self, url, html, extractor=None, not_modified=False, etag=None, http_last_modified=None):
+        """
+        Initializes the PageSnapshot with the URL and the raw HTML content of the page.
+
+        Args:
+            url (str): The URL the page was fetched from.
+            html (str): The raw HTML content of the page.
+            extractor (DOMExtractor, optional): The extractor used to parse the HTML. Defaults to a new DOMExtractor.
+            not_modified (bool): True if the server answered 304 Not Modified. Defaults to False.
+            etag (str, optional): The ETag header of the response.
+            http_last_modified (str, optional): The Last-Modified header of the response.
+        """
+        self.url = url
+        self.html = html
+        self.extractor = extractor or DOMExtractor()
+        self.not_modified = not_modified
+        self.etag = etag
+        self.http_last_modified = http_last_modified
+        self._dom = None
+
+    @property
+    def dom(self):
+        """
+        The extracted document. The HTML is parsed on first access only.
+
+        Returns:
+            ExtractedDOM: The result of the single extraction pass over the HTML.
+        """
+        if self._dom is None:
+            self._dom = self.extractor.extract(self.html)
+        return self._dom
+
+    @property
+    def title(self):
+        """
+        The title of the web page.
+
+        Returns:
+            str: The title of the web page, or 'No title found'.
+        """
+        return self.dom.title
+
+    def get_content_by_class(self, css_class):
+        """
+        Concatenates the text content of all elements with a specified CSS class.
+
+        Args:
+            css_class (str): The CSS class to filter the content.
+
+        Returns:
+            str: Concatenated text content of all elements with the specified CSS class.
+        """
+        return self.dom.get_content_by_class(css_class)
+
+    @property
+    def lead(self):
+        """
+        Concatenated text content of all elements with the lead class.
+
+        Returns:
+            str: Concatenated text content of all elements with the lead class.
+        """
+        return self.get_content_by_class('lead')
+
+    @property
+    def last_modified_date(self):
+        """
+        The last 10 characters of the text-dimmed class content, because this is the part of the text with the date.
+
+        Returns:
+            str: The last modified date of the page.
+        """
+        return self.get_content_by_class('text-dimmed')[-10:]
@@ -0,0 +1,384 @@
+""" A module to schedule the requests of a crawl politely: robots.txt, a token bucket and adaptive concurrency per host. """
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+import requests
+
+# responses that ask the client to slow down
+THROTTLING_STATUS_CODES = (429, 503)
+
+class RobotsDisallowedError(requests.RequestException):
+    """ Raised for a URL that robots.txt does not allow to fetch. """
+
+
+def parse_retry_after(value, now=None):
+    """
+    Returns the seconds to wait according to a Retry-After header, in seconds or as an HTTP date.
+
+    Args:
+        value (str): The value of the header.
+        now (float, optional): The current time.time(). Defaults to now.
+
+    Returns:
+        float: The seconds to wait, None if the value is missing or invalid.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - (now or time.time()))
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def parse_crawl_delay(lines, user_agent):
+    """
+    Returns the Crawl-delay of robots.txt for the user agent. RobotFileParser only reads whole seconds,
+    this also reads fractions like 0.5.
+
+    Args:
+        lines (list of str): The lines of robots.txt.
+        user_agent (str): The user agent.
+
+    Returns:
+        float: The Crawl-delay in seconds, None if robots.txt has none for the user agent.
+    """
+    delays = {}
+    agents, in_rules = [], False
+    for line in lines:
+        key, _, value = line.split('#', 1)[0].partition(':')
+        key, value = key.strip().lower(), value.strip()
+        if key == 'user-agent':
+            if in_rules:
+                agents, in_rules = [], False
+            agents.append(value.lower())
+        elif key in ('allow', 'disallow', 'crawl-delay', 'request-rate'):
+            in_rules = True
+            if key == 'crawl-delay':
+                try:
+                    delay = float(value)
+                except ValueError:
+                    continue
+                for agent in agents:
+                    delays.setdefault(agent, delay)
+    # the same matching as RobotFileParser: the agent token is part of the name of the user agent
+    name = user_agent.split('/')[0].lower()
+    for agent, delay in delays.items():
+        if agent != '*' and agent in name:
+            return delay
+    return delays.get('*')
+
+
+class HostSchedule:
+    """
+    The schedule of one host: its robots.txt rules, a token bucket for the request rate
+    and a request rate and concurrency limit adapted with AIMD (additive increase, multiplicative decrease).
+
+    Attributes:
+        host (str): The host, e.g. www.eak.admin.ch.
+        robots (RobotFileParser): The robots.txt rules, None until they are loaded.
+        rate (float): Requests per second, None for no rate limit.
+        max_rate (float): Upper bound of the rate, from the configuration or robots.txt, None for none.
+        limit (float): Current number of concurrent requests allowed.
+        in_flight (int): Number of requests sent and not yet answered.
+        paused_until (float): time.monotonic() until which no request is sent, after a Retry-After.
+        min_latency (float): Shortest latency seen, the latency of the unloaded server.
+        requests (int): Number of requests sent.
+        throttled (int): Number of 429 and 503 responses.
+        waited (float): Seconds requests waited for a slot, a token or a pause.
+    """
+
+    def __init__(self, host, rate, burst, limit):
+        self.host = host
+        self.robots = None
+        self.rate = rate
+        self.max_rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.refilled_at = time.monotonic()
+        self.limit = limit
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.consecutive_throttles = 0
+        self.decreased_at = 0.0
+        self.sent = deque()
+        self.min_latency = None
+        self.latency = None
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0
+        self.condition = threading.Condition()
+
+    def wait_time(self, now):
+        """
+        Returns the seconds until a request may be sent, 0 if it may be sent now,
+        None if it has to wait for a running request to finish.
+        """
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        if self.rate is None:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RequestScheduler:
+    """
+    A scheduler every request of a crawl passes through. Per host it
+    - loads robots.txt once and rejects disallowed URLs,
+    - limits the request rate with a token bucket, to the Crawl-delay or Request-rate of robots.txt if given,
+    - adapts the number of concurrent requests: it grows by one per round of successful requests,
+      halves on 429/503 responses and errors and shrinks by a quarter when the latency rises far above
+      the unloaded latency,
+    - adapts the request rate: a 429/503 limits it to 70% of the rate sent in the last second,
+      then it grows every second by one request per second (5% for high rates) up to the configured or robots.txt rate,
+    - pauses all requests to the host for the time given by Retry-After.
+    So the crawl runs at the fastest rate the server answers without throttling, without manual tuning.
+
+    Attributes:
+        user_agent (str): The user agent the robots.txt rules are read for.
+        respect_robots (bool): Whether robots.txt is read and followed.
+        max_concurrency (int): Upper bound of concurrent requests per host.
+
+    Methods:
+        acquire(url): Blocks until a request to the URL may be sent and returns its ticket.
+        release(ticket, response): Reports the response, or None for a failed request, of a ticket.
+        capacity(host): Returns the current concurrency limit of a host without blocking.
+        stats(): Returns the state of every host.
+    """
+
+    def __init__(self, user_agent='*', respect_robots=True, requests_per_second=None, burst=None,
+                 initial_concurrency=2, max_concurrency=8, latency_factor=3.0, max_pause=300.0, fetch_robots=None):
+        """
+        Initializes the RequestScheduler.
+
+        Args:
+            user_agent (str): The user agent the robots.txt rules are read for. Defaults to '*'.
+            respect_robots (bool): Whether robots.txt is read and followed. Defaults to True.
+            requests_per_second (float, optional): Maximum requests per second per host, robots.txt may lower it.
+                                                   Defaults to None (no rate limit).
+            burst (int, optional): Size of the token bucket. Defaults to one second of requests, at least 1.
+            initial_concurrency (int): Concurrent requests per host at the start. Defaults to 2.
+            max_concurrency (int): Upper bound of concurrent requests per host. Defaults to 8.
+            latency_factor (float): Latency above this multiple of the unloaded latency counts as overload. Defaults to 3.
+            max_pause (float): Longest pause in seconds after a 429/503, also for a longer Retry-After. Defaults to 300.
+            fetch_robots (callable, optional): Takes the robots.txt URL and returns a requests.Response.
+                                               Defaults to requests.get with the user agent.
+        """
+        self.user_agent = user_agent
+        self.respect_robots = respect_robots
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.initial_concurrency = max(1, min(initial_concurrency, max_concurrency))
+        self.max_concurrency = max_concurrency
+        self.latency_factor = latency_factor
+        self.max_pause = max_pause
+        self.fetch_robots = fetch_robots or self._fetch_robots
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _fetch_robots(self, url):
+        return requests.get(url, headers={'User-Agent': self.user_agent}, timeout=(5, 30))
+
+    def _schedule(self, url):
+        """
+        Returns the schedule of the host of the URL, and loads its robots.txt on first use.
+        """
+        parts = urlsplit(url)
+        with self._lock:
+            schedule = self._hosts.get(parts.netloc)
+            if schedule is None:
+                rate = self.requests_per_second
+                schedule = self._hosts[parts.netloc] = HostSchedule(
+                    parts.netloc, rate, self.burst or max(1, int(rate or 1)), self.initial_concurrency)
+        if self.respect_robots and schedule.robots is None:
+            with schedule.condition:
+                if schedule.robots is None:
+                    self._load_robots(schedule, f"{parts.scheme}://{parts.netloc}/robots.txt")
+        return schedule
+
+    def _load_robots(self, schedule, robots_url):
+        """
+        Reads robots.txt like RobotFileParser.read(): 401 and 403 disallow everything, other errors allow everything.
+        Crawl-delay and Request-rate lower the request rate of the host.
+        """
+        robots = RobotFileParser(robots_url)
+        try:
+            response = self.fetch_robots(robots_url)
+            if response.status_code in (401, 403):
+                robots.disallow_all = True
+            elif response.status_code >= 400:
+                robots.allow_all = True
+            else:
+                robots.parse(response.text.splitlines())
+        except requests.RequestException as e:
+            print(f"robots.txt of {schedule.host} could not be read, all URLs are allowed: {e}")
+            robots.allow_all = True
+
+        rates = [schedule.rate] if schedule.rate else []
+        crawl_delay = None
+        if robots.mtime():  # parsed
+            crawl_delay = parse_crawl_delay(response.text.splitlines(), self.user_agent)
+        if crawl_delay:
+            rates.append(1 / crawl_delay)
+        request_rate = robots.request_rate(self.user_agent)
+        if request_rate and request_rate.requests:
+            rates.append(request_rate.requests / request_rate.seconds)
+        if rates:
+            schedule.rate = schedule.max_rate = min(rates)
+            if crawl_delay or request_rate:
+                # no bursts above the rate the site asks for
+                schedule.burst = schedule.tokens = 1
+        schedule.robots = robots
+
+    def acquire(self, url):
+        """
+        Blocks until a request to the URL may be sent: robots.txt allows it, the host is not paused,
+        a concurrency slot is free and the token bucket has a token.
+
+        Args:
+            url (str): The URL to request.
+
+        Returns:
+            tuple: The ticket of the request, pass it to release().
+
+        Raises:
+            RobotsDisallowedError: If robots.txt does not allow the URL.
+        """
+        schedule = self._schedule(url)
+        if self.respect_robots and not schedule.robots.can_fetch(self.user_agent, url):
+            raise RobotsDisallowedError(f"robots.txt of {schedule.host} disallows {url}")
+        with schedule.condition:
+            started = time.monotonic()
+            while True:
+                now = time.monotonic()
+                wait = schedule.wait_time(now)
+                if wait == 0:
+                    break
+                schedule.condition.wait(wait)
+            if schedule.rate is not None:
+                schedule.tokens -= 1
+            schedule.sent.append(now)
+            while schedule.sent[0] < now - 1:
+                schedule.sent.popleft()
+            schedule.in_flight += 1
+            schedule.requests += 1
+            schedule.waited += now - started
+        return schedule, now
+
+    def release(self, ticket, response):
+        """
+        Frees the slot of a request and adapts the schedule of its host to the response.
+
+        Args:
+            ticket (tuple): The ticket returned by acquire().
+            response (requests.Response): The response, None if the request failed without one.
+        """
+        schedule, sent_at = ticket
+        now = time.monotonic()
+        latency = now - sent_at
+        with schedule.condition:
+            schedule.in_flight -= 1
+            if response is not None and response.status_code in THROTTLING_STATUS_CODES:
+                schedule.throttled += 1
+                schedule.consecutive_throttles += 1
+                pause = parse_retry_after(response.headers.get('Retry-After'))
+                if pause is None:
+                    pause = 2 ** (schedule.consecutive_throttles - 1)
+                schedule.paused_until = max(schedule.paused_until, now + min(pause, self.max_pause))
+                if self._decrease(schedule, sent_at, now, 0.5):
+                    # the server limits the rate: below the rate sent in the last second, and no bursts
+                    sent_rate = max(1, sum(1 for time_sent in schedule.sent if time_sent >= now - 1))
+                    schedule.rate = max(0.1, 0.7 * min(schedule.rate or sent_rate, sent_rate))
+                    schedule.burst = 1
+                    schedule.tokens = min(schedule.tokens, 1)
+                    schedule.refilled_at = now
+            elif response is None or response.status_code >= 500:
+                self._decrease(schedule, sent_at, now, 0.5)
+            else:
+                schedule.consecutive_throttles = 0
+                if schedule.min_latency is None or latency < schedule.min_latency:
+                    schedule.min_latency = latency
+                schedule.latency = latency if schedule.latency is None else 0.8 * schedule.latency + 0.2 * latency
+                if schedule.latency > self.latency_factor * max(schedule.min_latency, 0.001):
+                    self._decrease(schedule, sent_at, now, 0.75)
+                else:
+                    # +1 after a full round of limit successful requests
+                    schedule.limit = min(self.max_concurrency, schedule.limit + 1 / schedule.limit)
+                if schedule.rate is not None and (schedule.max_rate is None or schedule.rate < schedule.max_rate):
+                    # every second +1 request per second, or +5% for higher rates
+                    schedule.rate = min(schedule.max_rate or float('inf'), schedule.rate + max(1, 0.05 * schedule.rate) / schedule.rate)
+            schedule.condition.notify_all()
+
+    def _decrease(self, schedule, sent_at, now, factor):
+        """
+        Shrinks the concurrency limit, once per overload: requests sent before the last decrease
+        were sent at the old limit and do not count again. Returns True if the limit was decreased.
+        """
+        if sent_at < schedule.decreased_at:
+            return False
+        schedule.limit = max(1.0, schedule.limit * factor)
+        schedule.decreased_at = now
+        return True
+
+    def capacity(self, host):
+        """
+        Returns the number of concurrent requests the host currently allows, without blocking.
+        Read without the lock of the host, which is held while its robots.txt is loaded; the value is a hint
+        for a worker pool that should not hand threads to a saturated host.
+
+        Args:
+            host (str): The host, e.g. www.eak.admin.ch.
+
+        Returns:
+            int: The current concurrency limit, 0 while the host is paused, None for a host without requests yet.
+        """
+        schedule = self._hosts.get(host)
+        if schedule is None:
+            return None
+        if time.monotonic() < schedule.paused_until:
+            return 0
+        return int(schedule.limit)
+
+    def stats(self):
+        """
+        Returns the state of every host.
+
+        Returns:
+            dict: Per host the requests, throttled responses, concurrency limit, rate and seconds waited.
+        """
+        with self._lock:
+            schedules = list(self._hosts.values())
+        return {
+            schedule.host: {
+                "requests": schedule.requests,
+                "throttled": schedule.throttled,
+                "concurrency": round(schedule.limit, 2),
+                "rate": schedule.rate,
+                "waited_seconds": round(schedule.waited, 3),
+            }
+            for schedule in schedules
+        }
+
+
+# Example usage
+if __name__ == "__main__":
+    scheduler = RequestScheduler(user_agent="SitemapAIExtractor")
+    url = 'https://www.eak.admin.ch/eak/de/home.html'
+    try:
+        ticket = scheduler.acquire(url)
+        response = requests.get(url, timeout=(5, 30))
+        scheduler.release(ticket, response)
+        print(response.status_code, scheduler.stats())
+    except requests.RequestException as e:
+        print(f"An error occurred: {e}")
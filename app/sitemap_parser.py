@@ -1,26 +1,48 @@
 """ A module to parse sitemaps and extract URLs. """
+import gzip
+import io
 import xml.etree.ElementTree as ET
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from http_transport import HTTPTransport
+
+SITEMAP_NAMESPACE = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+SitemapEntry = namedtuple('SitemapEntry', ['loc', 'lastmod', 'changefreq', 'priority'], defaults=(None, None, None))
 
 class SitemapParser:
     """
     A class to parse sitemaps and extract URLs.
 
+    Sitemaps are read as a stream with iterparse: entries are produced while the XML is still
+    being downloaded, sitemap indexes are followed recursively (child sitemaps are fetched
+    concurrently), gzip-compressed sitemaps are decompressed on the fly and reading stops
+    as soon as enough entries are produced.
+
     Attributes:
         sitemap_url (str): The URL of the sitemap to be parsed.
+        transport (HTTPTransport): The HTTP transport used to fetch the sitemap.
+        max_concurrent_fetches (int): Maximum number of child sitemaps fetched concurrently.
 
     Methods:
         get_urls(filter_str=None): Extracts and optionally filters URLs from the sitemap.
+        get_entries(filter_str=None): Extracts and optionally filters URLs with their lastmod from the sitemap.
+        iter_entries(filter_str=None, k=None): Yields the sitemap entries while the sitemaps are parsed.
     """
 
-    def __init__(self, sitemap_url):
+    def __init__(self, sitemap_url, transport=None, max_concurrent_fetches=4):
         """
         Initializes the SitemapParser with a specified sitemap URL.
 
         Args:
             sitemap_url (str): The URL of the sitemap to parse.
+            transport (HTTPTransport, optional): The HTTP transport to use. Defaults to a new HTTPTransport.
+            max_concurrent_fetches (int): Maximum number of child sitemaps fetched concurrently. Defaults to 4.
         """
         self.sitemap_url = sitemap_url
+        self.transport = transport or HTTPTransport()
+        self.max_concurrent_fetches = max_concurrent_fetches
 
     def get_urls(self, filter_str=None, k=None):
         """
@@ -31,7 +53,7 @@ class SitemapParser:
         containing the filter string are returned.
 
         Args:
-            filter_str (str, optional): A string to filter the URLs. 
+            filter_str (str, optional): A string to filter the URLs.
                                         Defaults to None, which means no filter is applied.
 
         Returns:
@@ -42,32 +64,165 @@ class SitemapParser:
             requests.RequestException: If there is an issue with network access.
             xml.etree.ElementTree.ParseError: If there is an error parsing the XML.
         """
+        return [entry.loc for entry in self.get_entries(filter_str=filter_str, k=k)]
+
+    def get_entries(self, filter_str=None, k=None):
+        """
+        Retrieves the URLs from the sitemap together with their lastmod and applies an optional filter.
+
+        Args:
+            filter_str (str, optional): A string to filter the URLs.
+                                        Defaults to None, which means no filter is applied.
+            k (int, optional): Maximum number of entries to return. Defaults to None (all).
+
+        Returns:
+            list of SitemapEntry: (loc, lastmod, changefreq, priority) of every URL, missing values are None.
+
+        Raises:
+            requests.RequestException: If there is an issue with network access.
+            xml.etree.ElementTree.ParseError: If there is an error parsing the XML.
+        """
+        entries = list(self.iter_entries(filter_str=filter_str, k=k))
+        print(f"Filtered to {len(entries)} URLs containing '{filter_str}'. (k={k})")
+        return entries
+
+    def iter_entries(self, filter_str=None, k=None):
+        """
+        Yields the entries of the sitemap while it is parsed.
+        Entries are deduplicated across child sitemaps. Once k matching entries are produced,
+        no further sitemap is fetched or parsed.
+
+        Args:
+            filter_str (str, optional): A string to filter the URLs. Defaults to None (no filter).
+            k (int, optional): Maximum number of entries to yield. Defaults to None (all).
+
+        Yields:
+            SitemapEntry: (loc, lastmod, changefreq, priority) of every matching URL.
+
+        Raises:
+            requests.RequestException: If there is an issue with network access.
+            xml.etree.ElementTree.ParseError: If there is an error parsing the XML.
+        """
+        seen_urls = set()
+        produced = 0
+        pool = ThreadPoolExecutor(max_workers=self.max_concurrent_fetches)
+        entries = self._iter_sitemap(self._open(self.sitemap_url), self.sitemap_url, pool, {self.sitemap_url})
+        try:
+            for entry in entries:
+                if entry.loc in seen_urls:
+                    continue
+                seen_urls.add(entry.loc)
+                if filter_str and filter_str not in entry.loc:
+                    continue
+                yield entry
+                produced += 1
+                if k and produced >= k:
+                    return
+        finally:
+            # stops reading the open sitemap and drops the child sitemaps not fetched yet
+            entries.close()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _open(self, url):
+        """
+        Opens a sitemap as a stream of XML bytes, gzip-compressed sitemaps are decompressed on the fly.
+
+        Args:
+            url (str): The URL of the sitemap.
+
+        Returns:
+            file-like: The XML bytes of the sitemap.
+
+        Raises:
+            requests.RequestException: If there is an issue with network access.
+        """
         try:
             # Fetching the XML data
-            response = requests.get(self.sitemap_url)
+            response = self.transport.get(url, stream=True)
             response.raise_for_status()  # Raises an exception for HTTP errors
         except requests.RequestException as request_exception:
             raise requests.RequestException(f"Failed to retrieve sitemap: {request_exception}")
 
-        try:
-            # Parsing the XML data
-            root = ET.fromstring(response.content)
+        response.raw.decode_content = True  # undo a Content-Encoding, e.g. gzip
+        response.raw.auto_close = False  # a small sitemap is read completely by the first peek
+        stream = io.BufferedReader(response.raw)
+        if stream.peek(2)[:2] == b'\x1f\x8b':  # a .xml.gz file
+            return gzip.GzipFile(fileobj=stream)
+        return stream
+
+    def _download(self, url):
+        """
+        Downloads a child sitemap completely, so that it can be fetched in the background.
+
+        Args:
+            url (str): The URL of the sitemap.
 
-            # Extracting URLs
-            urls = [url.text for url in root.findall('.//{http://www.sitemaps.org/schemas/sitemap/0.9}loc')]
-            print(f"Found {len(urls)} URLs in sitemap.")
+        Returns:
+            io.BytesIO: The XML bytes of the sitemap.
+        """
+        with self._open(url) as stream:
+            return io.BytesIO(stream.read())
 
-            # Applying the filter if provided
-            if filter_str:
-                urls = [url for url in urls if filter_str in url]
+    def _iter_sitemap(self, stream, url, pool, seen_sitemaps):
+        """
+        Parses one sitemap (urlset or sitemapindex) with iterparse and yields its entries.
+        The child sitemaps of an index are fetched concurrently and parsed in index order.
 
-            if k:
-                urls = urls[:k]
+        Args:
+            stream (file-like): The XML bytes of the sitemap.
+            url (str): The URL of the sitemap, for error messages.
+            pool (ThreadPoolExecutor): The pool fetching child sitemaps.
+            seen_sitemaps (set of str): The sitemaps already followed, to avoid cycles.
 
-            print(f"Filtered to {len(urls)} URLs containing '{filter_str}'. (k={k})")
-            return urls
+        Yields:
+            SitemapEntry: The entries of the sitemap and of all its child sitemaps.
+        """
+        child_sitemaps = []
+        try:
+            with stream:
+                root = None
+                for event, element in ET.iterparse(stream, events=('start', 'end')):
+                    if event == 'start':
+                        if root is None:
+                            root = element
+                        continue
+                    if element.tag == f'{SITEMAP_NAMESPACE}url':
+                        yield SitemapEntry(
+                            _text(element, 'loc'), _text(element, 'lastmod'),
+                            _text(element, 'changefreq'), _text(element, 'priority'),
+                        )
+                        root.clear()  # keeps the memory constant for large sitemaps
+                    elif element.tag == f'{SITEMAP_NAMESPACE}sitemap':
+                        child_url = _text(element, 'loc')
+                        if child_url and child_url not in seen_sitemaps:
+                            seen_sitemaps.add(child_url)
+                            child_sitemaps.append(child_url)
+                        root.clear()
         except ET.ParseError as parse_error:
-            raise ET.ParseError(f"Failed to parse XML data: {parse_error}")
+            raise ET.ParseError(f"Failed to parse XML data of {url}: {parse_error}")
+
+        # Fetching the child sitemaps of an index concurrently, a few ahead of the one being parsed
+        pending = [(child_url, pool.submit(self._download, child_url)) for child_url in child_sitemaps[:self.max_concurrent_fetches]]
+        next_child = len(pending)
+        try:
+            while pending:
+                child_url, future = pending.pop(0)
+                if next_child < len(child_sitemaps):
+                    pending.append((child_sitemaps[next_child], pool.submit(self._download, child_sitemaps[next_child])))
+                    next_child += 1
+                yield from self._iter_sitemap(future.result(), child_url, pool, seen_sitemaps)
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def _text(element, name):
+    """
+    Returns the stripped text of a sitemap child element, or None if it is missing.
+    """
+    text = element.findtext(f'{SITEMAP_NAMESPACE}{name}')
+    return text.strip() if text else None
+
 
 # Example usage
 if __name__ == "__main__":
@@ -77,5 +232,8 @@ if __name__ == "__main__":
     try:
         filtered_urls = parser.get_urls(filter_str="/de/home/Firmen/Anschluss/")
         print(filtered_urls)
+
+        for entry in parser.iter_entries(k=3):
+            print(entry)
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -0,0 +1,278 @@
+""" A module to run the per-URL work of a crawl as a pipeline of stages, each with its own pool of threads or processes. """
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+_STOP = object()
+
+
+def _timed_call(function, value):
+    """ Runs the function in a process and returns its result with the seconds it took. """
+    start = time.perf_counter()
+    return function(value), time.perf_counter() - start
+
+
+class Finished:
+    """
+    The final result of an item produced by an early stage, e.g. a reused row; the later stages pass it on unchanged.
+
+    Attributes:
+        value (object): The result of the item.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Stage:
+    """
+    A stage of a StagedPipeline.
+
+    Attributes:
+        name (str): The name of the stage, e.g. 'fetch'.
+        function (callable): Takes the output of the previous stage, or the item for the first stage.
+        workers (int): Number of threads or processes of the stage.
+        processes (bool): If True, the function runs in a process pool; it and its input and output must be picklable.
+        initializer (callable): Runs once in every process of a process stage.
+        initargs (tuple): Arguments of the initializer.
+    """
+
+    def __init__(self, name, function, workers=1, processes=False, initializer=None, initargs=()):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.processes = processes
+        self.initializer = initializer
+        self.initargs = initargs
+        self.input = queue.Queue()
+        self.processed = 0
+        self.busy = 0.0
+        self.max_queue_depth = 0
+        self._lock = threading.Lock()
+
+    def put(self, entry):
+        self.input.put(entry)
+        depth = self.input.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def record(self, seconds):
+        with self._lock:
+            self.processed += 1
+            self.busy += seconds
+
+
+class StagedPipeline:
+    """
+    A pipeline that passes every item through a sequence of stages, for example I/O threads that fetch pages,
+    a process pool that parses and analyzes them on all cores, and threads that finish the rows.
+    All stages work at the same time on different items, and the results are returned in input order.
+    At most max_in_flight items are between the input and the consumer, so a slow stage or a slow consumer
+    stops the input (backpressure) and memory stays bounded.
+    A failing item keeps its error and skips the remaining stages; a stage can return Finished(value)
+    to skip the remaining stages with a result.
+
+    Attributes:
+        stages (list of Stage): The stages, in order.
+        max_in_flight (int): Maximum number of items in the pipeline.
+
+    Methods:
+        run(items): Passes the items through the stages and yields (item, result, error) in input order.
+        stats(): Returns the number of processed items, the utilization and the queue depths per stage.
+    """
+
+    def __init__(self, stages, max_in_flight=None, mp_context=None):
+        """
+        Initializes the StagedPipeline.
+
+        Args:
+            stages (list of Stage): The stages, in order.
+            max_in_flight (int, optional): Maximum number of items in the pipeline.
+                                           Defaults to twice the number of all workers.
+            mp_context (multiprocessing context, optional): The context of the process pools.
+                                                            Defaults to fork where available, so that the
+                                                            processes need not import the main script again.
+        """
+        self.stages = stages
+        self.max_in_flight = max_in_flight or 2 * sum(stage.workers for stage in stages)
+        if mp_context is None and 'fork' in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context('fork')
+        self.mp_context = mp_context
+        self.started = None
+        self.finished = None
+
+    def run(self, items):
+        """
+        Passes the items through the stages.
+
+        Args:
+            items (iterable): The items, e.g. URLs.
+
+        Yields:
+            tuple: (item, result, error) for every item in input order, error is None if all stages succeeded.
+        """
+        output = queue.Queue()
+        in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        # process pools first: their processes are forked before any thread of the pipeline runs
+        pools = {}
+        for stage in self.stages:
+            if stage.processes:
+                pools[stage.name] = ProcessPoolExecutor(stage.workers, mp_context=self.mp_context,
+                                                        initializer=stage.initializer, initargs=stage.initargs)
+                pools[stage.name].submit(time.sleep, 0).result()
+        self.started = time.perf_counter()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            next_put = self.stages[index + 1].put if index + 1 < len(self.stages) else output.put
+            if stage.processes:
+                worker = threading.Thread(target=self._dispatch, args=(stage, pools[stage.name], next_put), daemon=True)
+                threads.append((stage, worker))
+            else:
+                threads.extend((stage, threading.Thread(target=self._work, args=(stage, next_put), daemon=True))
+                               for _ in range(stage.workers))
+        total = []
+        feeder_stop = threading.Event()
+
+        def feed():
+            count = 0
+            for item in items:
+                in_flight.acquire()
+                if feeder_stop.is_set():
+                    break
+                self.stages[0].put((count, item, item, None))
+                count += 1
+            total.append(count)
+            output.put(_STOP)
+
+        threads.append((None, threading.Thread(target=feed, daemon=True)))
+        for _, thread in threads:
+            thread.start()
+
+        results = {}
+        next_index = 0
+        try:
+            while not total or next_index < total[0]:
+                entry = output.get()
+                if entry is _STOP:
+                    continue
+                index, item, value, error = entry
+                results[index] = (item, value.value if isinstance(value, Finished) else value, error)
+                while next_index in results:
+                    yield results.pop(next_index)
+                    next_index += 1
+                    in_flight.release()
+        finally:
+            feeder_stop.set()
+            try:
+                in_flight.release()  # a feeder waiting for a slot sees the stop
+            except ValueError:
+                pass
+            for stage, thread in threads:
+                if stage is not None:
+                    stage.put(_STOP)
+            for stage, thread in threads:
+                if stage is not None:
+                    thread.join()
+            for pool in pools.values():
+                pool.shutdown(cancel_futures=True)
+            self.finished = time.perf_counter()
+
+    def _work(self, stage, next_put):
+        """
+        A thread of a thread stage: applies the function to the entries of the stage until it is stopped.
+        """
+        while True:
+            entry = stage.input.get()
+            if entry is _STOP:
+                return
+            index, item, value, error = entry
+            if error is None and not isinstance(value, Finished):
+                start = time.perf_counter()
+                try:
+                    value = stage.function(value)
+                except Exception as e:
+                    error = e
+                stage.record(time.perf_counter() - start)
+            next_put((index, item, value, error))
+
+    def _dispatch(self, stage, pool, next_put):
+        """
+        The thread of a process stage: submits the entries of the stage to the process pool,
+        at most two per process, so that the others wait in the queue of the stage.
+        """
+        slots = threading.BoundedSemaphore(2 * stage.workers)
+
+        def done(future, index, item):
+            slots.release()
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                next_put((index, item, None, error))
+                return
+            result, seconds = future.result()
+            stage.record(seconds)
+            next_put((index, item, result, None))
+
+        while True:
+            entry = stage.input.get()
+            if entry is _STOP:
+                return
+            index, item, value, error = entry
+            if error is not None or isinstance(value, Finished):
+                next_put(entry)
+                continue
+            slots.acquire()
+            try:
+                future = pool.submit(_timed_call, stage.function, value)
+            except RuntimeError as e:  # the pool is shut down
+                slots.release()
+                next_put((index, item, None, e))
+                continue
+            future.add_done_callback(lambda future, index=index, item=item: done(future, index, item))
+
+    def stats(self):
+        """
+        Returns the statistics of every stage.
+
+        Returns:
+            dict: Per stage the workers, processed items, busy seconds, utilization (busy time per worker
+                  and second of the run), current and maximal queue depth.
+        """
+        elapsed = ((self.finished or time.perf_counter()) - self.started) if self.started else 0.0
+        return {
+            stage.name: {
+                "workers": stage.workers,
+                "processes": stage.processes,
+                "processed": stage.processed,
+                "busy_seconds": round(stage.busy, 3),
+                "utilization": round(min(1.0, stage.busy / (stage.workers * elapsed)), 3) if elapsed else 0.0,
+                "queue_depth": stage.input.qsize(),
+                "max_queue_depth": stage.max_queue_depth,
+            }
+            for stage in self.stages
+        }
+
+
+def _square(number):
+    return number * number
+
+
+# Example usage
+if __name__ == "__main__":
+    def slow_increment(number):
+        time.sleep(0.05)
+        if number == 7:
+            raise ValueError("broken item")
+        return number + 1
+
+    pipeline = StagedPipeline([
+        Stage("io", slow_increment, workers=8),
+        Stage("cpu", _square, workers=2, processes=True),
+        Stage("finish", str, workers=1),
+    ])
+    for item, result, error in pipeline.run(range(20)):
+        print(item, result, error)
+    print(pipeline.stats())
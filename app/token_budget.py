@@ -0,0 +1,255 @@
+""" A module to fit page texts into the context window of an LLM: token counting, chunking and packing. """
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # the heuristic below is used instead
+    tiktoken = None
+
+# context windows in tokens, prompt and answer together
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo-1106": 16385,
+    "gpt-3.5-turbo-0125": 16385,
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 16385
+
+# without tiktoken: German text has about 4 characters per token, 3 keeps a safety margin
+CHARS_PER_TOKEN = 3
+
+PARAGRAPH_PATTERN = re.compile(r'\n\s*\n|\n')
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+')
+
+
+class TokenCounter:
+    """
+    A class to count the tokens of a text for a model, with tiktoken if it is installed
+    and with a conservative characters-per-token estimate otherwise.
+
+    Attributes:
+        model (str): The name of the model.
+        exact (bool): True if tiktoken counts the tokens, False for the estimate.
+
+    Methods:
+        count(text): Returns the number of tokens of the text.
+    """
+
+    def __init__(self, model):
+        """
+        Initializes the TokenCounter.
+
+        Args:
+            model (str): The name of the model, unknown models use the cl100k_base encoding.
+        """
+        self.model = model
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        self.exact = self._encoding is not None
+
+    def count(self, text):
+        """
+        Returns the number of tokens of the text.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            int: The number of tokens, estimated if tiktoken is not installed.
+        """
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def split_into_chunks(text, max_tokens, counter):
+    """
+    Splits a text into chunks of at most max_tokens tokens.
+    The text is split at paragraphs, then at sentences, then at words, and a word that is too long by itself
+    at characters. The parts are joined again greedily, so chunks end at the largest boundary that fits.
+    Every chunk is counted, so it fits even where joining parts gives more tokens than the parts alone.
+
+    Args:
+        text (str): The text.
+        max_tokens (int): Maximum number of tokens per chunk.
+        counter (TokenCounter): Counts the tokens.
+
+    Returns:
+        list of str: The chunks, in text order.
+    """
+    def fitting(parts, separator):
+        # the parts joined greedily by their token counts, a chunk that turns out too long is halved
+        if len(parts) > 1 and counter.count(separator.join(parts)) > max_tokens:
+            half = len(parts) // 2
+            return fitting(parts[:half], separator) + fitting(parts[half:], separator)
+        return [separator.join(parts)]
+
+    def join(parts, separator):
+        chunks = []
+        current, current_tokens = [], 0
+        for part in parts:
+            part_tokens = counter.count(part) + 1
+            if current and current_tokens + part_tokens > max_tokens:
+                chunks.extend(fitting(current, separator))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+        if current:
+            chunks.extend(fitting(current, separator))
+        return chunks
+
+    def characters(word):
+        # slices of a word without spaces, halved until they fit; a single character is never split
+        pieces = []
+        start = 0
+        while start < len(word):
+            end = min(len(word), start + max(1, max_tokens * CHARS_PER_TOKEN))
+            while end - start > 1 and counter.count(word[start:end]) > max_tokens:
+                end = start + (end - start) // 2
+            pieces.append(word[start:end])
+            start = end
+        return pieces
+
+    def parts(segment, level):
+        if counter.count(segment) <= max_tokens:
+            return [segment]
+        if level == 0:
+            pieces = PARAGRAPH_PATTERN.split(segment)
+        elif level == 1:
+            pieces = SENTENCE_PATTERN.split(segment)
+        else:
+            words = [piece for word in segment.split() for piece in
+                     (characters(word) if counter.count(word) > max_tokens else [word])]
+            return join(words, ' ')
+        return [part for piece in pieces if piece.strip() for part in parts(piece.strip(), level + 1)]
+
+    return join(parts(text.strip(), 0), '\n')
+
+
+def pack(items, max_tokens, max_items):
+    """
+    Packs items into batches of at most max_tokens tokens and max_items items, keeping their order.
+
+    Args:
+        items (list of tuple): (item, tokens) of every item.
+        max_tokens (int): Maximum number of tokens per batch.
+        max_items (int): Maximum number of items per batch.
+
+    Returns:
+        list of list: The batches of items.
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for item, tokens in items:
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.tokens = 0
+        self.results = None
+        self.error = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class PromptBatcher:
+    """
+    A class that packs items submitted by concurrent threads into one batch.
+    The first thread of a batch waits up to max_wait seconds for other threads to join,
+    then runs the batch for all of them; a batch also runs as soon as it is full.
+
+    Attributes:
+        max_tokens (int): Maximum number of tokens per batch.
+        max_items (int): Maximum number of items per batch.
+        max_wait (float): Seconds the first item of a batch waits for more items.
+
+    Methods:
+        submit(item, tokens): Adds an item to the open batch and returns its result once the batch ran.
+    """
+
+    def __init__(self, run_batch, max_tokens, max_items, max_wait):
+        """
+        Initializes the PromptBatcher.
+
+        Args:
+            run_batch (callable): Takes the list of items of a batch and returns their results in the same order.
+            max_tokens (int): Maximum number of tokens per batch.
+            max_items (int): Maximum number of items per batch.
+            max_wait (float): Seconds the first item of a batch waits for more items.
+        """
+        self.run_batch = run_batch
+        self.max_tokens = max_tokens
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self._open = None
+        self._lock = threading.Lock()
+
+    def submit(self, item, tokens):
+        """
+        Adds an item to the open batch and returns its result once the batch ran.
+
+        Args:
+            item (object): The item, passed to run_batch.
+            tokens (int): The number of tokens of the item.
+
+        Returns:
+            object: The result of the item.
+        """
+        with self._lock:
+            batch = self._open
+            if batch is not None and (batch.tokens + tokens > self.max_tokens or len(batch.items) >= self.max_items):
+                self._open = None
+                batch.full.set()
+                batch = None
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            batch.tokens += tokens
+            if len(batch.items) >= self.max_items:
+                self._open = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            try:
+                batch.results = self.run_batch(batch.items)
+            except Exception as error:
+                batch.error = error
+            batch.done.set()
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
+
+
+# Example usage
+if __name__ == "__main__":
+    counter = TokenCounter("gpt-3.5-turbo-1106")
+    text = "Die EAK ist die Ausgleichskasse des Bundes. Sie erhebt Beiträge und zahlt Leistungen aus.\n" * 50
+    chunks = split_into_chunks(text, 300, counter)
+    print(counter.exact, counter.count(text), [counter.count(chunk) for chunk in chunks])
+    print(pack([("a", 100), ("b", 200), ("c", 50), ("d", 400)], max_tokens=400, max_items=2))
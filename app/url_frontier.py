@@ -0,0 +1,359 @@
+""" A module with the URL frontier shared by the workers of a distributed crawl. """
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+# a URL leased by a worker, lastmod is the sitemap lastmod for incremental recrawls
+FrontierEntry = namedtuple('FrontierEntry', ['position', 'url', 'lastmod'])
+# a finished URL, row is set for done URLs and error for failed ones
+FrontierResult = namedtuple('FrontierResult', ['position', 'url', 'status', 'row', 'error'])
+
+
+class URLFrontier(ABC):
+    """
+    Base class of the URL frontiers. A frontier holds the URLs of a crawl in sitemap order and hands them out
+    to workers as leases. A worker keeps its leases alive with heartbeats; the leases of a worker that stops
+    sending heartbeats expire and their URLs are leased to other workers. Workers report the row or the
+    error of every URL, and the coordinator reads the results back in sitemap order.
+    Subclasses store the frontier, e.g. in a SQLite file that all worker processes of one machine can open.
+
+    Methods:
+        add(entries, resume=False): Fills the frontier with the sitemap entries of a crawl.
+        generation(): Returns the number of crawls added to the frontier.
+        lease(worker_id, count, lease_seconds): Leases up to count pending URLs to a worker.
+        heartbeat(worker_id, lease_seconds): Extends all leases of a worker.
+        complete(url, row): Records the row of a URL.
+        fail(url, error): Records the failure of a URL.
+        results(position, limit): Returns the finished URLs from a position on, up to the first unfinished one.
+        counts(): Returns the number of URLs per status.
+        workers(): Returns the last heartbeat and the number of leased URLs per worker.
+        reassigned(): Returns the number of URLs leased more than once.
+        is_finished(): Whether all URLs are done or failed.
+        close(): Closes the frontier.
+    """
+
+    @abstractmethod
+    def add(self, entries, resume=False):
+        pass
+
+    @abstractmethod
+    def generation(self):
+        pass
+
+    @abstractmethod
+    def lease(self, worker_id, count, lease_seconds):
+        pass
+
+    @abstractmethod
+    def heartbeat(self, worker_id, lease_seconds):
+        pass
+
+    @abstractmethod
+    def complete(self, url, row):
+        pass
+
+    @abstractmethod
+    def fail(self, url, error):
+        pass
+
+    @abstractmethod
+    def results(self, position, limit=500):
+        pass
+
+    @abstractmethod
+    def counts(self):
+        pass
+
+    @abstractmethod
+    def workers(self):
+        pass
+
+    @abstractmethod
+    def reassigned(self):
+        pass
+
+    def is_finished(self):
+        counts = self.counts()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SQLiteFrontier(URLFrontier):
+    """
+    A URL frontier in a SQLite file. Every process opens the file itself, so a coordinator and
+    several worker processes on one machine crawl together. Workers on other machines need a frontier
+    on a server, SQLite files must not be shared over a network file system.
+    Leases are handed out in an IMMEDIATE transaction, so two workers never lease the same URL.
+    A URL whose lease expired max_attempts times is marked failed, so a page that kills its workers
+    does not stop the crawl.
+
+    Attributes:
+        path (str): Path of the SQLite file.
+        max_attempts (int): Number of leases of a URL before it is given up.
+    """
+
+    def __init__(self, path, max_attempts=3, timeout=60.0):
+        """
+        Initializes the SQLiteFrontier and creates the SQLite file if needed.
+
+        Args:
+            path (str): Path of the SQLite file.
+            max_attempts (int): Number of leases of a URL before it is given up. Defaults to 3.
+            timeout (float): Seconds to wait for a lock held by another process. Defaults to 60.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # autocommit, the transactions are started explicitly
+        self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS frontier ("
+            "position INTEGER PRIMARY KEY, url TEXT UNIQUE, lastmod TEXT, status TEXT, worker TEXT, "
+            "lease_expires REAL, attempts INTEGER, row TEXT, error TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS frontier_status ON frontier (status, position)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS worker (id TEXT PRIMARY KEY, heartbeat REAL)")
+        # the generation is counted up by every add, so workers can tell a new crawl from the finished last one
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+
+    def add(self, entries, resume=False):
+        """
+        Fills the frontier with the sitemap entries of a crawl.
+        A new crawl forgets the frontier. A resumed crawl keeps the finished rows, extracts the failed URLs again,
+        adds new URLs as pending and drops URLs no longer in the sitemap. Both start a new generation.
+
+        Args:
+            entries (list of SitemapEntry): The entries of the crawl, in output order.
+            resume (bool): Whether to keep the rows of the stored crawl. Defaults to False.
+
+        Returns:
+            int: Number of URLs already done.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                previous = {}
+                if resume:
+                    previous = {url: (status, row) for url, status, row in
+                                self._db.execute("SELECT url, status, row FROM frontier WHERE status = ?", (DONE,))}
+                self._db.execute("DELETE FROM frontier")
+                self._db.execute("DELETE FROM worker")
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO frontier (position, url, lastmod, status, attempts, row) VALUES (?, ?, ?, ?, 0, ?)",
+                    ((position, entry.loc, entry.lastmod, *previous.get(entry.loc, (PENDING, None)))
+                     for position, entry in enumerate(entries)),
+                )
+                self._db.execute("INSERT INTO meta VALUES ('generation', 1) "
+                                 "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            return self._db.execute("SELECT COUNT(*) FROM frontier WHERE status = ?", (DONE,)).fetchone()[0]
+
+    def generation(self):
+        """
+        Returns the number of crawls added to the frontier, 0 if it was never filled.
+
+        Returns:
+            int: The generation of the current crawl.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def lease(self, worker_id, count, lease_seconds):
+        """
+        Leases up to count pending URLs to a worker, in sitemap order.
+        Expired leases are released first, so the URLs of dead workers are leased again.
+
+        Args:
+            worker_id (str): The ID of the worker.
+            count (int): Maximum number of URLs.
+            lease_seconds (float): Seconds until the leases expire without a heartbeat.
+
+        Returns:
+            list of FrontierEntry: The leased URLs, empty if no URL is pending.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "UPDATE frontier SET status = ?, worker = NULL, row = NULL, error = ? "
+                    "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                    (FAILED, f"lease expired {self.max_attempts} times", LEASED, now, self.max_attempts),
+                )
+                self._db.execute(
+                    "UPDATE frontier SET status = ?, worker = NULL WHERE status = ? AND lease_expires < ?",
+                    (PENDING, LEASED, now),
+                )
+                entries = [FrontierEntry(*entry) for entry in self._db.execute(
+                    "SELECT position, url, lastmod FROM frontier WHERE status = ? ORDER BY position LIMIT ?",
+                    (PENDING, count),
+                )]
+                self._db.executemany(
+                    "UPDATE frontier SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE position = ?",
+                    ((LEASED, worker_id, now + lease_seconds, entry.position) for entry in entries),
+                )
+                self._db.execute("INSERT OR REPLACE INTO worker VALUES (?, ?)", (worker_id, now))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return entries
+
+    def heartbeat(self, worker_id, lease_seconds):
+        """
+        Extends all leases of a worker.
+
+        Args:
+            worker_id (str): The ID of the worker.
+            lease_seconds (float): Seconds from now until the leases expire.
+
+        Returns:
+            int: Number of extended leases.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                extended = self._db.execute(
+                    "UPDATE frontier SET lease_expires = ? WHERE status = ? AND worker = ?",
+                    (now + lease_seconds, LEASED, worker_id),
+                ).rowcount
+                self._db.execute("INSERT OR REPLACE INTO worker VALUES (?, ?)", (worker_id, now))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return extended
+
+    def complete(self, url, row):
+        """
+        Records the row of a URL. The first result of a URL wins, e.g. if a worker was thought dead
+        and its URL was leased again.
+
+        Args:
+            url (str): The URL.
+            row (dict): The extracted information of the page.
+        """
+        self._finish(url, DONE, json.dumps(row, ensure_ascii=False), None)
+
+    def fail(self, url, error):
+        """
+        Records the failure of a URL, it is extracted again when the crawl is resumed.
+
+        Args:
+            url (str): The URL.
+            error (str): The error message.
+        """
+        self._finish(url, FAILED, None, error)
+
+    def _finish(self, url, status, row, error):
+        with self._lock:
+            self._db.execute(
+                "UPDATE frontier SET status = ?, row = ?, error = ?, worker = NULL WHERE url = ? AND status IN (?, ?)",
+                (status, row, error, url, PENDING, LEASED),
+            )
+
+    def results(self, position, limit=500):
+        """
+        Returns the finished URLs from a position on, in sitemap order, up to the first URL that is not finished.
+
+        Args:
+            position (int): The position of the first URL.
+            limit (int): Maximum number of results. Defaults to 500.
+
+        Returns:
+            list of FrontierResult: The finished URLs.
+        """
+        with self._lock:
+            entries = self._db.execute(
+                "SELECT position, url, status, row, error FROM frontier WHERE position >= ? ORDER BY position LIMIT ?",
+                (position, limit),
+            ).fetchall()
+        results = []
+        for entry_position, url, status, row, error in entries:
+            if entry_position != position + len(results) or status not in (DONE, FAILED):
+                break
+            results.append(FrontierResult(entry_position, url, status, json.loads(row) if row else None, error))
+        return results
+
+    def counts(self):
+        """
+        Returns the number of URLs per status.
+
+        Returns:
+            dict: A dictionary mapping 'pending', 'leased', 'done' and 'failed' to their number of URLs.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM frontier GROUP BY status").fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(rows)
+        return counts
+
+    def workers(self):
+        """
+        Returns the workers of the crawl.
+
+        Returns:
+            dict: Per worker ID the seconds since its last lease or heartbeat and its number of leased URLs.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, heartbeat, (SELECT COUNT(*) FROM frontier WHERE worker = id AND status = ?) FROM worker",
+                (LEASED,),
+            ).fetchall()
+        return {worker_id: {"seconds_since_heartbeat": round(now - heartbeat, 1), "leased": leased}
+                for worker_id, heartbeat, leased in rows}
+
+    def reassigned(self):
+        """
+        Returns the number of URLs leased more than once, because the lease of a worker expired.
+
+        Returns:
+            int: Number of reassigned URLs.
+        """
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM frontier WHERE attempts > 1").fetchone()[0]
+
+    def close(self):
+        """
+        Closes the SQLite file.
+        """
+        self._db.close()
+
+
+# Example usage
+if __name__ == "__main__":
+    from sitemap_parser import SitemapEntry
+    frontier = SQLiteFrontier(':memory:', max_attempts=2)
+    frontier.add([SitemapEntry(f'https://www.eak.admin.ch/eak/de/home/seite-{i}.html', '2024-02-01') for i in range(5)])
+    print("generation", frontier.generation())
+    print(frontier.lease('worker-1', 2, lease_seconds=0.1))
+    print(frontier.lease('worker-2', 2, lease_seconds=60))
+    time.sleep(0.2)  # worker-1 is dead, its URLs go to worker-3
+    print(frontier.lease('worker-3', 10, lease_seconds=60), frontier.reassigned())
+    frontier.complete('https://www.eak.admin.ch/eak/de/home/seite-0.html', {"Page Title": "Seite 0"})
+    frontier.fail('https://www.eak.admin.ch/eak/de/home/seite-1.html', "Failed to retrieve HTML content")
+    print(frontier.results(0), frontier.counts(), frontier.workers())
@@ -0,0 +1,66 @@
+""" Benchmark of the BatchRunner: a large and a small mock EAK site crawled one after the other with cold
+connections, as separate runs of main.py would, and at the same time by one batch with shared threads.
+With the fair round robin the small site is done long before the large one. """
+import contextlib
+import os
+import sys
+import tempfile
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from batch_runner import BatchRunner
+from mock_eak_site import MockEAKServer, MockSiteTransport
+from benchmark_end_to_end import RULES_FOR_URL, RULES_FOR_THEMA_BY_URL, RULES_FOR_CONTENT
+
+
+def site_config(server, directory, name, workers):
+    return {
+        "Sitemap": {"url": server.site.sitemap_url, "k": 0},
+        "Rules": {"filter": "/de/", "content_class": "main-content", "url": RULES_FOR_URL,
+                  "thema_by_url": RULES_FOR_THEMA_BY_URL, "content": RULES_FOR_CONTENT},
+        "Crawl": {"max_workers": workers, "max_workers_per_host": None},
+        "Output": {"path": os.path.join(directory, f"{name}.csv"), "batch_size": 50,
+                   "duplicates_path": os.path.join(directory, f"{name}_duplicates.csv")},
+        "Incremental": {"enabled": False},
+        "Checkpoint": {"enabled": False},
+    }
+
+
+def run_batch(sites, image_server, workers):
+    transport = MockSiteTransport(image_server.site.base_url, pool_maxsize=workers)
+    runner = BatchRunner(sites, max_workers=workers, transport=transport)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        results = runner.run()
+    transport.close()
+    return results
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--large-pages", type=int, default=600)
+    argument_parser.add_argument("--small-pages", type=int, default=60)
+    argument_parser.add_argument("--latency-ms", type=float, default=20.0)
+    argument_parser.add_argument("--workers", type=int, default=8)
+    args = argument_parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    latency = args.latency_ms / 1000
+    # with the same seed the small site equals the first pages of the large one, its images are served by the large site
+    with MockEAKServer(args.large_pages, latency=latency) as large, MockEAKServer(args.small_pages, latency=latency) as small:
+        start = time.perf_counter()
+        large_alone = run_batch({"large": site_config(large, directory, "large", args.workers)}, large, args.workers)
+        small_alone = run_batch({"small": site_config(small, directory, "small", args.workers)}, large, args.workers)
+        sequential_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = run_batch({"large": site_config(large, directory, "large", args.workers),
+                           "small": site_config(small, directory, "small", args.workers)}, large, args.workers)
+        batch_seconds = time.perf_counter() - start
+
+    print(f"one after the other: large done after {large_alone['large']['seconds']:6.2f}s, "
+          f"small done after {large_alone['large']['seconds'] + small_alone['small']['seconds']:6.2f}s, total {sequential_seconds:6.2f}s")
+    print(f"batch, shared pool:  large done after {batch['large']['seconds']:6.2f}s, "
+          f"small done after {batch['small']['seconds']:6.2f}s, total {batch_seconds:6.2f}s")
+    print(f"pages: {batch['large']['pages']} + {batch['small']['pages']}, failed: {batch['large']['failed'] + batch['small']['failed']}")
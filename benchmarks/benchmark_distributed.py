@@ -0,0 +1,99 @@
+""" Benchmark of a distributed crawl on one machine: a coordinator and several worker processes with a SQLite frontier
+crawl a local mock EAK site. One worker is killed during the crawl; its leased URLs are reassigned after the lease
+expires and the merged output must equal the output of a single process. Exits with an error if it does not,
+or if no URL was reassigned after the kill. """
+import contextlib
+import os
+import signal
+import sys
+import tempfile
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from extracted_information_assembler import ExtractedInformationAssembler
+from distributed_crawl import CrawlCoordinator, run_local_crawl, _run_local_worker
+from url_frontier import SQLiteFrontier
+from mock_eak_site import MockEAKServer, MockSiteTransport
+from benchmark_end_to_end import RULES_FOR_URL, RULES_FOR_THEMA_BY_URL, RULES_FOR_CONTENT
+
+
+def assembler_factory(server, workers):
+    def create_assembler():
+        transport = MockSiteTransport(server.site.base_url, pool_maxsize=max(10, workers))
+        return ExtractedInformationAssembler(
+            server.site.sitemap_url, RULES_FOR_URL, RULES_FOR_THEMA_BY_URL, RULES_FOR_CONTENT,
+            "/de/", "main-content", {}, 0, max_workers=workers, transport=transport,
+        )
+    return create_assembler
+
+
+def crawl_with_killed_worker(create_assembler, frontier_path, processes, lease_seconds, kill_after):
+    """
+    Runs the coordinator and the worker processes and kills the first worker after kill_after seconds.
+    """
+    import multiprocessing
+    context = multiprocessing.get_context('fork')
+    assembler = create_assembler()
+    with SQLiteFrontier(frontier_path) as frontier:
+        coordinator = CrawlCoordinator(assembler, frontier, poll_interval=0.2)
+        coordinator.seed()
+        workers = [context.Process(target=_run_local_worker,
+                                   args=(create_assembler, frontier_path, {"lease_seconds": lease_seconds}))
+                   for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        time.sleep(kill_after)
+        os.kill(workers[0].pid, signal.SIGKILL)
+        coordinator.collect(alive=lambda: any(worker.is_alive() for worker in workers))
+        for worker in workers:
+            worker.join()
+        reassigned = frontier.reassigned()
+    return assembler, reassigned
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--pages", type=int, default=300)
+    argument_parser.add_argument("--latency-ms", type=float, default=20.0)
+    argument_parser.add_argument("--workers", type=int, default=4, help="Threads per worker process.")
+    argument_parser.add_argument("--processes", type=int, default=3, help="Worker processes.")
+    argument_parser.add_argument("--lease-seconds", type=float, default=2.0)
+    args = argument_parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    with MockEAKServer(args.pages, latency=args.latency_ms / 1000) as server:
+        create_assembler = assembler_factory(server, args.workers)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            single = create_assembler()
+            single.extract_information()
+            single_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            distributed = run_local_crawl(create_assembler, os.path.join(directory, "frontier.sqlite"),
+                                          workers=args.processes, lease_seconds=args.lease_seconds)
+            distributed_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            killed, reassigned = crawl_with_killed_worker(create_assembler, os.path.join(directory, "killed.sqlite"),
+                                                          args.processes, args.lease_seconds, kill_after=0.5)
+            killed_seconds = time.perf_counter() - start
+
+    print(f"single process:           {len(single.extracted_data)} rows in {single_seconds:.2f}s")
+    print(f"{args.processes} worker processes:       {len(distributed.extracted_data)} rows in {distributed_seconds:.2f}s, "
+          f"same output: {distributed.extracted_data == single.extracted_data}")
+    print(f"{args.processes} workers, 1 killed:     {len(killed.extracted_data)} rows in {killed_seconds:.2f}s, "
+          f"{reassigned} URLs reassigned, same output: {killed.extracted_data == single.extracted_data}")
+
+    failures = []
+    if distributed.extracted_data != single.extracted_data:
+        failures.append(f"the output of {args.processes} worker processes differs from a single process")
+    if killed.extracted_data != single.extracted_data:
+        failures.append("the output with a killed worker differs from a single process")
+    if not reassigned:
+        failures.append("no URL of the killed worker was reassigned")
+    for failure in failures:
+        print(f"Failed: {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,158 @@
+""" Benchmark of the single-parse DOMExtractor against the former multi-parse path.
+The default backend must give the output of the former path for the sample page and for malformed pages,
+the opt-in lxml backend for the well-formed sample page. Exits with an error on a mismatch. """
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from bs4 import BeautifulSoup
+from dom_extractor import DOMExtractor
+
+def build_sample_page(paragraphs=120, images=12):
+    """
+    Builds an HTML page shaped like the EAK templates.
+
+    Args:
+        paragraphs (int): Number of paragraphs in the main content.
+        images (int): Number of images in the main content.
+
+    Returns:
+        str: The HTML page.
+    """
+    body = ''.join(
+        f'<p>Absatz {i} über die AHV, Familienzulagen und die Erwerbsersatzordnung der EAK.</p>'
+        for i in range(paragraphs)
+    )
+    imgs = ''.join(f'<img src="/eak/de/home/_jcr_content/image.imagespooler.png/{i}/bild-{i}.png" alt="">' for i in range(images))
+    return f"""<!DOCTYPE html>
+        <html lang="de"><head><title>Überblick | Eidgenössische Ausgleichskasse EAK</title></head>
+        <body><nav><ul>{''.join(f'<li><a href="/eak/de/home/{i}.html">Link {i}</a></li>' for i in range(60))}</ul></nav>
+        <div class="main-content"><h1>Überblick</h1><p class="lead">Die Reform AHV 21 stabilisiert die AHV.</p>
+        {body}{imgs}<iframe src="https://www.youtube.com/embed/abc"></iframe></div>
+        <p class="text-dimmed">Letzte Änderung 01.02.2024</p></body></html>"""
+
+# malformed pages as found on real sites, the parsers repair them differently
+MALFORMED_PAGES = {
+    "div inside p": '<p class="lead">a<div class="main-content">b<p>c</div></p>',
+    "unclosed tags": '<html><head><title>Seite</title><body><div class="main-content"><p>eins<p>zwei<img src="/a.png">',
+    "stray end tags": '<div class="main-content">a</span></div></div><p class="text-dimmed">01.02.2024</p></p>',
+    "nested lead": '<div class="lead">a<div class="lead">b</div></div><div class="main-content">c</div>',
+    "unquoted attributes": '<div class=main-content>a<iframe src=https://www.youtube.com/embed/x></div>',
+    "table without rows": '<table><div class="main-content">a<td>b</td></div></table>',
+}
+
+def legacy_multi_parse(html_content, content_class='main-content'):
+    """
+    The former extraction path: every selector parsed the page again with html.parser.
+
+    Args:
+        html_content (str): The HTML page.
+        content_class (str): CSS class name of the main content.
+
+    Returns:
+        tuple: title, main content, lead, text-dimmed, img srcs, has iframe, has video.
+    """
+    def content_by_class(css_class):
+        soup = BeautifulSoup(html_content, 'html.parser')
+        elements = soup.find_all(class_=css_class)
+        if not elements:
+            return f"{css_class}-class not found"
+        return ' '.join(element.get_text() for element in elements)
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+    title = soup.title.string if soup.title else 'No title found'
+    content = content_by_class(content_class)
+    lead = content_by_class('lead')
+    dimmed = content_by_class('text-dimmed')
+    soup = BeautifulSoup(html_content, 'html.parser')
+    img_srcs = [img['src'] for img in soup.find_all("img") if 'src' in img.attrs]
+    soup = BeautifulSoup(html_content, 'html.parser')
+    have_iframe = soup.find("iframe") is not None
+    soup = BeautifulSoup(html_content, 'html.parser')
+    iframe = soup.find("iframe")
+    have_video = iframe is not None and ("vimeo" in iframe['src'] or "youtube" in iframe['src'])
+    return title, content, lead, dimmed, img_srcs, have_iframe, have_video
+
+def single_parse(extractor, html_content, content_class='main-content'):
+    """
+    The current extraction path: one parse with the DOMExtractor.
+
+    Args:
+        extractor (DOMExtractor): The extractor to use.
+        html_content (str): The HTML page.
+        content_class (str): CSS class name of the main content.
+
+    Returns:
+        tuple: title, main content, lead, text-dimmed, img srcs, has iframe, has video.
+    """
+    dom = extractor.extract(html_content)
+    have_video = bool(dom.iframe_srcs) and ("vimeo" in dom.iframe_srcs[0] or "youtube" in dom.iframe_srcs[0])
+    return (dom.title, dom.get_content_by_class(content_class), dom.get_content_by_class('lead'),
+            dom.get_content_by_class('text-dimmed'), dom.img_srcs, bool(dom.iframe_srcs), have_video)
+
+def measure(function, repeat):
+    """
+    Runs the function repeatedly and returns the mean time per call in milliseconds.
+
+    Args:
+        function (callable): The function to measure.
+        repeat (int): Number of calls.
+
+    Returns:
+        float: Mean time per call in milliseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--html", help="HTML file to benchmark instead of the generated sample page.")
+    argument_parser.add_argument("--repeat", type=int, default=20)
+    args = argument_parser.parse_args()
+
+    if args.html:
+        with open(args.html, encoding='utf-8') as html_file:
+            html = html_file.read()
+    else:
+        html = build_sample_page()
+    mismatches = []
+
+    expected = legacy_multi_parse(html)
+    legacy_ms = measure(lambda: legacy_multi_parse(html), args.repeat)
+    print(f"legacy multi-parse (html.parser x7): {legacy_ms:8.2f} ms/page")
+
+    backends = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+        backends.append('lxml')
+    except ImportError:
+        print("lxml is not installed, skipping the lxml backend.")
+
+    for backend in backends:
+        extractor = DOMExtractor(backend=backend)
+        same_output = single_parse(extractor, html) == expected
+        backend_ms = measure(lambda: single_parse(extractor, html), args.repeat)
+        print(f"single parse ({backend:>11}):       {backend_ms:8.2f} ms/page  "
+              f"speedup x{legacy_ms / backend_ms:4.1f}  same output: {same_output}")
+        if not same_output:
+            mismatches.append(f"{backend}: sample page")
+
+    default_extractor = DOMExtractor()
+    for name, page in MALFORMED_PAGES.items():
+        if single_parse(default_extractor, page) != legacy_multi_parse(page):
+            mismatches.append(f"{default_extractor.backend}: malformed page '{name}'")
+    if 'lxml' in backends:
+        lxml_extractor = DOMExtractor(backend='lxml')
+        differing = [name for name, page in MALFORMED_PAGES.items()
+                     if single_parse(lxml_extractor, page) != legacy_multi_parse(page)]
+        # expected, the reason lxml is opt-in
+        print(f"lxml differs on {len(differing)} of {len(MALFORMED_PAGES)} malformed pages: {', '.join(differing) or 'none'}")
+
+    for mismatch in mismatches:
+        print(f"Output differs from the former extraction: {mismatch}")
+    sys.exit(1 if mismatches else 0)
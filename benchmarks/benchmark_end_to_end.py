@@ -0,0 +1,161 @@
+""" End-to-end benchmark of the ExtractedInformationAssembler against a local mock EAK site:
+pages per second, CPU time per page and peak memory, compared with stored baselines. """
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import argparse
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "app"))
+
+from extracted_information_assembler import ExtractedInformationAssembler
+from mock_eak_site import MockEAKServer, MockSiteTransport
+
+BASELINES_PATH = os.path.join(BENCHMARK_DIR, "baselines.json")
+
+RULES_FOR_URL = {"Firmen": ["/firmen/"], "Private": ["/private/"], "Die EAK": ["/die_eak/"], "Dokumentation": ["/dokumentation/"]}
+RULES_FOR_THEMA_BY_URL = {
+    "Anschluss": ["/anschluss/"], "Personal": ["/personal/"], "Familienzulagen": ["/familienzulagen/"],
+    "Pensionierung": ["/pensionierung/"], "Formulare": ["/formulare/"], "Reform AHV 21": ["/reform-ahv21/"],
+}
+RULES_FOR_CONTENT = {
+    "AHV": ["alters- und hinterlassenenversicherung", "ahv", "altersrente", "ahv 21"],
+    "IV": ["invalidenversicherung", " iv ", "invalidenrenten"],
+    "EL": ["ergänzungsleistungen", " el ", "minimalen lebenskosten nicht decken"],
+    "EO-MSE-EAE-BUE-AdopE": ["erwerbsersatz", "mutterschaft", "adoption", "erwerbsausfall", "dienstpflicht"],
+    "FamZG": ["familienzulagen", "kinderzulagen", "ausbildungszulagen", "unterhalt der kinder"],
+}
+
+
+def serve(pages, latency, bandwidth, base_urls, stop):
+    """
+    Runs the mock server in its own process, so that it does not share the GIL and the measurements with the crawl.
+    """
+    with MockEAKServer(pages, latency=latency, bandwidth=bandwidth) as server:
+        base_urls.put(server.site.base_url)
+        stop.wait()
+
+
+def peak_rss_mb():
+    """ Returns the peak resident memory of this process in MB. """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def children_cpu_seconds():
+    """ Returns the CPU time of the terminated child processes, e.g. of the analysis processes. """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_scenario(pages, latency, bandwidth, workers, processes=0):
+    """
+    Crawls a mock site of the given size with the assembler and measures the run.
+
+    Args:
+        pages (int): Number of pages of the mock site.
+        latency (float): Delay in seconds of every response.
+        bandwidth (int): Bytes per second per response, None for full speed.
+        workers (int): Number of concurrent workers of the assembler.
+        processes (int): Number of analysis processes of the assembler, 0 analyzes in the workers.
+
+    Returns:
+        dict: pages, failed, seconds, pages_per_second, cpu_ms_per_page and peak_rss_mb.
+    """
+    base_urls = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(pages, latency, bandwidth, base_urls, stop), daemon=True)
+    server.start()
+    try:
+        base_url = base_urls.get(timeout=120)
+        transport = MockSiteTransport(base_url, pool_maxsize=max(10, workers), retries=0)
+        assembler = ExtractedInformationAssembler(
+            f"{base_url}/eak/de/home.sitemap.xml", RULES_FOR_URL, RULES_FOR_THEMA_BY_URL, RULES_FOR_CONTENT,
+            "/de/", "main-content", {}, 0, max_workers=workers, transport=transport, keep_rows=False,
+            analysis_processes=processes,
+        )
+        start, cpu_start = time.perf_counter(), time.process_time() + children_cpu_seconds()
+        # the progress output of thousands of pages would dominate the console
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            assembler.extract_information()
+        # the analysis processes are terminated at the end of the extraction, the mock server is not yet
+        seconds, cpu = time.perf_counter() - start, time.process_time() + children_cpu_seconds() - cpu_start
+        transport.close()
+    finally:
+        stop.set()
+        server.join(timeout=10)
+
+    extracted = assembler.metrics.to_dict()["counters"].get("pages", 0)
+    return {
+        "pages": extracted,
+        "failed": len(assembler.failed_urls),
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(extracted / seconds, 2),
+        "cpu_ms_per_page": round(cpu / max(1, extracted) * 1000, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def compare(result, baseline, tolerance):
+    """
+    Compares a result with its baseline.
+
+    Args:
+        result (dict): The measured result.
+        baseline (dict): The stored baseline.
+        tolerance (float): Allowed relative deviation, e.g. 0.2 for 20%.
+
+    Returns:
+        list of str: The regressions, empty if there is none.
+    """
+    regressions = []
+    if result["pages_per_second"] < baseline["pages_per_second"] * (1 - tolerance):
+        regressions.append(f"pages/s {result['pages_per_second']} < baseline {baseline['pages_per_second']}")
+    for key in ("cpu_ms_per_page", "peak_rss_mb"):
+        if result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key} {result[key]} > baseline {baseline[key]}")
+    return regressions
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--pages", type=int, default=2000)
+    argument_parser.add_argument("--latency-ms", type=float, default=20.0, help="Delay of every response.")
+    argument_parser.add_argument("--bandwidth-kbps", type=int, default=0, help="Kilobytes per second per response, 0 is unlimited.")
+    argument_parser.add_argument("--workers", type=int, default=8)
+    argument_parser.add_argument("--processes", type=int, default=0, help="Analysis processes, 0 analyzes in the workers.")
+    argument_parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed deviation from the baseline.")
+    argument_parser.add_argument("--baselines", default=BASELINES_PATH)
+    argument_parser.add_argument("--update-baseline", action="store_true", help="Store the result as the new baseline.")
+    args = argument_parser.parse_args()
+
+    scenario = f"pages={args.pages},latency_ms={args.latency_ms:g},bandwidth_kbps={args.bandwidth_kbps},workers={args.workers}"
+    if args.processes:
+        scenario += f",processes={args.processes}"
+    result = run_scenario(args.pages, args.latency_ms / 1000, args.bandwidth_kbps * 1024 or None, args.workers, args.processes)
+    print(f"{scenario}: {result['pages']} pages ({result['failed']} failed) in {result['seconds']}s, "
+          f"{result['pages_per_second']} pages/s, {result['cpu_ms_per_page']} ms CPU/page, {result['peak_rss_mb']} MB peak RSS")
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, encoding='utf-8') as baselines_file:
+            baselines = json.load(baselines_file)
+    if args.update_baseline:
+        baselines[scenario] = result
+        with open(args.baselines, 'w', encoding='utf-8') as baselines_file:
+            json.dump(baselines, baselines_file, indent=2, sort_keys=True)
+        print(f"Baseline stored in {args.baselines}.")
+    elif scenario in baselines:
+        regressions = compare(result, baselines[scenario], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression against the baseline (tolerance {args.tolerance:.0%}).")
+    else:
+        print("No baseline for this scenario, store one with --update-baseline.")
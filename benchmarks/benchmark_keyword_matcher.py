@@ -0,0 +1,121 @@
+""" Benchmark of the compiled KeywordMatcher against the former per-keyword substring loop.
+Exits with an error if a strategy or the batch API gives other keywords or counts than the loop. """
+import csv
+import os
+import random
+import sys
+import time
+import argparse
+import toml
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+from keyword_matcher import KeywordMatcher
+
+def load_rules_for_content(path=os.path.join(APP_DIR, "..", "config_eak.toml")):
+    """
+    Reads the content rules from the [Rules.content] section of the configuration.
+
+    Args:
+        path (str): Path of the TOML configuration.
+
+    Returns:
+        dict: The content rules.
+    """
+    return toml.load(path)["Rules"]["content"]
+
+def load_corpus(path, repeat):
+    """
+    Reads the lead texts of an extracted_data.csv, repeated to a main-content sized text per page.
+
+    Args:
+        path (str): Path of the CSV file.
+        repeat (int): Number of times each lead text is repeated.
+
+    Returns:
+        list of str: One text per page.
+    """
+    with open(path, encoding='utf-8-sig', newline='') as csv_file:
+        return [' '.join([row['Page Leadtext']] * repeat) for row in csv.DictReader(csv_file)]
+
+def legacy_match(keywords_rules, text):
+    """
+    The former matching of ContentAnalyzer._analyze: one substring scan per keyword.
+    """
+    text = text.lower()
+    return [keyword for keyword, contain_words in keywords_rules.items() if any(word in text for word in contain_words)]
+
+def add_synthetic_keywords(rules, count, seed=0):
+    """
+    Adds rules with random German-looking keywords, to see how both approaches scale with the rule table.
+    """
+    rng = random.Random(seed)
+    syllables = ['ver', 'sich', 'er', 'ung', 'kas', 'se', 'bei', 'trag', 'ren', 'te', 'lohn', 'an', 'spruch', 'zu', 'la', 'gen']
+    rules = dict(rules)
+    for i in range(count):
+        word = ''.join(rng.choice(syllables) for _ in range(rng.randint(3, 5)))
+        rules.setdefault(f"Synthetisch-{i % 20}", []).append(word)
+    return rules
+
+def measure(function, texts):
+    """
+    Runs the function over all texts and returns the total time in milliseconds.
+    """
+    start = time.perf_counter()
+    for text in texts:
+        function(text)
+    return (time.perf_counter() - start) * 1000
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--csv", default=os.path.join(APP_DIR, "..", "extracted_data.csv"))
+    argument_parser.add_argument("--repeat", type=int, default=10, help="Lead text repetitions per page.")
+    argument_parser.add_argument("--extra-keywords", type=int, nargs='*', default=[0, 200, 500])
+    args = argument_parser.parse_args()
+
+    texts = load_corpus(args.csv, args.repeat)
+    print(f"Corpus: {len(texts)} pages, {sum(len(text) for text in texts)} characters")
+    mismatches = []
+
+    for extra in args.extra_keywords:
+        rules = add_synthetic_keywords(load_rules_for_content(), extra)
+        keywords_rules = {k: [word.lower() for word in v] for k, v in rules.items()}
+        start = time.perf_counter()
+        matcher = KeywordMatcher(rules, strategy='pattern')
+        compile_ms = (time.perf_counter() - start) * 1000
+        same_output = all(matcher.match_rules(text) == legacy_match(keywords_rules, text) for text in texts)
+        auto_matcher = KeywordMatcher(rules)
+        if not same_output:
+            mismatches.append(f"{extra} extra keywords: pattern strategy")
+        if not all(auto_matcher.match_rules(text) == legacy_match(keywords_rules, text) for text in texts):
+            mismatches.append(f"{extra} extra keywords: {auto_matcher.strategy} strategy")
+
+        legacy_ms = measure(lambda text: legacy_match(keywords_rules, text), texts)
+        matcher_ms = measure(matcher.match_rules, texts)
+        auto_ms = measure(auto_matcher.match_rules, texts)
+        keyword_count = sum(len(words) for words in rules.values())
+        print(f"{keyword_count:4d} keywords: loop {legacy_ms:7.1f} ms, pattern {matcher_ms:7.1f} ms "
+              f"(compile {compile_ms:5.1f} ms, speedup x{legacy_ms / matcher_ms:4.1f}, same output: {same_output}), "
+              f"auto -> {auto_matcher.strategy} {auto_ms:7.1f} ms")
+
+        # batch API used for retagging: the whole corpus at once
+        start = time.perf_counter()
+        matches = auto_matcher.match_matrix(texts)
+        matrix_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        counts = auto_matcher.count_matrix(texts)
+        count_matrix_ms = (time.perf_counter() - start) * 1000
+        count_loop_ms = measure(auto_matcher.count_rules, texts)
+        same_counts = all(list(counts[i]) == list(auto_matcher.count_rules(text).values()) for i, text in enumerate(texts))
+        if not same_counts:
+            mismatches.append(f"{extra} extra keywords: count_matrix")
+        if not all(list(matches[i]) == [count > 0 for count in auto_matcher.count_rules(text).values()]
+                   for i, text in enumerate(texts)):
+            mismatches.append(f"{extra} extra keywords: match_matrix")
+        print(f"{'':15s} match_matrix {matrix_ms:7.1f} ms, count_matrix {count_matrix_ms:7.1f} ms "
+              f"vs count_rules loop {count_loop_ms:7.1f} ms (same counts: {same_counts})")
+
+    for mismatch in mismatches:
+        print(f"Output differs from the loop: {mismatch}")
+    sys.exit(1 if mismatches else 0)
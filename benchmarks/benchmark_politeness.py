@@ -0,0 +1,97 @@
+""" Benchmark of the RequestScheduler against a local mock EAK site that throttles:
+throughput and 429 responses with and without the scheduler, and a robots.txt with Crawl-delay and Disallow.
+Exits with an error if the scheduler loses pages, gets more than a small share of 429 responses, exceeds the
+Crawl-delay or extracts other pages than the ones robots.txt allows, so it can run as a test. """
+import contextlib
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from extracted_information_assembler import ExtractedInformationAssembler
+from request_scheduler import RequestScheduler
+from mock_eak_site import MockEAKServer, MockSiteTransport
+from benchmark_end_to_end import RULES_FOR_URL, RULES_FOR_THEMA_BY_URL, RULES_FOR_CONTENT
+
+
+def crawl(server, workers, scheduler):
+    """
+    Crawls the mock site and returns the seconds, the pages, the failed pages and the requests per second.
+    """
+    transport = MockSiteTransport(server.site.base_url, pool_maxsize=workers, scheduler=scheduler)
+    assembler = ExtractedInformationAssembler(
+        server.site.sitemap_url, RULES_FOR_URL, RULES_FOR_THEMA_BY_URL, RULES_FOR_CONTENT,
+        "/de/", "main-content", {}, 0, max_workers=workers, transport=transport, keep_rows=False,
+    )
+    requests_before, throttled_before = server.requests, server.throttled
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        assembler.extract_information()
+    seconds = time.perf_counter() - start
+    transport.close()
+    pages = assembler.metrics.to_dict()["counters"].get("pages", 0)
+    return {
+        "seconds": seconds,
+        "pages": pages,
+        "failed": len(assembler.failed_urls),
+        "requests": server.requests - requests_before,
+        "requests_per_second": (server.requests - requests_before) / seconds,
+        "throttled": server.throttled - throttled_before,
+        "failed_urls": {url for url, _ in assembler.failed_urls},
+    }
+
+
+def report(name, result, scheduler=None):
+    print(f"{name:<34} {result['pages']:5d} pages, {result['failed']:4d} failed in {result['seconds']:6.2f}s "
+          f"({result['pages'] / result['seconds']:6.1f} pages/s, {result['requests_per_second']:6.1f} requests/s), "
+          f"{result['throttled']:5d} x 429")
+    if scheduler is not None:
+        for host, stats in scheduler.stats().items():
+            print(f"{'':<34} {host}: concurrency {stats['concurrency']}, rate {stats['rate']}, waited {stats['waited_seconds']}s")
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--pages", type=int, default=300)
+    argument_parser.add_argument("--workers", type=int, default=16)
+    argument_parser.add_argument("--latency-ms", type=float, default=20.0)
+    argument_parser.add_argument("--max-rate", type=float, default=40, help="Requests per second the mock server answers.")
+    argument_parser.add_argument("--crawl-delay", type=float, default=0.05, help="Crawl-delay of the robots.txt scenario.")
+    argument_parser.add_argument("--max-throttled-share", type=float, default=0.05,
+                                 help="Largest share of requests answered with 429 allowed with the scheduler.")
+    args = argument_parser.parse_args()
+
+    failures = []
+    with MockEAKServer(args.pages, latency=args.latency_ms / 1000, max_rate=args.max_rate) as server:
+        unscheduled = crawl(server, args.workers, None)
+        report("throttling server, no scheduler", unscheduled)
+        scheduler = RequestScheduler(max_concurrency=args.workers)
+        scheduled = crawl(server, args.workers, scheduler)
+        report("throttling server, scheduler", scheduled, scheduler)
+    if scheduled["failed"]:
+        failures.append(f"{scheduled['failed']} pages failed on the throttling server with the scheduler")
+    if scheduled["throttled"] > args.max_throttled_share * scheduled["requests"]:
+        failures.append(f"{scheduled['throttled']} of {scheduled['requests']} requests got a 429 with the scheduler, "
+                        f"at most {args.max_throttled_share:.0%} allowed")
+
+    disallowed = "/eak/de/home/private/"
+    with MockEAKServer(args.pages, latency=args.latency_ms / 1000, crawl_delay=args.crawl_delay,
+                       disallow=[disallowed]) as server:
+        scheduler = RequestScheduler(max_concurrency=args.workers)
+        result = crawl(server, args.workers, scheduler)
+        report(f"robots.txt Crawl-delay {args.crawl_delay:g}s", result, scheduler)
+        expected_failed = {server.site.base_url + path for path in server.site.files
+                           if path.startswith(disallowed) and path.endswith(".html")}
+    print(f"{'':<34} the failed pages are the disallowed /private/ pages, at most {1 / args.crawl_delay:g} requests/s allowed")
+    if result["failed_urls"] != expected_failed:
+        failures.append(f"{len(result['failed_urls'] - expected_failed)} allowed pages failed and "
+                        f"{len(expected_failed - result['failed_urls'])} disallowed pages were extracted")
+    # a burst of one request and the robots.txt request itself
+    if result["requests"] - 2 > result["seconds"] / args.crawl_delay:
+        failures.append(f"{result['requests_per_second']:.1f} requests/s despite a Crawl-delay of {args.crawl_delay:g}s")
+
+    for failure in failures:
+        print(f"Failed: {failure}")
+    sys.exit(1 if failures else 0)
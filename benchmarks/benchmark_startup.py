@@ -0,0 +1,84 @@
+""" Benchmark of the startup without AI: import time and peak memory of the entry points, each measured
+in a fresh interpreter, and a check that none of the AI and embedding libraries is imported.
+Exits with an error if a budget is exceeded or a heavy library is loaded, so it can run as a test. """
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import argparse
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+# modules that must only be imported with the AI analysis or the embeddings enabled
+HEAVY_MODULES = ("haystack", "openai", "dotenv", "sentence_transformers", "transformers", "torch",
+                 "content_analyzer_ai", "embedding_index")
+IMPORT_SECONDS_BUDGET = 1.0
+PEAK_RSS_MB_BUDGET = 150.0
+
+MEASURE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "seconds": seconds,
+    "peak_rss_mb": peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024,
+    "heavy_modules": sorted(name for name in {heavy!r} if name in sys.modules),
+}}))
+"""
+
+
+def measure_import(module, runs):
+    """
+    Imports the module in fresh interpreters and returns the median import time, the peak RSS and the heavy modules.
+    """
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", MEASURE.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=APP_DIR, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output))
+    return {
+        "seconds": round(statistics.median(result["seconds"] for result in results), 3),
+        "peak_rss_mb": round(max(result["peak_rss_mb"] for result in results), 1),
+        "heavy_modules": sorted({name for result in results for name in result["heavy_modules"]}),
+    }
+
+
+def measure_help(runs):
+    """
+    Returns the median wall time of "python main.py --help", interpreter startup included.
+    """
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "main.py", "--help"], cwd=APP_DIR, capture_output=True, check=True)
+        seconds.append(time.perf_counter() - start)
+    return round(statistics.median(seconds), 3)
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--runs", type=int, default=5)
+    argument_parser.add_argument("--max-import-seconds", type=float, default=IMPORT_SECONDS_BUDGET)
+    argument_parser.add_argument("--max-rss-mb", type=float, default=PEAK_RSS_MB_BUDGET)
+    args = argument_parser.parse_args()
+
+    failures = []
+    for module in ("main", "batch_runner"):
+        result = measure_import(module, args.runs)
+        print(f"import {module:<13} {result['seconds']:6.3f}s, peak RSS {result['peak_rss_mb']:6.1f} MB, "
+              f"heavy modules: {', '.join(result['heavy_modules']) or 'none'}")
+        if result["seconds"] > args.max_import_seconds:
+            failures.append(f"import {module} took {result['seconds']}s, budget {args.max_import_seconds}s")
+        if result["peak_rss_mb"] > args.max_rss_mb:
+            failures.append(f"import {module} used {result['peak_rss_mb']} MB, budget {args.max_rss_mb} MB")
+        if result["heavy_modules"]:
+            failures.append(f"import {module} loaded {', '.join(result['heavy_modules'])}")
+    print(f"python main.py --help {measure_help(args.runs):6.3f}s")
+
+    for failure in failures:
+        print(f"Over budget: {failure}")
+    sys.exit(1 if failures else 0)
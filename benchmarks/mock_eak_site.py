@@ -0,0 +1,323 @@
+""" A local mock of the EAK website: a synthetic sitemap with pages and images shaped like the EAK templates,
+served over HTTP with configurable latency and bandwidth. """
+import hashlib
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+import argparse
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from http_transport import HTTPTransport
+
+EAK_BASE_URL = 'https://www.eak.admin.ch'
+
+SECTIONS = {
+    "firmen": ["anschluss", "personal", "externe_auftraege", "beitraege_und_loehne", "familienzulagen", "erwerbsersatz"],
+    "private": ["mein_ahv-konto", "zivilstand", "kinder", "arbeit", "pensionierung", "im_ausland", "steuerausweis"],
+    "die_eak": ["unsere-leistungen", "portrait", "organisation", "publikationen", "kurse-und-beratung", "offene-stellen"],
+    "dokumentation": ["formulare", "mitteilungs-archiv", "jahresberichte", "reform-ahv21"],
+}
+SENTENCES = [
+    "Die Alters- und Hinterlassenenversicherung (AHV) sichert den Existenzbedarf im Alter.",
+    "Die Invalidenversicherung fördert die Eingliederung und zahlt Invalidenrenten.",
+    "Ergänzungsleistungen helfen, wenn die Renten die minimalen Lebenskosten nicht decken.",
+    "Die Erwerbsersatzordnung entschädigt den Erwerbsausfall bei Dienstpflicht und Mutterschaft.",
+    "Familienzulagen tragen zum Unterhalt der Kinder bei, dazu gehören Kinder- und Ausbildungszulagen.",
+    "Arbeitgebende rechnen die Beiträge und Löhne ihres Personals jährlich mit der EAK ab.",
+    "Mit connect.eak erledigen Sie Meldungen an die Ausgleichskasse online.",
+    "Die Reform AHV 21 dient der Stabilisierung der AHV und hat das Referenzalter angepasst.",
+    "Bei einer Adoption oder der Betreuung eines gesundheitlich schwer beeinträchtigten Kindes besteht Anspruch auf Entschädigung.",
+    "Weitere Informationen finden Sie in den Merkblättern und Formularen.",
+]
+# images of the templates: the site logo and the content images, wide and narrow
+IMAGE_WIDTHS = (2400, 1920, 1280, 800)
+
+
+def build_png(width, height, size):
+    """
+    Builds a PNG file of about size bytes whose header announces width x height, the rest is padding.
+
+    Args:
+        width (int): Width in pixels.
+        height (int): Height in pixels.
+        size (int): Approximate size of the file in bytes.
+
+    Returns:
+        bytes: The PNG file.
+    """
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    header = chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+    padding = chunk(b'IDAT', bytes(max(0, size - 57)))
+    return b'\x89PNG\r\n\x1a\n' + header + padding + chunk(b'IEND', b'')
+
+
+class MockEAKSite:
+    """
+    A synthetic EAK website with a sitemap, pages and images, generated reproducibly from a seed.
+
+    Attributes:
+        base_url (str): The URL the site is served under, e.g. http://127.0.0.1:8000.
+        pages (int): Number of pages.
+        files (dict): Body and content type by path.
+
+    Methods:
+        sitemap_url: URL of the sitemap.
+    """
+
+    def __init__(self, base_url, pages=2000, images_per_page=4, paragraphs=40, image_bytes=60000, seed=42):
+        """
+        Initializes the MockEAKSite and generates all files.
+
+        Args:
+            base_url (str): The URL the site is served under.
+            pages (int): Number of pages. Defaults to 2000.
+            images_per_page (int): Maximum number of content images per page. Defaults to 4.
+            paragraphs (int): Average number of paragraphs in the main content. Defaults to 40.
+            image_bytes (int): Size of every image. Defaults to 60000.
+            seed (int): Seed of the generator, the same seed generates the same site. Defaults to 42.
+        """
+        self.base_url = base_url.rstrip('/')
+        self.pages = pages
+        self.files = {}
+        generator = random.Random(seed)
+        urls = []
+        for number in range(pages):
+            section = generator.choice(list(SECTIONS))
+            topic = generator.choice(SECTIONS[section])
+            path = f"/eak/de/home/{section}/{topic}/seite-{number}.html"
+            urls.append((path, f"2024-{generator.randint(1, 12):02d}-{generator.randint(1, 28):02d}"))
+            images = [f"/eak/de/home/{section}/_jcr_content/image.imagespooler.png/{number}/bild-{index}.png"
+                      for index in range(generator.randint(0, images_per_page))]
+            for index, src in enumerate(images):
+                width = generator.choice(IMAGE_WIDTHS)
+                self.files[src] = (build_png(width, width * 9 // 16, image_bytes), 'image/png')
+            html = self._build_page(generator, topic, number, images, paragraphs)
+            self.files[path] = (html.encode('utf-8'), 'text/html; charset=utf-8')
+        entries = ''.join(f"<url><loc>{self.base_url}{path}</loc><lastmod>{lastmod}</lastmod></url>" for path, lastmod in urls)
+        sitemap = f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+        self.files['/eak/de/home.sitemap.xml'] = (sitemap.encode('utf-8'), 'application/xml')
+        logo = '/eak/de/_jcr_content/logo/image.imagespooler.png/1674124800670/logo.png'
+        self.files[logo] = (build_png(200, 60, 4000), 'image/png')
+
+    @property
+    def sitemap_url(self):
+        return f"{self.base_url}/eak/de/home.sitemap.xml"
+
+    def _build_page(self, generator, topic, number, images, paragraphs):
+        title = f"{topic.replace('_', ' ').replace('-', ' ').title()} {number}"
+        body = ''.join(
+            f"<p>{' '.join(generator.choices(SENTENCES, k=generator.randint(2, 5)))}</p>"
+            for _ in range(max(1, int(generator.gauss(paragraphs, paragraphs / 4))))
+        )
+        imgs = ''.join(f'<div class="image"><img src="{src}" alt="Bild {index}"></div>' for index, src in enumerate(images))
+        iframe = '<iframe src="https://www.youtube.com/embed/eak-video"></iframe>' if generator.random() < 0.2 else ''
+        navigation = ''.join(
+            f'<li><a href="/eak/de/home/{section}/{topic}.html">{topic}</a></li>'
+            for section, topics in SECTIONS.items() for topic in topics
+        )
+        return f"""<!DOCTYPE html>
+<html lang="de"><head><meta charset="utf-8"><title>{title} | Eidgenössische Ausgleichskasse EAK</title></head>
+<body><header><img src="/eak/de/_jcr_content/logo/image.imagespooler.png/1674124800670/logo.png" alt="EAK"></header>
+<nav><ul>{navigation}</ul></nav>
+<div class="main-content"><h1>{title}</h1><p class="lead">{generator.choice(SENTENCES)}</p>
+{body}{imgs}{iframe}</div>
+<p class="text-dimmed">Letzte Änderung {generator.randint(1, 28):02d}.{generator.randint(1, 12):02d}.2024</p>
+</body></html>"""
+
+
+class MockEAKServer:
+    """
+    An HTTP server for a MockEAKSite, in a background thread.
+    Every response is delayed by the latency and sent at the bandwidth, Range and If-None-Match requests are supported.
+    To simulate a throttling server, requests above max_rate per second are answered with 429 and Retry-After,
+    and robots.txt can ask for a Crawl-delay and disallow paths.
+
+    Attributes:
+        site (MockEAKSite): The served site.
+        latency (float): Delay in seconds before every response.
+        bandwidth (int): Bytes per second per response, None sends at full speed.
+        max_rate (float): Requests per second the server answers, None answers all.
+        requests (int): Number of requests served.
+        throttled (int): Number of requests answered with 429.
+
+    Methods:
+        start(): Starts the server and returns its base URL.
+        stop(): Stops the server.
+    """
+
+    def __init__(self, pages=2000, latency=0.0, bandwidth=None, host='127.0.0.1', port=0,
+                 max_rate=None, retry_after=1, crawl_delay=None, disallow=(), **site_options):
+        """
+        Initializes the MockEAKServer, binds the port and generates the site.
+
+        Args:
+            pages (int): Number of pages of the site. Defaults to 2000.
+            latency (float): Delay in seconds before every response. Defaults to 0.
+            bandwidth (int, optional): Bytes per second per response. Defaults to None (full speed).
+            host (str): Interface to listen on. Defaults to 127.0.0.1.
+            port (int): Port to listen on, 0 picks a free port. Defaults to 0.
+            max_rate (float, optional): Requests per second the server answers, more get a 429. Defaults to None.
+            retry_after (int): Retry-After of the 429 responses in seconds. Defaults to 1.
+            crawl_delay (float, optional): Crawl-delay of robots.txt. Defaults to None.
+            disallow (tuple): Paths disallowed by robots.txt. Defaults to none.
+            **site_options: Further options of the MockEAKSite.
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.max_rate = max_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self.site = MockEAKSite(f"http://{host}:{self._server.server_address[1]}", pages=pages, **site_options)
+        robots = ["User-agent: *"] + [f"Disallow: {path}" for path in disallow]
+        if crawl_delay:
+            robots.append(f"Crawl-delay: {crawl_delay}")
+        self.site.files['/robots.txt'] = ('\n'.join(robots).encode('utf-8') + b'\n', 'text/plain')
+        self._etags = {path: '"%s"' % hashlib.md5(body).hexdigest() for path, (body, _) in self.site.files.items()}
+
+    def _handler(self):
+        server = self
+
+        def over_rate():
+            # sliding window of the requests of the last second
+            with server._lock:
+                server.requests += 1
+                if not server.max_rate:
+                    return False
+                now = time.monotonic()
+                while server._recent and server._recent[0] < now - 1:
+                    server._recent.popleft()
+                if len(server._recent) >= server.max_rate:
+                    server.throttled += 1
+                    return True
+                server._recent.append(now)
+                return False
+
+        class MockEAKHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real site
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                if over_rate():
+                    self.send_response(429)
+                    self.send_header('Retry-After', str(server.retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                path = self.path.split('?')[0]
+                if path not in server.site.files:
+                    self.send_error(404)
+                    return
+                body, content_type = server.site.files[path]
+                etag = server._etags[path]
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                status = 200
+                byte_range = self.headers.get('Range', '')
+                if byte_range.startswith('bytes='):
+                    first, _, last = byte_range[6:].partition('-')
+                    first, last = int(first or 0), min(int(last or len(body) - 1), len(body) - 1)
+                    content_range = f"bytes {first}-{last}/{len(body)}"
+                    body, status = body[first:last + 1], 206
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                if status == 206:
+                    self.send_header('Content-Range', content_range)
+                self.end_headers()
+                self._send_body(body)
+
+            def _send_body(self, body):
+                if not server.bandwidth:
+                    self.wfile.write(body)
+                    return
+                # chunks of 1/20 s at the bandwidth
+                chunk_size = max(1024, server.bandwidth // 20)
+                for start in range(0, len(body), chunk_size):
+                    self.wfile.write(body[start:start + chunk_size])
+                    time.sleep(min(chunk_size, len(body) - start) / server.bandwidth)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MockEAKHandler
+
+    def start(self):
+        """
+        Starts the server in a daemon thread.
+
+        Returns:
+            str: The base URL of the site.
+        """
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.site.base_url
+
+    def stop(self):
+        """
+        Stops the server.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class MockSiteTransport(HTTPTransport):
+    """
+    An HTTPTransport that sends the requests for the real EAK host to the mock site,
+    e.g. for the image URLs the ContentAnalyzer builds with https://www.eak.admin.ch.
+    """
+
+    def __init__(self, base_url, **kwargs):
+        self.base_url = base_url
+        super().__init__(**kwargs)
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        if url.startswith(EAK_BASE_URL):
+            url = self.base_url + url[len(EAK_BASE_URL):]
+        return super().get(url, headers=headers, stream=stream, timeout=timeout)
+
+
+# Example usage: serves a mock site until Ctrl+C
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--pages", type=int, default=2000)
+    argument_parser.add_argument("--latency-ms", type=float, default=0.0)
+    argument_parser.add_argument("--bandwidth-kbps", type=int, default=0, help="Kilobytes per second per response, 0 is unlimited.")
+    argument_parser.add_argument("--port", type=int, default=8000)
+    argument_parser.add_argument("--max-rate", type=float, default=0, help="Requests per second before 429 responses, 0 is unlimited.")
+    argument_parser.add_argument("--crawl-delay", type=float, default=0, help="Crawl-delay of robots.txt, 0 for none.")
+    args = argument_parser.parse_args()
+
+    server = MockEAKServer(args.pages, latency=args.latency_ms / 1000, bandwidth=args.bandwidth_kbps * 1024 or None, port=args.port,
+                           max_rate=args.max_rate or None, crawl_delay=args.crawl_delay or None)
+    print(f"Serving {len(server.site.files)} files, sitemap: {server.start()}/eak/de/home.sitemap.xml")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()